@@ -3,214 +3,704 @@ KisanBazaar - Direct Farmer to Consumer Marketplace
 MVP Flask Application with Multi-language, Cart, and Order Management
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, Response, make_response, render_template, stream_template, request, redirect, url_for, session, flash, jsonify, g, abort, has_request_context
+import base64
+import click
+import collections
+import csv
+import gzip
+import io
+import json
+import logging
+import logging.handlers
+import math
+import os
+import queue
+import re
 import sqlite3
-from datetime import datetime
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime, timedelta, timezone
 from functools import wraps
 
+try:
+    import orjson
+except ImportError:  # optional faster JSON encoder; jsonify is used without it
+    orjson = None
+
+try:
+    import numpy
+except ImportError:  # price analytics fall back to pure Python
+    numpy = None
+
 app = Flask(__name__)
 app.secret_key = 'kisanbazaar_secret_key_2024'
+app.config.setdefault('DATABASE', 'kisanbazaar.db')
+app.config.setdefault('DB_POOL_SIZE', 8)
+app.config.setdefault('DB_POOL_TIMEOUT', 10.0)
+app.config.setdefault('MSP_CACHE_TTL', 60)
+app.config.setdefault('PAGE_SIZE', 50)
+app.config.setdefault('MAX_PAGE_SIZE', 200)
+app.config.setdefault('EVENT_BUFFER_SIZE', 1000)
+app.config.setdefault('EVENT_HEARTBEAT', 15)
+app.config.setdefault('EVENT_STREAM_TIMEOUT', 300)
+app.config.setdefault('IMPORT_MAX_ROWS', 10000)
+app.config.setdefault('IMPORT_CHUNK_SIZE', 500)
+app.config.setdefault('PAGE_CACHE_SIZE', 256)
+app.config.setdefault('SLOW_QUERY_MS', None)            # e.g. 50 to log statements slower than 50 ms
+app.config.setdefault('SLOW_QUERY_LOG_FILE', None)
+app.config.setdefault('SLOW_QUERY_BUFFER_SIZE', 200)
+app.config.setdefault('ANALYTICS_TTL', 60)
+app.config.setdefault('MAX_SEARCH_RADIUS_KM', 500)
+app.config.setdefault('ARCHIVE_AFTER_DAYS', 180)        # Delivered/Rejected orders older than this move to orders_archive
+app.config.setdefault('ARCHIVE_BATCH_SIZE', 500)
+app.config.setdefault('ARCHIVE_BATCH_PAUSE', 0.05)      # seconds between batches, so other writers get the lock
+app.config.setdefault('STREAM_TEMPLATES', False)        # stream large HTML pages by default, not just with ?stream=1
 
 # ==================== TRANSLATIONS ====================
 
-TRANSLATIONS = {
-    'en': {
-        'app_name': 'KisanBazaar',
-        'home': 'Home',
-        'marketplace': 'Marketplace',
-        'msp_rates': 'MSP Rates',
-        'govt_schemes': 'Govt Schemes',
-        'dashboard': 'Dashboard',
-        'logout': 'Logout',
-        'farmer_login': 'Farmer Login',
-        'customer_login': 'Customer Login',
-        'welcome': 'Welcome',
-        'connecting_farmers': 'Connecting Farmers Directly to Consumers',
-        'tagline': 'Empowering Indian agriculture with fair pricing, MSP transparency, and zero middlemen',
-        'browse_marketplace': 'Browse Marketplace',
-        'no_middlemen': 'No Middlemen',
-        'msp_transparency': 'MSP Transparency',
-        'fair_pricing': 'Fair Pricing',
-        'add_to_cart': 'Add to Cart',
-        'view_cart': 'View Cart',
-        'place_order': 'Place Order',
-        'order_status': 'Order Status',
-        'pending': 'Pending',
-        'accepted': 'Accepted',
-        'rejected': 'Rejected',
-        'delivered': 'Delivered',
-        'accept': 'Accept',
-        'reject': 'Reject',
-        'my_orders': 'My Orders',
-        'track_orders': 'Track Orders',
-        'farmer_details': 'Farmer Details',
-        'location': 'Location',
-        'phone': 'Phone',
-        'cart': 'Cart',
-        'total': 'Total',
-        'checkout': 'Checkout',
-        'above_msp': 'Above MSP',
-        'below_msp': 'Below MSP',
-        'available': 'Available',
-        'price_per_kg': 'Price per kg',
-        'quantity': 'Quantity',
-        'register': 'Register',
-        'login': 'Login',
-        'name': 'Name',
-        'password': 'Password',
-        'email': 'Email',
-        'address': 'Address',
-        'crops_listed': 'Crops Listed',
-        'orders_received': 'Orders Received',
-        'manage_orders': 'Manage Orders',
-        'order_placed': 'Order Placed Successfully!',
-        'order_accepted': 'Order Accepted',
-        'order_rejected': 'Order Rejected',
-        'empty_cart': 'Your cart is empty',
-        'add_crop': 'Add Crop',
-        'crop_name': 'Crop Name',
-        'select_language': 'Select Language'
-    },
-    'hi': {
-        'app_name': 'किसान बाज़ार',
-        'home': 'होम',
-        'marketplace': 'बाज़ार',
-        'msp_rates': 'एमएसपी दरें',
-        'govt_schemes': 'सरकारी योजनाएं',
-        'dashboard': 'डैशबोर्ड',
-        'logout': 'लॉग आउट',
-        'farmer_login': 'किसान लॉगिन',
-        'customer_login': 'ग्राहक लॉगिन',
-        'welcome': 'स्वागत है',
-        'connecting_farmers': 'किसानों को सीधे उपभोक्ताओं से जोड़ना',
-        'tagline': 'उचित मूल्य, एमएसपी पारदर्शिता और शून्य बिचौलियों के साथ भारतीय कृषि को सशक्त बनाना',
-        'browse_marketplace': 'बाज़ार देखें',
-        'no_middlemen': 'कोई बिचौलिया नहीं',
-        'msp_transparency': 'एमएसपी पारदर्शिता',
-        'fair_pricing': 'उचित मूल्य',
-        'add_to_cart': 'कार्ट में जोड़ें',
-        'view_cart': 'कार्ट देखें',
-        'place_order': 'ऑर्डर करें',
-        'order_status': 'ऑर्डर स्थिति',
-        'pending': 'लंबित',
-        'accepted': 'स्वीकृत',
-        'rejected': 'अस्वीकृत',
-        'delivered': 'वितरित',
-        'accept': 'स्वीकार करें',
-        'reject': 'अस्वीकार करें',
-        'my_orders': 'मेरे ऑर्डर',
-        'track_orders': 'ऑर्डर ट्रैक करें',
-        'farmer_details': 'किसान विवरण',
-        'location': 'स्थान',
-        'phone': 'फोन',
-        'cart': 'कार्ट',
-        'total': 'कुल',
-        'checkout': 'चेकआउट',
-        'above_msp': 'एमएसपी से ऊपर',
-        'below_msp': 'एमएसपी से नीचे',
-        'available': 'उपलब्ध',
-        'price_per_kg': 'प्रति किलो कीमत',
-        'quantity': 'मात्रा',
-        'register': 'रजिस्टर करें',
-        'login': 'लॉगिन',
-        'name': 'नाम',
-        'password': 'पासवर्ड',
-        'email': 'ईमेल',
-        'address': 'पता',
-        'crops_listed': 'सूचीबद्ध फसलें',
-        'orders_received': 'प्राप्त ऑर्डर',
-        'manage_orders': 'ऑर्डर प्रबंधन',
-        'order_placed': 'ऑर्डर सफलतापूर्वक दिया गया!',
-        'order_accepted': 'ऑर्डर स्वीकृत',
-        'order_rejected': 'ऑर्डर अस्वीकृत',
-        'empty_cart': 'आपका कार्ट खाली है',
-        'add_crop': 'फसल जोड़ें',
-        'crop_name': 'फसल का नाम',
-        'select_language': 'भाषा चुनें'
-    },
-    'te': {
-        'app_name': 'కిసాన్ బజార్',
-        'home': 'హోమ్',
-        'marketplace': 'మార్కెట్',
-        'msp_rates': 'MSP రేట్లు',
-        'govt_schemes': 'ప్రభుత్వ పథకాలు',
-        'dashboard': 'డాష్‌బోర్డ్',
-        'logout': 'లాగ్ అవుట్',
-        'farmer_login': 'రైతు లాగిన్',
-        'customer_login': 'కస్టమర్ లాగిన్',
-        'welcome': 'స్వాగతం',
-        'connecting_farmers': 'రైతులను నేరుగా వినియోగదారులతో అనుసంధానం చేయడం',
-        'tagline': 'న్యాయమైన ధర, MSP పారదర్శకత మరియు సున్నా దళారులతో భారతీయ వ్యవసాయాన్ని శక్తివంతం చేయడం',
-        'browse_marketplace': 'మార్కెట్ చూడండి',
-        'no_middlemen': 'దళారులు లేరు',
-        'msp_transparency': 'MSP పారదర్శకత',
-        'fair_pricing': 'న్యాయమైన ధర',
-        'add_to_cart': 'కార్ట్‌కి జోడించు',
-        'view_cart': 'కార్ట్ చూడండి',
-        'place_order': 'ఆర్డర్ చేయండి',
-        'order_status': 'ఆర్డర్ స్థితి',
-        'pending': 'పెండింగ్',
-        'accepted': 'ఆమోదించబడింది',
-        'rejected': 'తిరస్కరించబడింది',
-        'delivered': 'డెలివరీ అయింది',
-        'accept': 'ఆమోదించు',
-        'reject': 'తిరస్కరించు',
-        'my_orders': 'నా ఆర్డర్లు',
-        'track_orders': 'ఆర్డర్లను ట్రాక్ చేయండి',
-        'farmer_details': 'రైతు వివరాలు',
-        'location': 'స్థానం',
-        'phone': 'ఫోన్',
-        'cart': 'కార్ట్',
-        'total': 'మొత్తం',
-        'checkout': 'చెక్అవుట్',
-        'above_msp': 'MSP పైన',
-        'below_msp': 'MSP క్రింద',
-        'available': 'అందుబాటులో ఉంది',
-        'price_per_kg': 'కిలోకు ధర',
-        'quantity': 'పరిమాణం',
-        'register': 'రిజిస్టర్',
-        'login': 'లాగిన్',
-        'name': 'పేరు',
-        'password': 'పాస్‌వర్డ్',
-        'email': 'ఇమెయిల్',
-        'address': 'చిరునామా',
-        'crops_listed': 'జాబితా చేసిన పంటలు',
-        'orders_received': 'అందుకున్న ఆర్డర్లు',
-        'manage_orders': 'ఆర్డర్ల నిర్వహణ',
-        'order_placed': 'ఆర్డర్ విజయవంతంగా ఇవ్వబడింది!',
-        'order_accepted': 'ఆర్డర్ ఆమోదించబడింది',
-        'order_rejected': 'ఆర్డర్ తిరస్కరించబడింది',
-        'empty_cart': 'మీ కార్ట్ ఖాళీగా ఉంది',
-        'add_crop': 'పంట జోడించు',
-        'crop_name': 'పంట పేరు',
-        'select_language': 'భాష ఎంచుకోండి'
-    }
-}
+# One <lang>.json catalog per language in translations/. Catalogs are merged
+# over English once at startup, so a template lookup is a single dict access.
+# To add a language, drop in a new file - missing keys fall back to English.
+TRANSLATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'translations')
+DEFAULT_LANGUAGE = 'en'
+
+class Catalog(dict):
+    """Flat key -> text mapping for one language; unknown keys render as the key itself"""
+
+    def __missing__(self, key):
+        return key
+
+def load_translations(directory=TRANSLATIONS_DIR):
+    messages = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename), encoding='utf-8') as f:
+                messages[filename[:-len('.json')]] = json.load(f)
+    fallback = messages[DEFAULT_LANGUAGE]
+    return {lang: Catalog({**fallback, **catalog}) for lang, catalog in messages.items()}
+
+TRANSLATIONS = load_translations()
+
+def get_catalog(lang):
+    return TRANSLATIONS.get(lang) or TRANSLATIONS[DEFAULT_LANGUAGE]
 
 def get_translation(key):
     """Get translation for current language"""
-    lang = session.get('language', 'en')
-    return TRANSLATIONS.get(lang, TRANSLATIONS['en']).get(key, key)
+    return get_catalog(session.get('language', DEFAULT_LANGUAGE))[key]
 
 @app.context_processor
 def inject_translations():
+    # Resolve the catalog once per render; t() is then a bound dict lookup
+    lang = session.get('language', DEFAULT_LANGUAGE)
     return {
-        't': get_translation,
-        'current_lang': session.get('language', 'en')
+        't': get_catalog(lang).__getitem__,
+        'current_lang': lang
     }
 
+# ==================== METRICS ====================
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+class Metrics:
+    """In-process counters and histograms rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = collections.Counter()        # (endpoint, method, status) -> count
+            self.latency = {}                            # endpoint -> Histogram of seconds
+            self.statements = {}                         # endpoint -> Histogram of statements per request
+            self.sql_seconds = collections.Counter()     # endpoint -> seconds spent in SQLite
+
+    def observe_request(self, endpoint, method, status, seconds, statements, sql_seconds):
+        with self._lock:
+            self.requests[endpoint, method, status] += 1
+            self.latency.setdefault(endpoint, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.statements.setdefault(endpoint, Histogram(STATEMENT_BUCKETS)).observe(statements)
+            self.sql_seconds[endpoint] += sql_seconds
+
+    def render(self):
+        lines = []
+        def histogram(name, help_text, histograms):
+            lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} histogram'])
+            for endpoint, hist in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="+Inf"}} {hist.total}')
+                lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {hist.sum:.6f}')
+                lines.append(f'{name}_count{{endpoint="{endpoint}"}} {hist.total}')
+        with self._lock:
+            lines.extend(['# HELP kisanbazaar_http_requests_total Requests handled, by route and status.',
+                          '# TYPE kisanbazaar_http_requests_total counter'])
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f'kisanbazaar_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+            histogram('kisanbazaar_http_request_duration_seconds', 'Time to build the response, by route.', self.latency)
+            histogram('kisanbazaar_sql_statements_per_request', 'SQLite statements run per request, by route.',
+                      self.statements)
+            lines.extend(['# HELP kisanbazaar_sql_duration_seconds_total Time spent executing SQLite statements, by route.',
+                          '# TYPE kisanbazaar_sql_duration_seconds_total counter'])
+            for endpoint, seconds in sorted(self.sql_seconds.items()):
+                lines.append(f'kisanbazaar_sql_duration_seconds_total{{endpoint="{endpoint}"}} {seconds:.6f}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that charges each statement's execution time to the current request"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record_statement(self.connection, sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            # Only a list of rows can be looked at again to explain the statement
+            first = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else None
+            record_statement(self.connection, sql, first, time.perf_counter() - started)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, and execute shortcuts, are all timed"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts bypass the cursor's Python-level execute, so route them through it
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def record_statement(conn, sql, parameters, seconds):
+    if has_request_context():
+        g.sql_statements = g.get('sql_statements', 0) + 1
+        g.sql_seconds = g.get('sql_seconds', 0.0) + seconds
+    threshold = app.config['SLOW_QUERY_MS']
+    if threshold is not None and seconds * 1000 >= threshold:
+        slow_query_log.record(conn, sql, parameters, seconds)
+
+def redact(value):
+    """Keep numbers (ids, quantities) but hide the text a parameter may carry, such as phones or passwords"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return f'<{type(value).__name__}:{len(value)}>' if hasattr(value, '__len__') else f'<{type(value).__name__}>'
+
+class SlowQueryLog:
+    """Statements slower than SLOW_QUERY_MS, with their query plans.
+
+    Entries go to an in-memory ring buffer (see /debug/slow-queries) and, when
+    SLOW_QUERY_LOG_FILE is set, to a rotating JSON-lines log.
+    """
+
+    # Statements EXPLAIN QUERY PLAN has nothing to say about
+    UNPLANNED = ('EXPLAIN', 'PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'CREATE', 'DROP', 'ANALYZE')
+
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._entries = collections.deque(maxlen=size)
+        self._logger = logging.getLogger('kisanbazaar.slow_queries')
+        self._logger.propagate = False
+        self._log_file = None
+
+    def _file_logger(self):
+        path = app.config['SLOW_QUERY_LOG_FILE']
+        if path != self._log_file:
+            for handler in list(self._logger.handlers):
+                self._logger.removeHandler(handler)
+                handler.close()
+            if path:
+                self._logger.addHandler(logging.handlers.RotatingFileHandler(path, maxBytes=5 * 1024 * 1024,
+                                                                             backupCount=3, encoding='utf-8'))
+                self._logger.setLevel(logging.INFO)
+            self._log_file = path
+        return self._logger if path else None
+
+    def record(self, conn, sql, parameters, seconds):
+        sql = ' '.join(sql.split())
+        plan = []
+        if not sql.upper().startswith(self.UNPLANNED):
+            try:
+                # A plain cursor, so explaining is neither timed nor logged itself
+                plan = [row[3] for row in sqlite3.Connection.cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql,
+                                                                                   parameters or ())]
+            except (sqlite3.Error, ValueError):
+                pass
+        if isinstance(parameters, dict):
+            parameters = {name: redact(value) for name, value in parameters.items()}
+        else:
+            parameters = [redact(value) for value in parameters or ()]
+        entry = {
+            'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'endpoint': request.endpoint if has_request_context() else None,
+            'duration_ms': round(seconds * 1000, 3),
+            'sql': sql,
+            'parameters': parameters,
+            'plan': plan,
+            'full_scan': any(re.match(r'SCAN \w+$', detail) for detail in plan),
+        }
+        with self._lock:
+            self._entries.append(entry)
+            logger = self._file_logger()
+        if logger is not None:
+            logger.info(json.dumps(entry))
+
+    def entries(self, min_ms=0, endpoint=None, full_scan=None):
+        """Buffered entries, newest first, optionally filtered"""
+        with self._lock:
+            entries = list(self._entries)
+        return [entry for entry in reversed(entries)
+                if entry['duration_ms'] >= min_ms
+                and (endpoint is None or entry['endpoint'] == endpoint)
+                and (full_scan is None or entry['full_scan'] == full_scan)]
+
+    def clear(self):
+        """Drop buffered entries and close the log file; it is reopened by the next slow statement"""
+        with self._lock:
+            self._entries.clear()
+            for handler in list(self._logger.handlers):
+                self._logger.removeHandler(handler)
+                handler.close()
+            self._log_file = None
+
+slow_query_log = SlowQueryLog(app.config['SLOW_QUERY_BUFFER_SIZE'])
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe_request(request.endpoint or 'unmatched', request.method, response.status_code,
+                                time.perf_counter() - started, g.get('sql_statements', 0), g.get('sql_seconds', 0.0))
+    return response
+
 # ==================== DATABASE SETUP ====================
 
-def get_db():
-    conn = sqlite3.connect('kisanbazaar.db')
+# Applied to every connection handed out by the pool. WAL lets marketplace
+# readers run while a checkout is writing; synchronous=NORMAL is durable in WAL mode.
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),        # ~16 MB page cache per connection
+    ('mmap_size', 134217728),      # 128 MB memory-mapped I/O
+    ('temp_store', 'MEMORY'),
+    ('busy_timeout', 5000),        # wait up to 5s for a competing writer
+)
+
+def connect_db(database):
+    """Open a tuned SQLite connection that may be shared across threads"""
+    conn = sqlite3.connect(database, check_same_thread=False, factory=InstrumentedConnection)
     conn.row_factory = sqlite3.Row
+    conn.create_function('distance_km', 4, haversine_km, deterministic=True)
+    for pragma, value in SQLITE_PRAGMAS:
+        conn.execute(f'PRAGMA {pragma} = {value}')
     return conn
 
+class ConnectionPool:
+    """Bounded, thread-safe pool of SQLite connections to one database file"""
+
+    def __init__(self, database, max_size=8, timeout=10.0):
+        self.database = database
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RuntimeError(f'Timed out waiting for a connection to {self.database}')
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return connect_db(self.database)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool():
+    """Return the connection pool for the configured database, creating it on first use"""
+    database = app.config['DATABASE']
+    pool = _pools.get(database)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(database)
+            if pool is None:
+                pool = ConnectionPool(database, app.config['DB_POOL_SIZE'], app.config['DB_POOL_TIMEOUT'])
+                _pools[database] = pool
+    return pool
+
+def close_db_pool():
+    """Close all idle pooled connections (used when the database file is replaced)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+        _search_index_enabled.clear()
+    msp_cache.invalidate()
+    price_analytics.invalidate()
+    page_cache.clear()
+    for pool in pools:
+        pool.close()
+
+def get_db():
+    """Return the connection bound to the current app context, checking one out of the pool if needed"""
+    if 'db' not in g:
+        g.db = get_pool().acquire()
+        g.db_pool = get_pool()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exception=None):
+    conn = g.pop('db', None)
+    pool = g.pop('db_pool', None)
+    if conn is not None:
+        pool.release(conn)
+
+def seed_reference_data(conn):
+    """Insert the MSP rates, government schemes and pincode coordinates if they are missing"""
+    cursor = conn.cursor()
+    
+    # MSP prices per kg (converted from per quintal rates for 2025-26)
+    msp_data = [
+        ('Rice', 24), ('Wheat', 23), ('Maize', 21), ('Jowar', 32),
+        ('Bajra', 25), ('Ragi', 38), ('Tur (Arhar)', 72), ('Moong', 85),
+        ('Urad', 70), ('Groundnut', 64), ('Soyabean', 46), ('Sunflower', 68),
+        ('Cotton', 66), ('Sugarcane', 4), ('Potato', 15), ('Onion', 18), ('Tomato', 20)
+    ]
+    
+    for crop, price in msp_data:
+        cursor.execute('INSERT OR IGNORE INTO msp (crop_name, msp_price) VALUES (?, ?)', (crop, price))
+    
+    schemes_data = [
+        ('PM-KISAN', 'Small and marginal farmers with landholding up to 2 hectares',
+         '₹6,000 per year in three installments', 'Pradhan Mantri Kisan Samman Nidhi provides income support to farmers.'),
+        ('PMFBY', 'All farmers including sharecroppers and tenant farmers',
+         'Crop insurance with low premium (2% for Kharif, 1.5% for Rabi)', 'Pradhan Mantri Fasal Bima Yojana provides crop insurance coverage.'),
+        ('Soil Health Card', 'All farmers across India',
+         'Free soil testing and recommendations for fertilizers', 'Provides information on soil health and nutrient status.'),
+        ('Kisan Credit Card', 'Farmers, fishermen, and animal husbandry farmers',
+         'Easy credit up to ₹3 lakh at 4% interest rate', 'Provides affordable credit for agricultural needs.'),
+        ('e-NAM', 'Farmers, traders, and buyers',
+         'Online trading platform with transparent pricing', 'National Agriculture Market for online trading of agricultural commodities.'),
+        ('PM Krishi Sinchai Yojana', 'All farmers with focus on water-stressed areas',
+         'Subsidies for micro-irrigation up to 55-90%', 'Ensures access to irrigation - "Har Khet Ko Paani".')
+    ]
+    
+    for name, eligibility, benefits, description in schemes_data:
+        cursor.execute('''
+            INSERT OR IGNORE INTO schemes (name, eligibility, benefits, description) 
+            SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM schemes WHERE name = ?)
+        ''', (name, eligibility, benefits, description, name))
+    
+    load_pincodes(conn)
+
 def init_db():
-    conn = get_db()
+    conn = connect_db(app.config['DATABASE'])
+    migrate(conn)
     cursor = conn.cursor()
     
+    seed_reference_data(conn)
+    
+    demo_farmers = [
+        ('Rajesh Kumar', 'farmer123', 'Punjab', '9876543210', 'Village Khanna, Near Gurudwara', 'Ludhiana', 'Punjab', '141401'),
+        ('Suresh Patel', 'farmer123', 'Gujarat', '9876543211', 'Farm House, Anand Road', 'Ahmedabad', 'Gujarat', '380001'),
+        ('Lakshmi Devi', 'farmer123', 'Maharashtra', '9876543212', 'Krishi Nagar, Nashik Highway', 'Nashik', 'Maharashtra', '422001')
+    ]
+    
+    for name, password, location, phone, address, district, state, pincode in demo_farmers:
+        cursor.execute('''
+            INSERT OR IGNORE INTO farmers (name, password, location, phone, address, district, state, pincode) 
+            SELECT ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM farmers WHERE name = ?)
+        ''', (name, password, location, phone, address, district, state, pincode, name))
+    
     cursor.execute('''
+        INSERT OR IGNORE INTO customers (name, email, password, phone, address, city, state, pincode) 
+        SELECT ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM customers WHERE email = ?)
+    ''', ('Demo Customer', 'demo@example.com', 'customer123', '9988776655', '123 Main Street', 'Hyderabad', 'Telangana', '500001', 'demo@example.com'))
+    
+    cursor.execute('SELECT id FROM farmers WHERE name = ?', ('Rajesh Kumar',))
+    farmer = cursor.fetchone()
+    if farmer:
+        demo_crops = [
+            (farmer['id'], 'Rice', 500, 2200, 'Punjab', 2183, 'Above MSP'),
+            (farmer['id'], 'Wheat', 300, 2300, 'Punjab', 2275, 'Above MSP'),
+        ]
+        for crop in demo_crops:
+            cursor.execute('''
+                INSERT OR IGNORE INTO crops (farmer_id, crop_name, quantity, price, location, msp_price, msp_status)
+                SELECT ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM crops WHERE farmer_id = ? AND crop_name = ?)
+            ''', (*crop, crop[0], crop[1]))
+    
+    conn.commit()
+    conn.close()
+
+# ==================== SEARCH INDEX ====================
+
+# Marketplace search runs against this FTS5 table instead of LIKE-scanning crops.
+# rowid mirrors crops.id; the farmer's district and state are copied in so a
+# location search also matches listings by district or state.
+SEARCH_INDEX_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS crops_fts USING fts5(
+        crop_name, location, district, state,
+        prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS crops_fts_after_insert AFTER INSERT ON crops BEGIN
+        INSERT INTO crops_fts (rowid, crop_name, location, district, state)
+        VALUES (new.id, new.crop_name, new.location,
+                (SELECT district FROM farmers WHERE id = new.farmer_id),
+                (SELECT state FROM farmers WHERE id = new.farmer_id));
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS crops_fts_after_update AFTER UPDATE OF crop_name, location, farmer_id ON crops BEGIN
+        UPDATE crops_fts SET crop_name = new.crop_name, location = new.location,
+               district = (SELECT district FROM farmers WHERE id = new.farmer_id),
+               state = (SELECT state FROM farmers WHERE id = new.farmer_id)
+        WHERE rowid = new.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS crops_fts_after_delete AFTER DELETE ON crops BEGIN
+        DELETE FROM crops_fts WHERE rowid = old.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS crops_fts_farmer_update AFTER UPDATE OF district, state ON farmers BEGIN
+        UPDATE crops_fts SET district = new.district, state = new.state
+        WHERE rowid IN (SELECT id FROM crops WHERE farmer_id = new.id);
+    END
+    ''',
+]
+
+_search_index_enabled = {}
+
+def fts5_supported(conn):
+    """Check whether this SQLite build ships the FTS5 extension"""
+    try:
+        conn.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+        conn.execute('DROP TABLE temp.fts5_probe')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def init_search_index(conn):
+    """Create the crops_fts index and its sync triggers, backfilling existing listings"""
+    if not fts5_supported(conn):
+        return False
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'crops_fts'").fetchone()
+    for statement in SEARCH_INDEX_SCHEMA:
+        conn.execute(statement)
+    if not exists:
+        rebuild_search_index(conn)
+    return True
+
+def rebuild_search_index(conn):
+    conn.execute('DELETE FROM crops_fts')
+    conn.execute('''INSERT INTO crops_fts (rowid, crop_name, location, district, state)
+                    SELECT c.id, c.crop_name, c.location, f.district, f.state
+                    FROM crops c LEFT JOIN farmers f ON c.farmer_id = f.id''')
+
+def search_index_enabled(conn):
+    """Whether the configured database has a crops_fts index (checked once per database)"""
+    database = app.config['DATABASE']
+    enabled = _search_index_enabled.get(database)
+    if enabled is None:
+        enabled = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'crops_fts'").fetchone() is not None
+        _search_index_enabled[database] = enabled
+    return enabled
+
+def fts_prefix_query(text):
+    """Turn free text into an FTS5 expression where every word is a quoted prefix term"""
+    terms = ['"{}"*'.format(word.replace('"', '""')) for word in text.split()]
+    return ' '.join(terms)
+
+def marketplace_search_match(crop_filter, location_filter):
+    """Build the MATCH expression for the marketplace crop and location filters"""
+    clauses = []
+    if crop_filter.strip():
+        clauses.append(f'crop_name : ({fts_prefix_query(crop_filter)})')
+    if location_filter.strip():
+        clauses.append(f'{{location district state}} : ({fts_prefix_query(location_filter)})')
+    return ' AND '.join(clauses)
+
+# ==================== PROXIMITY SEARCH ====================
+
+# Coordinates per 6-digit pincode, or per 3-digit sorting district when the exact code is unknown
+PINCODES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'pincodes.csv')
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+
+def rtree_supported(conn):
+    """Check whether this SQLite build ships the R*Tree module"""
+    try:
+        conn.execute('CREATE VIRTUAL TABLE temp.rtree_probe USING rtree(id, x0, x1)')
+        conn.execute('DROP TABLE temp.rtree_probe')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+# Coordinates of a farmer's pincode, preferring an exact match over the 3-digit prefix
+FARMER_COORDINATES = '''SELECT p.latitude, p.longitude FROM farmers f
+                        JOIN pincodes p ON p.pincode IN (f.pincode, substr(f.pincode, 1, 3))
+                        WHERE f.id = {farmer_id} ORDER BY length(p.pincode) DESC LIMIT 1'''
+
+def init_geo_index(conn):
+    """Create the crops_geo R*Tree of listing coordinates and the triggers that maintain it"""
+    if not rtree_supported(conn):
+        return False
+    exists = geo_index_enabled(conn)
+    conn.execute('CREATE VIRTUAL TABLE IF NOT EXISTS crops_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon)')
+    insert = f'''INSERT OR REPLACE INTO crops_geo (id, min_lat, max_lat, min_lon, max_lon)
+                 SELECT {{crop_id}}, latitude, latitude, longitude, longitude FROM ({FARMER_COORDINATES});'''
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS crops_geo_after_insert AFTER INSERT ON crops BEGIN
+                         {insert.format(crop_id='new.id', farmer_id='new.farmer_id')}
+                     END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS crops_geo_after_delete AFTER DELETE ON crops BEGIN
+                        DELETE FROM crops_geo WHERE id = old.id;
+                    END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS crops_geo_after_move AFTER UPDATE OF farmer_id ON crops BEGIN
+                         DELETE FROM crops_geo WHERE id = old.id;
+                         {insert.format(crop_id='new.id', farmer_id='new.farmer_id')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS farmers_geo_after_pincode AFTER UPDATE OF pincode ON farmers BEGIN
+                         DELETE FROM crops_geo WHERE id IN (SELECT id FROM crops WHERE farmer_id = new.id);
+                         INSERT INTO crops_geo (id, min_lat, max_lat, min_lon, max_lon)
+                             SELECT c.id, p.latitude, p.latitude, p.longitude, p.longitude
+                             FROM crops c, ({FARMER_COORDINATES.format(farmer_id='new.id')}) p
+                             WHERE c.farmer_id = new.id;
+                     END''')
+    if not exists:
+        rebuild_geo_index(conn)
+    return True
+
+def rebuild_geo_index(conn):
+    """Recompute every listing's coordinates, e.g. after loading more pincodes"""
+    conn.execute('DELETE FROM crops_geo')
+    conn.execute(f'''INSERT INTO crops_geo (id, min_lat, max_lat, min_lon, max_lon)
+                     SELECT c.id, p.latitude, p.latitude, p.longitude, p.longitude
+                     FROM crops c JOIN farmers f ON c.farmer_id = f.id
+                     JOIN pincodes p ON p.pincode = (SELECT pincode FROM pincodes
+                                                     WHERE pincode IN (f.pincode, substr(f.pincode, 1, 3))
+                                                     ORDER BY length(pincode) DESC LIMIT 1)''')
+
+def geo_index_enabled(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'crops_geo'").fetchone() is not None
+
+def load_pincodes(conn, path=PINCODES_FILE):
+    """Add the pincode coordinates from a CSV file, re-indexing listings if any were new"""
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding='utf-8', newline='') as f:
+        rows = [(row['pincode'].strip(), float(row['latitude']), float(row['longitude']), row.get('district'),
+                 row.get('state')) for row in csv.DictReader(f)]
+    before = conn.total_changes
+    conn.executemany('''INSERT OR IGNORE INTO pincodes (pincode, latitude, longitude, district, state)
+                        VALUES (?, ?, ?, ?, ?)''', rows)
+    added = conn.total_changes - before
+    if added and geo_index_enabled(conn):
+        rebuild_geo_index(conn)
+    return added
+
+def resolve_pincode(conn, pincode):
+    """(latitude, longitude) for a pincode, falling back to its 3-digit prefix; None if unknown"""
+    pincode = str(pincode or '').strip()
+    if not pincode:
+        return None
+    # Two primary-key lookups rather than one query sorting the candidates by length
+    for key in (pincode, pincode[:3]):
+        row = conn.execute('SELECT latitude, longitude FROM pincodes WHERE pincode = ?', (key,)).fetchone()
+        if row:
+            return row['latitude'], row['longitude']
+    return None
+
+def bounding_box(latitude, longitude, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle, for the R*Tree pre-filter"""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    dlon = dlat / max(math.cos(math.radians(latitude)), 0.01)
+    return latitude - dlat, latitude + dlat, longitude - dlon, longitude + dlon
+
+def get_near_args():
+    """(latitude, longitude, radius km) from ?within_km= and ?pincode= (default: the customer's own), or None"""
+    radius = request.args.get('within_km', type=float)
+    if radius is None:
+        return None
+    if not 0 < radius <= app.config['MAX_SEARCH_RADIUS_KM']:
+        abort(400, description=f'within_km must be between 0 and {app.config["MAX_SEARCH_RADIUS_KM"]}')
+    conn = get_db()
+    if not geo_index_enabled(conn):
+        abort(400, description='Proximity search is not available')
+    pincode = request.args.get('pincode')
+    if not pincode and session.get('customer_id'):
+        customer = conn.execute('SELECT pincode FROM customers WHERE id = ?', (session['customer_id'],)).fetchone()
+        pincode = customer['pincode'] if customer else None
+    point = resolve_pincode(conn, pincode)
+    if point is None:
+        abort(400, description='Unknown pincode')
+    return (*point, radius)
+
+# ==================== SCHEMA MIGRATIONS ====================
+
+def migration_base_schema(conn):
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS farmers (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -224,7 +714,7 @@ def init_db():
         )
     ''')
     
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS customers (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -238,7 +728,7 @@ def init_db():
         )
     ''')
     
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS crops (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             farmer_id INTEGER NOT NULL,
@@ -253,7 +743,7 @@ def init_db():
         )
     ''')
     
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS cart (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             customer_id INTEGER NOT NULL,
@@ -265,7 +755,7 @@ def init_db():
         )
     ''')
     
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS orders (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             customer_id INTEGER NOT NULL,
@@ -284,7 +774,7 @@ def init_db():
         )
     ''')
     
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS msp (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             crop_name TEXT NOT NULL UNIQUE,
@@ -292,7 +782,7 @@ def init_db():
         )
     ''')
     
-    cursor.execute('''
+    conn.execute('''
         CREATE TABLE IF NOT EXISTS schemes (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             name TEXT NOT NULL,
@@ -301,79 +791,613 @@ def init_db():
             description TEXT
         )
     ''')
-    
-    # MSP prices per kg (converted from per quintal rates for 2025-26)
-    msp_data = [
-        ('Rice', 24), ('Wheat', 23), ('Maize', 21), ('Jowar', 32),
-        ('Bajra', 25), ('Ragi', 38), ('Tur (Arhar)', 72), ('Moong', 85),
-        ('Urad', 70), ('Groundnut', 64), ('Soyabean', 46), ('Sunflower', 68),
-        ('Cotton', 66), ('Sugarcane', 4), ('Potato', 15), ('Onion', 18), ('Tomato', 20)
+
+def migration_search_index(conn):
+    init_search_index(conn)
+
+def migration_hot_path_indexes(conn):
+    # Fold duplicate cart lines into one row so (customer_id, crop_id) can be unique
+    conn.execute('''UPDATE cart SET quantity = (SELECT SUM(c2.quantity) FROM cart c2
+                                                WHERE c2.customer_id = cart.customer_id AND c2.crop_id = cart.crop_id)
+                    WHERE id IN (SELECT MIN(id) FROM cart GROUP BY customer_id, crop_id HAVING COUNT(*) > 1)''')
+    conn.execute('DELETE FROM cart WHERE id NOT IN (SELECT MIN(id) FROM cart GROUP BY customer_id, crop_id)')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_cart_customer_crop ON cart (customer_id, crop_id)')
+    # Marketplace listing order; partial so sold-out listings stay out of it
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_crops_active_created ON crops (created_at, id) WHERE quantity > 0')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_crops_farmer_created ON crops (farmer_id, created_at)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_farmer_date ON orders (farmer_id, order_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_customer_date ON orders (customer_id, order_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_farmers_name ON farmers (name)')
+    # Covering index: case-insensitive MSP lookups never touch the table
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_msp_lower_name ON msp (LOWER(crop_name), msp_price)')
+
+def version_triggers(table):
+    """SQL for triggers that bump table_versions whenever rows in `table` change"""
+    statements = []
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        statements.append(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_version_after_{event.lower()} AFTER {event} ON {table} BEGIN
+                UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE name = '{table}';
+            END
+        ''')
+    return statements
+
+def migration_table_versions(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO table_versions (name) VALUES ('msp')")
+    for statement in version_triggers('msp'):
+        conn.execute(statement)
+
+def facet_triggers():
+    """Triggers keeping marketplace_facets in step with in-stock crops (quantity > 0)"""
+    def adjust(row, delta):
+        statements = []
+        for column in FACET_TYPES:
+            statements.append(f'''
+            INSERT INTO marketplace_facets (facet_type, value, active_listing_count) VALUES ('{column}', {row}.{column}, {delta})
+                ON CONFLICT (facet_type, value) DO UPDATE SET active_listing_count = active_listing_count + ({delta});''')
+            if delta < 0:
+                statements.append(f'''
+            DELETE FROM marketplace_facets
+                WHERE facet_type = '{column}' AND value = {row}.{column} AND active_listing_count <= 0;''')
+        return ''.join(statements)
+    # A stock change that leaves a listing in stock under the same name and location is a no-op
+    unchanged = 'new.crop_name IS old.crop_name AND new.location IS old.location'
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS facets_after_insert AFTER INSERT ON crops WHEN new.quantity > 0 BEGIN{adjust('new', 1)}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS facets_after_delete AFTER DELETE ON crops WHEN old.quantity > 0 BEGIN{adjust('old', -1)}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS facets_after_update_old AFTER UPDATE OF quantity, crop_name, location ON crops
+            WHEN old.quantity > 0 AND NOT (new.quantity > 0 AND {unchanged}) BEGIN{adjust('old', -1)}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS facets_after_update_new AFTER UPDATE OF quantity, crop_name, location ON crops
+            WHEN new.quantity > 0 AND NOT (old.quantity > 0 AND {unchanged}) BEGIN{adjust('new', 1)}
+        END''',
     ]
-    
-    for crop, price in msp_data:
-        cursor.execute('INSERT OR IGNORE INTO msp (crop_name, msp_price) VALUES (?, ?)', (crop, price))
-    
-    schemes_data = [
-        ('PM-KISAN', 'Small and marginal farmers with landholding up to 2 hectares',
-         '₹6,000 per year in three installments', 'Pradhan Mantri Kisan Samman Nidhi provides income support to farmers.'),
-        ('PMFBY', 'All farmers including sharecroppers and tenant farmers',
-         'Crop insurance with low premium (2% for Kharif, 1.5% for Rabi)', 'Pradhan Mantri Fasal Bima Yojana provides crop insurance coverage.'),
-        ('Soil Health Card', 'All farmers across India',
-         'Free soil testing and recommendations for fertilizers', 'Provides information on soil health and nutrient status.'),
-        ('Kisan Credit Card', 'Farmers, fishermen, and animal husbandry farmers',
-         'Easy credit up to ₹3 lakh at 4% interest rate', 'Provides affordable credit for agricultural needs.'),
-        ('e-NAM', 'Farmers, traders, and buyers',
-         'Online trading platform with transparent pricing', 'National Agriculture Market for online trading of agricultural commodities.'),
-        ('PM Krishi Sinchai Yojana', 'All farmers with focus on water-stressed areas',
-         'Subsidies for micro-irrigation up to 55-90%', 'Ensures access to irrigation - "Har Khet Ko Paani".')
+
+def migration_marketplace_facets(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS marketplace_facets (
+            facet_type TEXT NOT NULL,
+            value TEXT NOT NULL,
+            active_listing_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (facet_type, value)
+        ) WITHOUT ROWID
+    ''')
+    for statement in facet_triggers():
+        conn.execute(statement)
+    rebuild_facets(conn)
+
+CART_LINE_PRICE = '{row}.quantity * COALESCE((SELECT price FROM crops WHERE id = {row}.crop_id), 0)'
+
+def cart_summary_triggers():
+    """Triggers applying each cart change to cart_summary as a delta"""
+    def add(row):
+        return f'''
+            INSERT INTO cart_summary (customer_id, item_count, total_quantity, total_price, version)
+            VALUES ({row}.customer_id, 1, {row}.quantity, {CART_LINE_PRICE.format(row=row)}, 1)
+            ON CONFLICT (customer_id) DO UPDATE SET item_count = item_count + 1,
+                total_quantity = total_quantity + excluded.total_quantity,
+                total_price = total_price + excluded.total_price,
+                version = version + 1;'''
+    def remove(row):
+        return f'''
+            UPDATE cart_summary SET item_count = item_count - 1,
+                total_quantity = total_quantity - {row}.quantity,
+                total_price = total_price - {CART_LINE_PRICE.format(row=row)},
+                version = version + 1
+            WHERE customer_id = {row}.customer_id;'''
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS cart_summary_after_insert AFTER INSERT ON cart BEGIN{add('new')}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS cart_summary_after_delete AFTER DELETE ON cart BEGIN{remove('old')}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS cart_summary_after_update AFTER UPDATE OF customer_id, crop_id, quantity ON cart BEGIN{remove('old')}{add('new')}
+        END''',
+        # Drop cart lines for a listing before it goes, while its price is still known
+        '''CREATE TRIGGER IF NOT EXISTS cart_lines_before_crop_delete BEFORE DELETE ON crops BEGIN
+            DELETE FROM cart WHERE crop_id = old.id;
+        END''',
     ]
-    
-    for name, eligibility, benefits, description in schemes_data:
-        cursor.execute('''
-            INSERT OR IGNORE INTO schemes (name, eligibility, benefits, description) 
-            SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM schemes WHERE name = ?)
-        ''', (name, eligibility, benefits, description, name))
-    
-    demo_farmers = [
-        ('Rajesh Kumar', 'farmer123', 'Punjab', '9876543210', 'Village Khanna, Near Gurudwara', 'Ludhiana', 'Punjab', '141401'),
-        ('Suresh Patel', 'farmer123', 'Gujarat', '9876543211', 'Farm House, Anand Road', 'Ahmedabad', 'Gujarat', '380001'),
-        ('Lakshmi Devi', 'farmer123', 'Maharashtra', '9876543212', 'Krishi Nagar, Nashik Highway', 'Nashik', 'Maharashtra', '422001')
+
+def migration_cart_summary(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cart_summary (
+            customer_id INTEGER PRIMARY KEY,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            total_quantity INTEGER NOT NULL DEFAULT 0,
+            total_price INTEGER NOT NULL DEFAULT 0,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('DELETE FROM cart WHERE crop_id NOT IN (SELECT id FROM crops)')
+    for statement in cart_summary_triggers():
+        conn.execute(statement)
+    rebuild_cart_summary(conn)
+
+def migration_schemes_version(conn):
+    conn.execute("INSERT OR IGNORE INTO table_versions (name) VALUES ('schemes')")
+    for statement in version_triggers('schemes'):
+        conn.execute(statement)
+
+def crop_price_version_triggers():
+    """Triggers bumping the 'crop_prices' version only when the in-stock price picture changes.
+
+    Stock changes that leave a listing in stock (i.e. most orders) do not count.
+    """
+    bump = "UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE name = 'crop_prices';"
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS crops_prices_after_insert AFTER INSERT ON crops
+            WHEN new.quantity > 0 BEGIN {bump} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS crops_prices_after_delete AFTER DELETE ON crops
+            WHEN old.quantity > 0 BEGIN {bump} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS crops_prices_after_update AFTER UPDATE OF crop_name, price, msp_price, quantity, farmer_id ON crops
+            WHEN (old.quantity > 0) != (new.quantity > 0)
+                OR (new.quantity > 0 AND (new.crop_name IS NOT old.crop_name OR new.price IS NOT old.price
+                                          OR new.msp_price IS NOT old.msp_price OR new.farmer_id IS NOT old.farmer_id))
+            BEGIN {bump} END''',
+        f'''CREATE TRIGGER IF NOT EXISTS farmers_prices_after_update AFTER UPDATE OF state ON farmers
+            WHEN new.state IS NOT old.state BEGIN {bump} END''',
     ]
-    
-    for name, password, location, phone, address, district, state, pincode in demo_farmers:
-        cursor.execute('''
-            INSERT OR IGNORE INTO farmers (name, password, location, phone, address, district, state, pincode) 
-            SELECT ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM farmers WHERE name = ?)
-        ''', (name, password, location, phone, address, district, state, pincode, name))
-    
-    cursor.execute('''
-        INSERT OR IGNORE INTO customers (name, email, password, phone, address, city, state, pincode) 
-        SELECT ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM customers WHERE email = ?)
-    ''', ('Demo Customer', 'demo@example.com', 'customer123', '9988776655', '123 Main Street', 'Hyderabad', 'Telangana', '500001', 'demo@example.com'))
-    
-    cursor.execute('SELECT id FROM farmers WHERE name = ?', ('Rajesh Kumar',))
-    farmer = cursor.fetchone()
-    if farmer:
-        demo_crops = [
-            (farmer['id'], 'Rice', 500, 2200, 'Punjab', 2183, 'Above MSP'),
-            (farmer['id'], 'Wheat', 300, 2300, 'Punjab', 2275, 'Above MSP'),
-        ]
-        for crop in demo_crops:
-            cursor.execute('''
-                INSERT OR IGNORE INTO crops (farmer_id, crop_name, quantity, price, location, msp_price, msp_status)
-                SELECT ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM crops WHERE farmer_id = ? AND crop_name = ?)
-            ''', (*crop, crop[0], crop[1]))
-    
-    conn.commit()
-    conn.close()
+
+def migration_crop_price_version(conn):
+    conn.execute("INSERT OR IGNORE INTO table_versions (name) VALUES ('crop_prices')")
+    for statement in crop_price_version_triggers():
+        conn.execute(statement)
+
+def migration_proximity_search(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS pincodes (
+                        pincode TEXT PRIMARY KEY,
+                        latitude REAL NOT NULL,
+                        longitude REAL NOT NULL,
+                        district TEXT,
+                        state TEXT
+                    ) WITHOUT ROWID''')
+    init_geo_index(conn)
+
+def migration_order_archive(conn):
+    # Same columns as orders, so order lists can UNION ALL the two tables
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS orders_archive (
+            id INTEGER PRIMARY KEY,
+            customer_id INTEGER NOT NULL,
+            crop_id INTEGER NOT NULL,
+            farmer_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            total_price INTEGER NOT NULL,
+            status TEXT,
+            order_date TEXT,
+            status_updated_at TEXT,
+            customer_address TEXT,
+            customer_phone TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_archive_farmer_date ON orders_archive (farmer_id, order_date)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_archive_customer_date ON orders_archive (customer_id, order_date)')
+    # Per-farmer totals of archived orders, so the dashboard summary never reads the archive
+    conn.execute('''CREATE TABLE IF NOT EXISTS orders_archive_totals (
+                        farmer_id INTEGER NOT NULL,
+                        status TEXT NOT NULL,
+                        count INTEGER NOT NULL,
+                        total_price INTEGER NOT NULL,
+                        PRIMARY KEY (farmer_id, status)
+                    ) WITHOUT ROWID''')
+    # Finds the next archival batch without scanning the live orders
+    conn.execute(f'''CREATE INDEX IF NOT EXISTS idx_orders_terminal_age ON orders ({ORDER_AGE})
+                     WHERE status IN {TERMINAL_STATUSES!r}''')
+
+def migration_order_events(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS order_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            farmer_id INTEGER NOT NULL,
+            customer_id INTEGER NOT NULL,
+            crop_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            status TEXT,
+            quantity INTEGER,
+            total_price INTEGER,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_order_events_farmer ON order_events (farmer_id, id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_order_events_customer ON order_events (customer_id, id)')
+    for statement in order_event_triggers():
+        conn.execute(statement)
+
+def crop_change_triggers():
+    """Triggers stamping each crop_changes row with a fresh 'crop_changes' version whenever its listing changes"""
+    bump = "UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE name = 'crop_changes';"
+    current = "(SELECT version FROM table_versions WHERE name = 'crop_changes')"
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS crops_changes_after_insert AFTER INSERT ON crops BEGIN
+                {bump}
+                INSERT INTO crop_changes (crop_id, version, created_version, deleted) VALUES (new.id, {current}, {current}, 0)
+                    ON CONFLICT (crop_id) DO UPDATE SET version = excluded.version,
+                                                        created_version = excluded.created_version, deleted = 0;
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS crops_changes_after_update
+            AFTER UPDATE OF farmer_id, crop_name, quantity, price, location, msp_price, msp_status ON crops BEGIN
+                {bump}
+                UPDATE crop_changes SET version = {current} WHERE crop_id = new.id;
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS crops_changes_after_delete AFTER DELETE ON crops BEGIN
+                {bump}
+                UPDATE crop_changes SET version = {current}, deleted = 1 WHERE crop_id = old.id;
+            END''',
+    ]
+
+def migration_crop_changes(conn):
+    # One row per listing ever seen, deleted ones kept as tombstones so delta clients learn about them
+    conn.execute('''CREATE TABLE IF NOT EXISTS crop_changes (
+                        crop_id INTEGER PRIMARY KEY,
+                        version INTEGER NOT NULL,
+                        created_version INTEGER NOT NULL,
+                        deleted INTEGER NOT NULL DEFAULT 0
+                    )''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_crop_changes_version ON crop_changes (version)')
+    conn.execute("INSERT OR IGNORE INTO table_versions (name) VALUES ('crop_changes')")
+    for statement in crop_change_triggers():
+        conn.execute(statement)
+    rebuild_crop_changes(conn)
+
+def migration_farmer_order_status_index(conn):
+    # Serves the dashboard's per-status order lists and the GROUP BY status summary
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_orders_farmer_status_date ON orders (farmer_id, status, order_date)')
+
+# (version, migration) pairs applied in order; PRAGMA user_version records the last one applied.
+# Never edit a released migration - append a new one instead.
+MIGRATIONS = [
+    (1, migration_base_schema),
+    (2, migration_search_index),
+    (3, migration_hot_path_indexes),
+    (4, migration_table_versions),
+    (5, migration_marketplace_facets),
+    (6, migration_cart_summary),
+    (7, migration_farmer_order_status_index),
+    (8, migration_schemes_version),
+    (9, migration_crop_price_version),
+    (10, migration_proximity_search),
+    (11, migration_order_archive),
+    (12, migration_order_events),
+    (13, migration_crop_changes),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def rebuild_derived_tables(conn):
+    """Recompute every trigger-maintained table from its source rows, e.g. after a bulk load with triggers off"""
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'crops_fts'").fetchone():
+        rebuild_search_index(conn)
+    rebuild_facets(conn)
+    rebuild_cart_summary(conn)
+    if geo_index_enabled(conn):
+        rebuild_geo_index(conn)
+    rebuild_crop_changes(conn)
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn):
+    """Apply pending migrations, each in its own write transaction, and return the schema version"""
+    for version, migration in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another process may have migrated while we waited for the write lock
+            if version > get_schema_version(conn):
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return get_schema_version(conn)
+
+# ==================== MSP PRICES ====================
+
+def get_table_version(conn, table):
+    row = conn.execute('SELECT version FROM table_versions WHERE name = ?', (table,)).fetchone()
+    return row['version'] if row else None
+
+def get_table_stamp(conn, table):
+    """(version, time of the last change as an aware UTC datetime) for a versioned table"""
+    row = conn.execute('SELECT version, updated_at FROM table_versions WHERE name = ?', (table,)).fetchone()
+    if row is None:
+        return None, None
+    return row['version'], datetime.strptime(row['updated_at'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+def normalize_crop_name(crop_name):
+    return ' '.join(str(crop_name).split()).casefold()
+
+class MspCache:
+    """Process-wide copy of the msp table.
+
+    The table version is re-checked at most once per MSP_CACHE_TTL seconds, so
+    lookups in between cost no database round-trip at all.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None   # (database, version, prices by normalized name, rows, last modified)
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _load(self):
+        snapshot = self._snapshot
+        if (snapshot is not None and snapshot[0] == app.config['DATABASE']
+                and time.monotonic() - self._checked_at < app.config['MSP_CACHE_TTL']):
+            return snapshot
+        with self._lock:
+            conn = get_db()
+            version, last_modified = get_table_stamp(conn, 'msp')
+            snapshot = self._snapshot
+            if snapshot is None or snapshot[0] != app.config['DATABASE'] or snapshot[1] != version:
+                rows = [dict(row) for row in conn.execute('SELECT crop_name, msp_price FROM msp ORDER BY crop_name')]
+                prices = {normalize_crop_name(row['crop_name']): row['msp_price'] for row in rows}
+                snapshot = self._snapshot = (app.config['DATABASE'], version, prices, rows, last_modified)
+            self._checked_at = time.monotonic()
+            return snapshot
+
+    def prices(self):
+        return self._load()[2]
+
+    def rows(self):
+        return self._load()[3]
+
+    def stamp(self):
+        """(version, last modified) of the snapshot that prices() and rows() are serving"""
+        snapshot = self._load()
+        return snapshot[1], snapshot[4]
+
+msp_cache = MspCache()
+
+def get_msp_prices(crop_names):
+    """Bulk MSP lookup: maps each given crop name to its MSP per kg (None when unknown)"""
+    prices = msp_cache.prices()
+    return {name: prices.get(normalize_crop_name(name)) for name in crop_names}
 
 def get_msp_price(crop_name):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT msp_price FROM msp WHERE LOWER(crop_name) = LOWER(?)', (crop_name,))
-    result = cursor.fetchone()
-    conn.close()
-    return result['msp_price'] if result else None
+    return msp_cache.prices().get(normalize_crop_name(crop_name))
+
+# ==================== PRICE ANALYTICS ====================
+
+ANALYTICS_GROUPINGS = {'crop': ('crop',), 'state': ('state',), 'crop,state': ('crop', 'state')}
+PRICE_QUANTILES = (('p10_price', 0.1), ('median_price', 0.5), ('p90_price', 0.9))
+
+def numpy_group_stats(codes, prices, msp):
+    """Per-group price statistics in a handful of vectorized passes; returns {code: stats}"""
+    codes = numpy.asarray(codes, dtype=numpy.int64)
+    prices = numpy.asarray(prices, dtype=numpy.float64)
+    msp = numpy.asarray(msp, dtype=numpy.float64)
+    order = numpy.lexsort((prices, codes))
+    codes, prices, msp = codes[order], prices[order], msp[order]
+    starts = numpy.flatnonzero(numpy.r_[True, codes[1:] != codes[:-1]])
+    counts = numpy.diff(numpy.r_[starts, len(codes)])
+    columns = {'listings': counts, 'mean_price': numpy.add.reduceat(prices, starts) / counts}
+    for name, q in PRICE_QUANTILES:
+        position = starts + q * (counts - 1)
+        lower, upper = numpy.floor(position).astype(numpy.int64), numpy.ceil(position).astype(numpy.int64)
+        columns[name] = prices[lower] + (prices[upper] - prices[lower]) * (position - lower)
+    known = ~numpy.isnan(msp)
+    with_msp = numpy.add.reduceat(known.astype(numpy.int64), starts)
+    premium = numpy.where(known, (prices - numpy.where(known, msp, 0)) / numpy.where(known, msp, 1), 0) * 100
+    premium_sum = numpy.add.reduceat(premium, starts)
+    below = numpy.add.reduceat((known & (prices < msp)).astype(numpy.int64), starts)
+    columns = {name: column.tolist() for name, column in columns.items()}
+    premium_sum, with_msp, below = premium_sum.tolist(), with_msp.tolist(), below.tolist()
+    stats = {}
+    for i, code in enumerate(codes[starts].tolist()):
+        group = {name: column[i] for name, column in columns.items()}
+        group['msp_premium_pct'] = premium_sum[i] / with_msp[i] if with_msp[i] else None
+        group['below_msp_share'] = below[i] / with_msp[i] if with_msp[i] else None
+        stats[code] = group
+    return stats
+
+def python_group_stats(codes, prices, msp):
+    """Same result as numpy_group_stats, for installs without NumPy"""
+    groups = collections.defaultdict(list)
+    for code, price, msp_price in zip(codes, prices, msp):
+        groups[code].append((price, msp_price))
+    stats = {}
+    for code, rows in groups.items():
+        values = sorted(price for price, _ in rows)
+        group = {'listings': len(values), 'mean_price': sum(values) / len(values)}
+        for name, q in PRICE_QUANTILES:
+            position = q * (len(values) - 1)
+            lower, upper = math.floor(position), math.ceil(position)
+            group[name] = values[lower] + (values[upper] - values[lower]) * (position - lower)
+        known = [(price, msp_price) for price, msp_price in rows if not math.isnan(msp_price)]
+        group['msp_premium_pct'] = (sum((price - msp_price) / msp_price for price, msp_price in known) * 100 / len(known)
+                                    if known else None)
+        group['below_msp_share'] = sum(price < msp_price for price, msp_price in known) / len(known) if known else None
+        stats[code] = group
+    return stats
+
+class PriceSnapshot:
+    """In-stock listings bucketed by (crop, state), with statistics cached per group.
+
+    update() moves changed listings between buckets and marks only the groups
+    they left or joined for recomputation; stats() recomputes just those.
+    """
+
+    CELL = ('crop', 'state')
+
+    def __init__(self, rows, farmer_states):
+        self.farmer_states = farmer_states
+        self.cells = collections.defaultdict(dict)     # (crop, state) -> {listing id: (price, msp price)}
+        self.located = {}                               # listing id -> (crop, state)
+        self._groups = {}                               # grouping -> {group labels: statistics}
+        self._stale = {}                                # grouping -> labels to recompute, None for all
+        self._sorted = {}
+        for crop_id, crop_name, farmer_id, price, msp_price in rows:
+            self._place(crop_id, crop_name, farmer_id, price, msp_price)
+
+    def _place(self, crop_id, crop_name, farmer_id, price, msp_price):
+        if farmer_id not in self.farmer_states:
+            return None
+        cell = (crop_name, self.farmer_states[farmer_id] or '')
+        self.cells[cell][crop_id] = (price, msp_price or None)
+        self.located[crop_id] = cell
+        return cell
+
+    def _labels(self, cell, dimensions):
+        return tuple(cell[self.CELL.index(dimension)] for dimension in dimensions)
+
+    def update(self, rows):
+        """Apply (id, crop_name, farmer_id, price, msp_price, quantity) rows, all None for a deleted listing"""
+        touched = set()
+        for crop_id, crop_name, farmer_id, price, msp_price, quantity in rows:
+            old = self.located.pop(crop_id, None)
+            before = self.cells[old].pop(crop_id) if old else None
+            new = self._place(crop_id, crop_name, farmer_id, price, msp_price) if quantity and quantity > 0 else None
+            # Most changes are stock movements that leave the listing where it was
+            if old != new or (new and self.cells[new][crop_id] != before):
+                touched.update(cell for cell in (old, new) if cell)
+            if old and not self.cells[old]:
+                del self.cells[old]
+        for grouping, stale in self._stale.items():
+            if stale is not None:
+                stale.update(self._labels(cell, ANALYTICS_GROUPINGS[grouping]) for cell in touched)
+        return bool(touched)
+
+    def stats(self, grouping):
+        """Statistics per group, sorted by group labels"""
+        dimensions = ANALYTICS_GROUPINGS[grouping]
+        groups = self._groups.setdefault(grouping, {})
+        stale = self._stale.setdefault(grouping, None)
+        if stale is None or stale:
+            members = collections.defaultdict(list)
+            for cell, listings in self.cells.items():
+                labels = self._labels(cell, dimensions)
+                if stale is None or labels in stale:
+                    members[labels].extend(listings.values())
+            if stale is None:
+                groups.clear()
+            else:
+                for labels in stale:
+                    groups.pop(labels, None)
+            keys = list(members)
+            codes, prices, msp = array('l'), array('d'), array('d')
+            for code, labels in enumerate(keys):
+                for price, msp_price in members[labels]:
+                    codes.append(code)
+                    prices.append(price)
+                    msp.append(msp_price if msp_price else math.nan)
+            group_stats = numpy_group_stats if numpy is not None else python_group_stats
+            for code, stats in (group_stats(codes, prices, msp).items() if keys else ()):
+                groups[keys[code]] = {**dict(zip(dimensions, keys[code])),
+                                      **{name: value if isinstance(value, int) or value is None else round(value, 2)
+                                         for name, value in stats.items()}}
+            self._stale[grouping] = set()
+            self._sorted[grouping] = [groups[labels] for labels in sorted(groups)]
+        return self._sorted[grouping]
+
+class PriceAnalytics:
+    """Market price statistics, cached per 'crop_prices' version.
+
+    The version is re-checked at most once per ANALYTICS_TTL seconds. When it
+    moved, only the listings in crop_changes since the last refresh are re-read
+    and only the groups they touch are recomputed; the snapshot is rebuilt from
+    scratch on first use and when a farmer changed state.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None      # (database, prices version, crop_changes version, snapshot)
+        self._checked_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+    def _load(self):
+        """Refresh the snapshot if due; called with the lock held"""
+        state = self._state
+        database = app.config['DATABASE']
+        if (state is not None and state[0] == database
+                and time.monotonic() - self._checked_at < app.config['ANALYTICS_TTL']):
+            return state
+        conn = get_db()
+        version = get_table_version(conn, 'crop_prices')
+        if state is None or state[0] != database or state[1] != version:
+            # Read before the listings: a change landing in between is applied again next time, never missed
+            changes = get_table_version(conn, 'crop_changes')
+            farmer_states = dict(conn.execute('SELECT id, state FROM farmers').fetchall())
+            cursor = conn.cursor()
+            cursor.row_factory = None
+            moved = state is not None and any(farmer_states.get(farmer_id, farmer_state) != farmer_state
+                                              for farmer_id, farmer_state in state[3].farmer_states.items())
+            if state is None or state[0] != database or moved:
+                # One sequential pass over crops; joining farmers instead walks crops in farmer order
+                rows = cursor.execute('SELECT id, crop_name, farmer_id, price, msp_price FROM crops WHERE quantity > 0')
+                snapshot = PriceSnapshot(rows, farmer_states)
+            else:
+                snapshot = state[3]
+                snapshot.farmer_states = farmer_states
+                snapshot.update(cursor.execute('''SELECT ch.crop_id, c.crop_name, c.farmer_id, c.price, c.msp_price, c.quantity
+                                                  FROM crop_changes ch LEFT JOIN crops c ON c.id = ch.crop_id
+                                                  WHERE ch.version > ?''', (state[2],)))
+            state = self._state = (database, version, changes, snapshot)
+        self._checked_at = time.monotonic()
+        return state
+
+    def stats(self, grouping):
+        """(version, statistics) for one of ANALYTICS_GROUPINGS"""
+        with self._lock:
+            _, version, _, snapshot = self._load()
+            return version, snapshot.stats(grouping)
+
+price_analytics = PriceAnalytics()
+
+# ==================== CART SUMMARY ====================
+
+# Per-customer cart totals kept current by the cart_summary_* triggers, so the
+# cart badge is a primary-key lookup. version changes on every cart write and
+# doubles as the ETag for /api/cart/count.
+EMPTY_CART_SUMMARY = {'item_count': 0, 'total_quantity': 0, 'total_price': 0, 'version': 0}
+
+def rebuild_cart_summary(conn):
+    conn.execute('UPDATE cart_summary SET item_count = 0, total_quantity = 0, total_price = 0, version = version + 1')
+    conn.execute('''INSERT INTO cart_summary (customer_id, item_count, total_quantity, total_price, version)
+                    SELECT cart.customer_id, COUNT(*), SUM(cart.quantity), SUM(cart.quantity * COALESCE(c.price, 0)), 1
+                    FROM cart LEFT JOIN crops c ON cart.crop_id = c.id GROUP BY cart.customer_id
+                    ON CONFLICT (customer_id) DO UPDATE SET item_count = excluded.item_count,
+                        total_quantity = excluded.total_quantity, total_price = excluded.total_price''')
+
+def get_cart_summary(conn, customer_id):
+    row = conn.execute('SELECT item_count, total_quantity, total_price, version FROM cart_summary WHERE customer_id = ?',
+                       (customer_id,)).fetchone()
+    return dict(row) if row else dict(EMPTY_CART_SUMMARY)
+
+# ==================== MARKETPLACE FACETS ====================
+
+# Filter dropdown values with the number of in-stock listings behind each,
+# maintained by the facets_* triggers on crops.
+FACET_TYPES = ('crop_name', 'location')
+
+def rebuild_facets(conn):
+    conn.execute('DELETE FROM marketplace_facets')
+    for column in FACET_TYPES:
+        conn.execute(f'''INSERT INTO marketplace_facets (facet_type, value, active_listing_count)
+                         SELECT '{column}', {column}, COUNT(*) FROM crops WHERE quantity > 0 GROUP BY {column}''')
+
+def get_facets(conn, facet_type):
+    """Rows of (<facet_type>, active_listing_count) for every value with stock, alphabetically"""
+    return conn.execute(f'''SELECT value as {facet_type}, active_listing_count FROM marketplace_facets
+                            WHERE facet_type = ? ORDER BY value''', (facet_type,)).fetchall()
 
 def compare_with_msp(farmer_price, msp_price):
     if msp_price is None:
@@ -398,9 +1422,889 @@ def customer_login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def api_login_required(session_key):
+    """Like the login decorators above, but answers API clients with a 401 instead of a redirect"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if session_key not in session:
+                return jsonify({'error': 'login required'}), 401
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+# ==================== PAGINATION ====================
+
+# Lists are paginated by keyset: each page token encodes the sort key of the
+# last row shown, so fetching page N costs the same as fetching page 1.
+
+def encode_cursor(*values):
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token, size=2):
+    """Decode a page token into its key values, raising ValueError if it is malformed"""
+    values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid page token')
+    # Only values SQLite can bind; bool is an int subclass but never a sort key
+    if any(isinstance(value, bool) or not isinstance(value, (str, int, float)) for value in values):
+        raise ValueError('Invalid page token')
+    return values
+
+def get_page_args(cursor_param='cursor'):
+    """Read the page token and page size from the query string"""
+    token = request.args.get(cursor_param)
+    try:
+        cursor = decode_cursor(token) if token else None
+    except ValueError:
+        abort(400, description='Invalid page token')
+    limit = request.args.get('limit', type=int) or app.config['PAGE_SIZE']
+    return cursor, max(1, min(limit, app.config['MAX_PAGE_SIZE']))
+
+def get_since_arg(description):
+    """Read ?since= as a non-negative integer (0 when absent), rejecting anything else with a 400"""
+    since = request.args.get('since', '0')
+    if not (since.isascii() and since.isdigit()):
+        abort(400, description=description)
+    return int(since)
+
+def fetch_page(conn, query, params, limit, key, stream=False):
+    """Run a keyset query and return (rows, next page token or None)"""
+    if stream:
+        page = StreamedPage(conn, query, params, limit, key)
+        return page, page.next_cursor
+    rows = conn.execute(f'{query} LIMIT ?', (*params, limit + 1)).fetchall()
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(*key(rows[limit - 1]))
+    return rows, None
+
+class StreamedPage:
+    """A page's rows read in PAGE_SIZE batches as a streamed template renders them.
+
+    The rows can be iterated once. As soon as the last batch has been read the
+    pooled connection goes back to the pool, so a slow client only holds it
+    while rows are still to come. next_cursor is known only once the last
+    batch is read, so templates must use it below the rows, as a "more" link does.
+    """
+
+    def __init__(self, conn, query, params, limit, key):
+        self._conn = conn
+        self._count_query = f'SELECT COUNT(*) FROM ({query} LIMIT ?)', (*params, limit)
+        self._cursor = conn.execute(f'{query} LIMIT ?', (*params, limit + 1))
+        self._limit = limit
+        self._key = key
+        self._fetched = 0
+        self._last = None
+        self._length = None
+        self.token = None
+        self.next_cursor = StreamedPageToken(self)
+        self._fetch()
+        self._any = bool(self._batch)
+
+    def _fetch(self):
+        size = min(app.config['PAGE_SIZE'], self._limit + 1 - self._fetched)
+        batch = self._cursor.fetchmany(size)
+        self._fetched += len(batch)
+        if self._fetched > self._limit:
+            batch.pop()  # the extra row only tells us there is a next page
+        if batch:
+            self._last = batch[-1]
+        self._batch = batch
+        if self._fetched > self._limit or len(batch) < size:
+            if self._fetched > self._limit:
+                self.token = encode_cursor(*self._key(self._last))
+            self._length = min(self._fetched, self._limit)
+            self._cursor.close()
+            self._cursor = None
+
+    def _release(self):
+        # Only once the template is rendering: the view may still be using the connection before that
+        if has_request_context() and g.get('db') is self._conn:
+            release_db()
+
+    def __bool__(self):
+        return self._any
+
+    def __len__(self):
+        """Rows on the page; counted by a LIMITed query if they have not all been read yet"""
+        if self._length is None:
+            query, params = self._count_query
+            self._length = self._conn.execute(query, params).fetchone()[0]
+        return self._length
+
+    def __iter__(self):
+        while True:
+            batch, self._batch = self._batch, []
+            if self._cursor is None:
+                self._release()
+            if not batch:
+                return
+            yield from batch
+            if self._cursor is not None:
+                self._fetch()
+
+class StreamedPageToken:
+    """Stands in for a streamed page's next page token until its rows have been rendered"""
+
+    def __init__(self, page):
+        self._page = page
+
+    def __bool__(self):
+        return self._page.token is not None
+
+    def __str__(self):
+        return self._page.token or ''
+
+    __html__ = __str__
+
+def by_created_at(row):
+    return row['created_at'], row['id']
+
+def by_order_date(row):
+    return row['order_date'], row['id']
+
+MARKETPLACE_COLUMNS = '''c.*, f.name as farmer_name, f.phone as farmer_phone, f.address as farmer_address,
+                         f.district, f.state as farmer_state, f.pincode'''
+# Columns API clients may pick with ?fields=, named as in MARKETPLACE_COLUMNS
+MARKETPLACE_FIELDS = {
+    'id': 'c.id', 'farmer_id': 'c.farmer_id', 'crop_name': 'c.crop_name', 'quantity': 'c.quantity', 'price': 'c.price',
+    'location': 'c.location', 'msp_price': 'c.msp_price', 'msp_status': 'c.msp_status', 'created_at': 'c.created_at',
+    'farmer_name': 'f.name', 'farmer_phone': 'f.phone', 'farmer_address': 'f.address', 'district': 'f.district',
+    'farmer_state': 'f.state', 'pincode': 'f.pincode',
+}
+
+def marketplace_columns(fields=None):
+    """SELECT list for the given MARKETPLACE_FIELDS, plus the id and created_at that page tokens need"""
+    if fields is None:
+        return MARKETPLACE_COLUMNS
+    return ', '.join(f'{MARKETPLACE_FIELDS[name]} as {name}' for name in dict.fromkeys(['id', 'created_at', *fields]))
+
+def marketplace_page(conn, crop_filter='', location_filter='', sort='newest', cursor=None, limit=None, fields=None,
+                     near=None, stream=False):
+    """One page of in-stock listings matching the marketplace filters, newest first or by search relevance.
+
+    near=(latitude, longitude, km) keeps listings within km of that point, adds their distance_km and
+    allows sort='distance'.
+    """
+    limit = limit or app.config['PAGE_SIZE']
+    columns = marketplace_columns(fields)
+    use_fts = search_index_enabled(conn)
+    match = marketplace_search_match(crop_filter, location_filter) if use_fts else ''
+    params = []
+    if near:
+        latitude, longitude, radius_km = near
+        # R*Tree coordinates are 32-bit floats, so distances are only meaningful to ~10 m
+        distance = 'round(distance_km(?, ?, g.min_lat, g.min_lon), 2)'
+        columns += f', {distance} as distance_km'
+        params.extend((latitude, longitude))
+    by_rank = match and sort == 'relevance'
+    if by_rank:
+        query = f'''SELECT {columns}, crops_fts.rank as search_rank
+                    FROM crops_fts JOIN crops c ON c.id = crops_fts.rowid JOIN farmers f ON c.farmer_id = f.id'''
+        query += ' JOIN crops_geo g ON g.id = c.id' if near else ''
+        query += ' WHERE crops_fts MATCH ? AND c.quantity > 0'
+        params.append(match)
+    else:
+        # Let the R*Tree drive a proximity search: it narrows the listings to a bounding box first
+        source = 'crops_geo g CROSS JOIN crops c ON c.id = g.id' if near else 'crops c'
+        query = f'SELECT {columns} FROM {source} JOIN farmers f ON c.farmer_id = f.id WHERE c.quantity > 0'
+        if match:
+            # A filter rather than a join, so the newest-first index (or the R*Tree) still drives
+            # the page and a search never sorts all of its matches; the unary + keeps it a filter
+            query += ' AND +c.id IN (SELECT rowid FROM crops_fts WHERE crops_fts MATCH ?)'
+            params.append(match)
+        # LIKE fallback for SQLite builds without FTS5
+        if crop_filter and not use_fts:
+            query += ' AND LOWER(c.crop_name) LIKE LOWER(?)'
+            params.append(f'%{crop_filter}%')
+        if location_filter and not use_fts:
+            query += ' AND LOWER(c.location) LIKE LOWER(?)'
+            params.append(f'%{location_filter}%')
+    if near:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        query += f''' AND g.max_lat >= ? AND g.min_lat <= ? AND g.max_lon >= ? AND g.min_lon <= ?
+                      AND {distance} <= ?'''
+        params.extend((min_lat, max_lat, min_lon, max_lon, latitude, longitude, radius_km))
+    if near and sort == 'distance':
+        if cursor:
+            query += f' AND ({distance}, c.id) > (?, ?)'
+            params.extend((latitude, longitude, *cursor))
+        query += ' ORDER BY distance_km, c.id'
+        key = lambda row: (row['distance_km'], row['id'])
+    elif by_rank:
+        if cursor:
+            query += ' AND (crops_fts.rank, c.id) > (?, ?)'
+            params.extend(cursor)
+        query += ' ORDER BY crops_fts.rank, c.id'
+        key = lambda row: (row['search_rank'], row['id'])
+    else:
+        if cursor:
+            query += ' AND (c.created_at, c.id) < (?, ?)'
+            params.extend(cursor)
+        query += ' ORDER BY c.created_at DESC, c.id DESC'
+        key = by_created_at
+    return fetch_page(conn, query, params, limit, key, stream)
+
+def farmer_crops_page(conn, farmer_id, cursor=None, limit=None, stream=False):
+    query = 'SELECT * FROM crops WHERE farmer_id = ?'
+    params = [farmer_id]
+    if cursor:
+        query += ' AND (created_at, id) < (?, ?)'
+        params.extend(cursor)
+    query += ' ORDER BY created_at DESC, id DESC'
+    return fetch_page(conn, query, params, limit or app.config['PAGE_SIZE'], by_created_at, stream)
+
+def order_list_query(select, params, include_archived=False):
+    """Finish a keyset order-list SELECT written against `{orders} o`, newest first.
+
+    Only the hot orders table is read unless include_archived, which adds the
+    same SELECT over orders_archive; SQLite merges the two ordered branches.
+    """
+    if not include_archived:
+        return select.format(orders='orders') + ' ORDER BY o.order_date DESC, o.id DESC', params
+    return (f"{select.format(orders='orders')} UNION ALL {select.format(orders='orders_archive')}"
+            ' ORDER BY order_date DESC, id DESC', [*params, *params])
+
+def farmer_orders_page(conn, farmer_id, status=None, cursor=None, limit=None, include_archived=False):
+    query = '''SELECT o.*, c.crop_name, c.price as price_per_kg, cu.name as customer_name, cu.phone as customer_phone,
+                      cu.address as delivery_address, cu.city, cu.state
+               FROM {orders} o JOIN crops c ON o.crop_id = c.id JOIN customers cu ON o.customer_id = cu.id
+               WHERE o.farmer_id = ?'''
+    params = [farmer_id]
+    if status:
+        query += ' AND o.status = ?'
+        params.append(status)
+    if cursor:
+        query += ' AND (o.order_date, o.id) < (?, ?)'
+        params.extend(cursor)
+    query, params = order_list_query(query, params, include_archived)
+    return fetch_page(conn, query, params, limit or app.config['PAGE_SIZE'], by_order_date)
+
+ORDER_STATUSES = ('Pending', 'Accepted', 'Delivered', 'Rejected')
+
+def farmer_order_stats(conn, farmer_id):
+    """Order counts and value per status for one farmer, aggregated in SQL, archived orders included"""
+    by_status = {status: {'count': 0, 'total_price': 0} for status in ORDER_STATUSES}
+    # Rows with a NULL or unknown status are left out rather than reported under a None key
+    for row in conn.execute(f'''SELECT status, COUNT(*) AS count, COALESCE(SUM(total_price), 0) AS total_price
+                                FROM orders WHERE farmer_id = ? AND status IN {ORDER_STATUSES!r} GROUP BY status
+                                UNION ALL
+                                SELECT status, count, total_price FROM orders_archive_totals
+                                WHERE farmer_id = ? AND status IN {ORDER_STATUSES!r}''', (farmer_id, farmer_id)):
+        stats = by_status[row['status']]
+        stats['count'] += row['count']
+        stats['total_price'] += row['total_price']
+    return {'by_status': by_status,
+            'total_orders': sum(stats['count'] for stats in by_status.values()),
+            'revenue': by_status['Delivered']['total_price']}
+
+def customer_orders_page(conn, customer_id, cursor=None, limit=None, include_archived=False, stream=False):
+    query = '''SELECT o.*, c.crop_name, c.price as price_per_kg, o.total_price as total_amount,
+                      f.name as farmer_name, f.phone as farmer_phone,
+                      f.address as farmer_address, f.district as farmer_district, 
+                      f.state as farmer_state, f.pincode as farmer_pincode
+               FROM {orders} o JOIN crops c ON o.crop_id = c.id JOIN farmers f ON o.farmer_id = f.id
+               WHERE o.customer_id = ?'''
+    params = [customer_id]
+    if cursor:
+        query += ' AND (o.order_date, o.id) < (?, ?)'
+        params.extend(cursor)
+    query, params = order_list_query(query, params, include_archived)
+    return fetch_page(conn, query, params, limit or app.config['PAGE_SIZE'], by_order_date, stream)
+
+def stream_requested():
+    """Whether to stream the HTML page: ?stream=1, or STREAM_TEMPLATES unless the client sent ?stream=0"""
+    stream = request.args.get('stream')
+    if stream is None:
+        return app.config['STREAM_TEMPLATES']
+    return stream.lower() in ('1', 'true', 'yes')
+
+def render_page(template, stream, **context):
+    """render_template, or stream_template so the page shell goes out before the rows are read"""
+    if stream:
+        return stream_template(template, **context)
+    return render_template(template, **context)
+
+def include_archived_arg():
+    """Whether the client asked for archived order history with ?include_archived=1"""
+    return request.args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+def json_response(payload):
+    if orjson is not None:
+        return Response(orjson.dumps(payload), mimetype='application/json')
+    return jsonify(payload)
+
+def page_json(rows, next_cursor, fields=None):
+    """JSON page of rows, trimmed to `fields` when the client asked for a projection"""
+    if fields is None:
+        items = [dict(row) for row in rows]
+    else:
+        items = [{name: row[name] for name in fields} for row in rows]
+    return json_response({'items': items, 'next_cursor': next_cursor})
+
+# ==================== LIVE EVENTS ====================
+
+Event = collections.namedtuple('Event', 'id topics type data')
+
+class EventBus:
+    """In-process publish/subscribe feeding the Server-Sent Event streams.
+
+    The most recent events stay in a ring buffer so a reconnecting client can
+    resume from its Last-Event-ID. Subscribers only see events published by
+    this process.
+    """
+
+    def __init__(self, size):
+        self._condition = threading.Condition()
+        self._events = collections.deque(maxlen=size)
+        self._last_id = 0
+
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, topics, event_type, data):
+        with self._condition:
+            self._last_id += 1
+            self._events.append(Event(self._last_id, frozenset(topics), event_type, data))
+            self._condition.notify_all()
+        return self._last_id
+
+    def events_after(self, last_id, topics):
+        """Buffered events newer than last_id on any of topics, or None if some have already been dropped"""
+        with self._condition:
+            if last_id > self._last_id or (self._events and last_id < self._events[0].id - 1):
+                return None
+            return [event for event in self._events if event.id > last_id and not event.topics.isdisjoint(topics)]
+
+    def wait(self, last_id, timeout):
+        """Block until an event newer than last_id is published or timeout passes"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._last_id > last_id, timeout)
+
+event_bus = EventBus(app.config['EVENT_BUFFER_SIZE'])
+# Reconnect delay suggested to EventSource clients
+EVENT_RETRY_MS = 3000
+
+def farmer_topic(farmer_id):
+    return f'farmer:{farmer_id}'
+
+def customer_topic(customer_id):
+    return f'customer:{customer_id}'
+
+def crop_topic(crop_id):
+    return f'crop:{crop_id}'
+
+def publish_order_event(order, status):
+    """Tell the order's farmer and customer that it was created or changed status"""
+    data = {key: order[key] for key in ('id', 'crop_id', 'quantity', 'total_price')}
+    data['status'] = status
+    event_type = 'order_created' if status == 'Pending' else f'order_{status.lower()}'
+    event_bus.publish([farmer_topic(order['farmer_id']), customer_topic(order['customer_id'])], event_type, data)
+
+def publish_stock_change(crop_id, quantity):
+    event_bus.publish([crop_topic(crop_id)], 'stock_changed', {'crop_id': crop_id, 'quantity': quantity})
+
+def format_event(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+def event_stream(topics, last_event_id):
+    """Yield SSE frames for topics until EVENT_STREAM_TIMEOUT; clients then reconnect with Last-Event-ID"""
+    heartbeat = app.config['EVENT_HEARTBEAT']
+    deadline = time.monotonic() + app.config['EVENT_STREAM_TIMEOUT']
+    yield f'retry: {EVENT_RETRY_MS}\n\n'
+    while True:
+        events = event_bus.events_after(last_event_id, topics)
+        if events is None:
+            # The client missed events we no longer hold; it has to reload its state
+            last_event_id = event_bus.last_id()
+            yield format_event(last_event_id, 'reset', {})
+            continue
+        for event in events:
+            yield format_event(event.id, event.type, event.data)
+        last_event_id = max([last_event_id] + [event.id for event in events])
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if not event_bus.wait(last_event_id, min(heartbeat, remaining)):
+            yield ': heartbeat\n\n'
+
+def event_response(topics):
+    """SSE response for topics plus any crops listed in ?crops=, resuming from Last-Event-ID when given"""
+    topics = set(topics)
+    for crop_id in request.args.get('crops', '').split(','):
+        if crop_id.strip().isdigit():
+            topics.add(crop_topic(int(crop_id)))
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id', ''))
+    last_event_id = int(last_event_id) if last_event_id.isdigit() else event_bus.last_id()
+    return Response(event_stream(topics, last_event_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# ==================== CONDITIONAL GET ====================
+
+class PageCache:
+    """LRU of rendered pages keyed by database and ETag, which already encodes the data version and visitor"""
+
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._pages = collections.OrderedDict()
+        self._size = size
+
+    def get(self, key):
+        with self._lock:
+            body = self._pages.get(key)
+            if body is not None:
+                self._pages.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._pages[key] = body
+            self._pages.move_to_end(key)
+            while len(self._pages) > self._size:
+                self._pages.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+
+page_cache = PageCache(app.config['PAGE_CACHE_SIZE'])
+
+def not_modified(etag, last_modified):
+    """Whether the client's cached copy is current; If-None-Match wins over If-Modified-Since"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return (last_modified is not None and request.if_modified_since is not None
+            and last_modified <= request.if_modified_since)
+
+def revalidate(response, etag, last_modified, cache_control):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+def cached_page(stamp, render):
+    """Serve a page built only from one versioned table, answering 304s and reusing earlier renders.
+
+    stamp is the table's (version, last modified). Pages differ by language and
+    by who is logged in (the layout shows their name), so both go into the
+    ETag. No Last-Modified is sent: a date cannot tell visitors apart, and a
+    client that switched language would get a 304 for the other language's page.
+    Pages carrying flashed messages are always rendered fresh.
+    """
+    if '_flashes' in session:
+        return render()
+    version, _ = stamp
+    visitor = (session.get('language', DEFAULT_LANGUAGE), session.get('farmer_name'), session.get('customer_name'))
+    etag = f'{request.endpoint}-{version}-{zlib.crc32(repr(visitor).encode()):08x}'
+    if not_modified(etag, None):
+        response = Response(status=304)
+    else:
+        key = (app.config['DATABASE'], etag)
+        body = page_cache.get(key)
+        if body is None:
+            body = render()
+            page_cache.put(key, body)
+        response = make_response(body)
+    return revalidate(response, etag, None, 'private, no-cache')
+
+# ==================== MARKETPLACE DELTA SYNC ====================
+
+# Offline-first clients keep their own copy of the marketplace and ask for the
+# listings changed since the 'crop_changes' version they last saw. Every
+# listing write gets its own version (see crop_change_triggers), so the feed
+# pages by version alone and a delete leaves a tombstone behind.
+GZIP_MIN_SIZE = 512
+
+def rebuild_crop_changes(conn):
+    """Stamp every listing (and tombstone every vanished one) with new versions, e.g. after a bulk load with triggers off"""
+    base = get_table_version(conn, 'crop_changes')
+    conn.execute('''WITH changed (crop_id, deleted) AS (
+                        SELECT id, 0 FROM crops
+                        UNION ALL
+                        SELECT crop_id, 1 FROM crop_changes WHERE deleted = 0 AND crop_id NOT IN (SELECT id FROM crops)
+                    )
+                    INSERT INTO crop_changes (crop_id, version, created_version, deleted)
+                    SELECT crop_id, ? + ROW_NUMBER() OVER (ORDER BY crop_id), ? + ROW_NUMBER() OVER (ORDER BY crop_id), deleted
+                    FROM changed WHERE true
+                    ON CONFLICT (crop_id) DO UPDATE SET version = excluded.version, deleted = excluded.deleted''',
+                 (base, base))
+    conn.execute('''UPDATE table_versions SET version = (SELECT COALESCE(MAX(version), 0) FROM crop_changes),
+                    updated_at = CURRENT_TIMESTAMP WHERE name = 'crop_changes' ''')
+
+def marketplace_changes(conn, since, limit):
+    """Listings changed after version `since`, split into inserted, updated and deleted.
+
+    A listing that went out of stock counts as deleted, as it has left the
+    marketplace; one created and removed since `since` is left out entirely.
+    Returns at most `limit` changes, with the version to continue from.
+    """
+    current = get_table_version(conn, 'crop_changes')
+    rows = conn.execute(f'''SELECT ch.version AS change_version, ch.crop_id AS change_crop_id, ch.created_version,
+                                   ch.deleted AS change_deleted, {MARKETPLACE_COLUMNS}
+                            FROM crop_changes ch LEFT JOIN crops c ON c.id = ch.crop_id
+                            LEFT JOIN farmers f ON c.farmer_id = f.id
+                            WHERE ch.version > ? AND ch.version <= ? ORDER BY ch.version LIMIT ?''',
+                        (since, current, limit + 1)).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    changes = {'inserted': [], 'updated': [], 'deleted': []}
+    for row in rows:
+        if not row['change_deleted'] and row['id'] is not None and row['quantity'] > 0:
+            listing = {key: row[key] for key in row.keys()[4:]}
+            changes['inserted' if row['created_version'] > since else 'updated'].append(listing)
+        elif row['created_version'] <= since:
+            changes['deleted'].append(row['change_crop_id'])
+    changes['version'] = rows[-1]['change_version'] if has_more else current
+    changes['has_more'] = has_more
+    return changes
+
+def gzip_response(response):
+    """Gzip a response body for clients that accept it; small bodies are not worth the CPU"""
+    response.vary.add('Accept-Encoding')
+    if not request.accept_encodings['gzip'] or response.content_length is None or response.content_length < GZIP_MIN_SIZE:
+        return response
+    response.set_data(gzip.compress(response.get_data(), compresslevel=6))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+# ==================== BULK IMPORT ====================
+
+IMPORT_FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson'}
+IMPORT_COLUMNS = ('crop_name', 'quantity', 'price')
+
+def positive_int(value):
+    """A whole number above zero from a CSV string or JSON number, else None"""
+    if isinstance(value, str) and re.fullmatch(r'\s*[0-9]+\s*', value):
+        value = int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+        return value
+    return None
+
+# Yielded in place of a record when the rest of an upload cannot be read
+UnreadableUpload = collections.namedtuple('UnreadableUpload', 'error')
+
+def read_import_records(stream, file_format):
+    """Yield (line, record or None) from an uploaded CSV or NDJSON stream without reading it whole.
+
+    Lines are decoded one at a time, so bad bytes or a malformed CSV row end
+    the stream with an (line, UnreadableUpload) item right where they occur.
+    """
+    line_count = 0
+
+    def lines():
+        nonlocal line_count
+        for raw in stream:
+            line_count += 1
+            yield raw.decode('utf-8-sig' if line_count == 1 else 'utf-8')
+
+    if file_format == 'csv':
+        reader = csv.DictReader(lines())
+        try:
+            fieldnames = reader.fieldnames or []
+        except (UnicodeDecodeError, csv.Error):
+            abort(400, description='The CSV header is not readable UTF-8 text')
+        missing = [column for column in IMPORT_COLUMNS if column not in fieldnames]
+        if missing:
+            abort(400, description='Missing CSV columns: ' + ', '.join(missing))
+        records = iter(reader)
+        while True:
+            try:
+                record = next(records)
+            except StopIteration:
+                return
+            except UnicodeDecodeError:
+                yield line_count, UnreadableUpload('line is not valid UTF-8; the rest of the file was not read')
+                return
+            except csv.Error as error:
+                yield line_count, UnreadableUpload(f'malformed CSV ({error}); the rest of the file was not read')
+                return
+            yield reader.line_num, record
+    try:
+        for raw in lines():
+            if not raw.strip():
+                continue
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                record = None
+            yield line_count, record if isinstance(record, dict) else None
+    except UnicodeDecodeError:
+        yield line_count, UnreadableUpload('line is not valid UTF-8; the rest of the file was not read')
+
+def validate_listing(record, default_location):
+    """Return (crop_name, quantity, price, location) and the list of problems with one imported record"""
+    if record is None:
+        return None, ['not a JSON object']
+    errors = []
+    crop_name = str(record.get('crop_name') or '').strip()
+    quantity = positive_int(record.get('quantity'))
+    price = positive_int(record.get('price'))
+    location = str(record.get('location') or '').strip() or default_location
+    if not crop_name:
+        errors.append('crop_name is required')
+    if quantity is None:
+        errors.append('quantity must be a positive whole number')
+    if price is None:
+        errors.append('price must be a positive whole number')
+    if not location:
+        errors.append('location is required')
+    return (crop_name, quantity, price, location), errors
+
+def import_listings(conn, farmer_id, records, default_location):
+    """Validate records and insert the good ones as listings in chunked transactions.
+
+    Rows are written IMPORT_CHUNK_SIZE at a time with one MSP lookup and one
+    executemany per chunk, so earlier chunks stay committed if a later one
+    fails. Returns one report entry per record; an entry with stopped set
+    means the rest of the upload was not read.
+    """
+    chunk_size = app.config['IMPORT_CHUNK_SIZE']
+    max_rows = app.config['IMPORT_MAX_ROWS']
+    report = []
+    chunk = []
+
+    def flush():
+        prices = get_msp_prices({listing[0] for _, listing in chunk})
+        rows = []
+        for entry, (crop_name, quantity, price, location) in chunk:
+            msp_price = prices[crop_name]
+            entry['msp_status'] = compare_with_msp(price, msp_price)
+            rows.append((farmer_id, crop_name, quantity, price, location, msp_price, entry['msp_status']))
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('''INSERT INTO crops (farmer_id, crop_name, quantity, price, location, msp_price, msp_status)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        chunk.clear()
+
+    for count, (line, record) in enumerate(records, 1):
+        if isinstance(record, UnreadableUpload):
+            report.append({'line': line, 'ok': False, 'stopped': True, 'errors': [record.error]})
+            break
+        if count > max_rows:
+            report.append({'line': line, 'ok': False, 'stopped': True, 'errors': [f'import is limited to {max_rows} rows']})
+            break
+        listing, errors = validate_listing(record, default_location)
+        entry = {'line': line, 'ok': not errors}
+        report.append(entry)
+        if errors:
+            entry['errors'] = errors
+            continue
+        chunk.append((entry, listing))
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return report
+
+# ==================== ORDER ENGINE ====================
+
+def wants_json():
+    """Whether the client asked for a JSON response rather than an HTML redirect"""
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+def next_order_id(conn):
+    """First free orders.id; only meaningful while holding the write lock"""
+    row = conn.execute('''SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'orders'), 0),
+                                 COALESCE((SELECT MAX(id) FROM orders), 0))''').fetchone()
+    return row[0] + 1
+
+def place_orders(conn, customer_id, items, address, phone, from_cart=False):
+    """Turn items into Pending orders in one BEGIN IMMEDIATE transaction.
+
+    Each item is a mapping with crop_id and quantity (crop_name is echoed back
+    if present). Stock is taken with a guarded decrement, so concurrent buyers
+    can never oversell a listing; items that cannot be filled are skipped.
+    With from_cart, the cart lines of placed items are removed in the same
+    transaction. Returns one result dict per item, with ok and either
+    order_id or error. Order and stock events are published once committed.
+    """
+    order_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    results = []
+    orders = []
+    stock = {}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        order_id = next_order_id(conn)
+        for item in items:
+            result = {'crop_id': item['crop_id'], 'crop_name': item.get('crop_name'), 'quantity': item['quantity']}
+            results.append(result)
+            if item['quantity'] <= 0:
+                result.update(ok=False, error='invalid_quantity')
+                continue
+            crop = conn.execute('''UPDATE crops SET quantity = quantity - ? WHERE id = ? AND quantity >= ?
+                                   RETURNING farmer_id, price, crop_name, quantity''',
+                                (item['quantity'], item['crop_id'], item['quantity'])).fetchone()
+            if crop is None:
+                result.update(ok=False, error='insufficient_stock')
+                continue
+            total_price = item['quantity'] * crop['price']
+            result.update(ok=True, order_id=order_id, crop_name=crop['crop_name'], total_price=total_price)
+            orders.append((order_id, customer_id, item['crop_id'], crop['farmer_id'], item['quantity'], total_price,
+                           order_date, address, phone))
+            stock[item['crop_id']] = crop['quantity']
+            order_id += 1
+        conn.executemany('''INSERT INTO orders (id, customer_id, crop_id, farmer_id, quantity, total_price, status, order_date, customer_address, customer_phone)
+                            VALUES (?, ?, ?, ?, ?, ?, 'Pending', ?, ?, ?)''', orders)
+        if from_cart:
+            conn.executemany('DELETE FROM cart WHERE customer_id = ? AND crop_id = ?',
+                             [(customer_id, order[2]) for order in orders])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for order in orders:
+        publish_order_event(dict(zip(('id', 'customer_id', 'crop_id', 'farmer_id', 'quantity', 'total_price'), order)),
+                            'Pending')
+    for crop_id, quantity in stock.items():
+        publish_stock_change(crop_id, quantity)
+    return results
+
+# action -> (new status, statuses an order may move from)
+ORDER_ACTIONS = {
+    'accept': ('Accepted', ('Pending',)),
+    'reject': ('Rejected', ('Pending', 'Accepted')),
+    'deliver': ('Delivered', ('Pending', 'Accepted')),
+}
+ORDER_ACTION_CHUNK = 500
+
+def apply_order_action(conn, farmer_id, action, order_ids):
+    """Move a farmer's orders to the action's status in one BEGIN IMMEDIATE transaction.
+
+    Rejected orders put their quantity back on the listing, summed per crop so
+    each crop is restocked once. Returns one result dict per distinct order id,
+    with ok and either the new status or an error (not_found, invalid_status).
+    """
+    new_status, from_statuses = ORDER_ACTIONS[action]
+    updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    results = {order_id: {'order_id': order_id, 'ok': False, 'error': 'not_found'} for order_id in order_ids}
+    ids = list(results)
+    changed = []
+    stock = {}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for start in range(0, len(ids), ORDER_ACTION_CHUNK):
+            chunk = ids[start:start + ORDER_ACTION_CHUNK]
+            marks = ', '.join('?' * len(chunk))
+            changed.extend(conn.execute(f'''UPDATE orders SET status = ?, status_updated_at = ?
+                                            WHERE farmer_id = ? AND id IN ({marks})
+                                            AND status IN ({', '.join('?' * len(from_statuses))})
+                                            RETURNING *''',
+                                        [new_status, updated_at, farmer_id, *chunk, *from_statuses]).fetchall())
+            for order in conn.execute(f'SELECT id, status FROM orders WHERE farmer_id = ? AND id IN ({marks})',
+                                      [farmer_id, *chunk]):
+                # Overwritten below for the orders the UPDATE just changed
+                results[order['id']].update(error='invalid_status', status=order['status'])
+        restock = collections.Counter()
+        for order in changed:
+            results[order['id']] = {'order_id': order['id'], 'ok': True, 'status': new_status}
+            if new_status == 'Rejected':
+                restock[order['crop_id']] += order['quantity']
+        for crop_id, quantity in restock.items():
+            crop = conn.execute('UPDATE crops SET quantity = quantity + ? WHERE id = ? RETURNING quantity',
+                                (quantity, crop_id)).fetchone()
+            if crop is not None:
+                stock[crop_id] = crop['quantity']
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for order in changed:
+        publish_order_event(order, new_status)
+    for crop_id, quantity in stock.items():
+        publish_stock_change(crop_id, quantity)
+    return list(results.values())
+
+# ==================== ORDER ARCHIVE ====================
+
+# Delivered and Rejected orders never change again. Once they are old enough
+# they move to orders_archive, keeping the hot orders table (and every join
+# against it) small; order lists only read the archive when asked to.
+TERMINAL_STATUSES = ('Delivered', 'Rejected')
+ORDER_AGE = 'COALESCE(status_updated_at, order_date)'
+ORDER_COLUMNS = ('id, customer_id, crop_id, farmer_id, quantity, total_price, status, order_date, status_updated_at, '
+                 'customer_address, customer_phone')
+
+def archive_orders(conn, older_than_days=None, batch_size=None, pause=None):
+    """Move terminal orders older than the cut-off into orders_archive and return how many moved.
+
+    Each batch is its own short BEGIN IMMEDIATE transaction, with a pause in
+    between, so checkout and order actions are never locked out for long.
+    """
+    older_than_days = app.config['ARCHIVE_AFTER_DAYS'] if older_than_days is None else older_than_days
+    batch_size = batch_size or app.config['ARCHIVE_BATCH_SIZE']
+    pause = app.config['ARCHIVE_BATCH_PAUSE'] if pause is None else pause
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime('%Y-%m-%d %H:%M:%S')
+    moved = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            ids = [row[0] for row in conn.execute(f'''SELECT id FROM orders
+                                                      WHERE status IN {TERMINAL_STATUSES!r} AND {ORDER_AGE} < ?
+                                                      ORDER BY {ORDER_AGE} LIMIT ?''', (cutoff, batch_size))]
+            if ids:
+                marks = ', '.join('?' * len(ids))
+                conn.execute(f'''INSERT INTO orders_archive ({ORDER_COLUMNS})
+                                 SELECT {ORDER_COLUMNS} FROM orders WHERE id IN ({marks})''', ids)
+                conn.execute(f'''INSERT INTO orders_archive_totals (farmer_id, status, count, total_price)
+                                 SELECT farmer_id, status, COUNT(*), SUM(total_price) FROM orders
+                                 WHERE id IN ({marks}) GROUP BY farmer_id, status
+                                 ON CONFLICT (farmer_id, status) DO UPDATE SET count = count + excluded.count,
+                                     total_price = total_price + excluded.total_price''', ids)
+                conn.execute(f'DELETE FROM orders WHERE id IN ({marks})', ids)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        moved += len(ids)
+        if len(ids) < batch_size:
+            return moved
+        time.sleep(pause)
+
+@app.cli.command('archive-orders')
+@click.option('--days', type=int, default=None, help='Archive orders finished more than this many days ago.')
+@click.option('--batch-size', type=int, default=None, help='Orders moved per transaction.')
+def archive_orders_command(days, batch_size):
+    """Move old Delivered and Rejected orders into orders_archive (run from cron)"""
+    click.echo(f'Archived {archive_orders(get_db(), days, batch_size)} orders')
+
+# ==================== ORDER CHANGE LOG ====================
+
+# Every order creation and status change appends a row to order_events from a
+# trigger, so it commits or rolls back with the change itself. Clients keep the
+# last event id they saw and ask /api/orders/changes for anything newer.
+ORDER_EVENT_INSERT = '''INSERT INTO order_events (order_id, farmer_id, customer_id, crop_id, kind, status, quantity,
+                                                  total_price)
+                        VALUES (new.id, new.farmer_id, new.customer_id, new.crop_id, '{kind}', new.status,
+                                new.quantity, new.total_price);'''
+
+def order_event_triggers():
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS orders_events_after_insert AFTER INSERT ON orders BEGIN
+                {ORDER_EVENT_INSERT.format(kind='created')}
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS orders_events_after_status AFTER UPDATE OF status ON orders
+            WHEN new.status IS NOT old.status BEGIN
+                {ORDER_EVENT_INSERT.format(kind='status_changed')}
+            END''',
+    ]
+
+def order_changes(conn, since, limit, farmer_id=None, customer_id=None):
+    """Up to `limit` order events after event id `since` for one farmer or customer; returns (events, has_more)"""
+    owner, owner_id = ('farmer_id', farmer_id) if farmer_id is not None else ('customer_id', customer_id)
+    rows = conn.execute(f'''SELECT id, order_id, crop_id, kind, status, quantity, total_price, created_at
+                            FROM order_events WHERE {owner} = ? AND id > ? ORDER BY id LIMIT ?''',
+                        (owner_id, since, limit + 1)).fetchall()
+    return [dict(row) for row in rows[:limit]], len(rows) > limit
+
 @app.route('/set_language/<lang>')
 def set_language(lang):
-    if lang in ['en', 'hi', 'te']:
+    if lang in TRANSLATIONS:
         session['language'] = lang
     return redirect(request.referrer or url_for('home'))
 
@@ -417,7 +2321,6 @@ def farmer_login():
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM farmers WHERE name = ? AND password = ?', (name, password))
         farmer = cursor.fetchone()
-        conn.close()
         if farmer:
             session['farmer_id'] = farmer['id']
             session['farmer_name'] = farmer['name']
@@ -445,12 +2348,10 @@ def farmer_register():
         cursor.execute('SELECT * FROM farmers WHERE name = ?', (name,))
         if cursor.fetchone():
             flash('Farmer with this name already exists!', 'danger')
-            conn.close()
             return render_template('farmer_register.html')
         cursor.execute('''INSERT INTO farmers (name, password, location, phone, address, district, state, pincode) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
                       (name, password, location, phone, address, district, state, pincode))
         conn.commit()
-        conn.close()
         flash('Registration successful! Please login.', 'success')
         return redirect(url_for('farmer_login'))
     return render_template('farmer_register.html')
@@ -470,7 +2371,6 @@ def customer_login():
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM customers WHERE email = ? AND password = ?', (email, password))
         customer = cursor.fetchone()
-        conn.close()
         if customer:
             session['customer_id'] = customer['id']
             session['customer_name'] = customer['name']
@@ -498,12 +2398,10 @@ def customer_register():
         cursor.execute('SELECT * FROM customers WHERE email = ?', (email,))
         if cursor.fetchone():
             flash('Email already registered!', 'danger')
-            conn.close()
             return render_template('customer_register.html')
         cursor.execute('''INSERT INTO customers (name, email, password, phone, address, city, state, pincode) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
                       (name, email, password, phone, address, city, state, pincode))
         conn.commit()
-        conn.close()
         flash('Registration successful! Please login.', 'success')
         return redirect(url_for('customer_login'))
     return render_template('customer_register.html')
@@ -518,23 +2416,17 @@ def customer_logout():
 @farmer_login_required
 def farmer_dashboard():
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM crops WHERE farmer_id = ? ORDER BY created_at DESC', (session['farmer_id'],))
-    crops = cursor.fetchall()
-    cursor.execute('SELECT crop_name, msp_price FROM msp ORDER BY crop_name')
-    msp_list = cursor.fetchall()
-    cursor.execute('''
-        SELECT o.*, c.crop_name, c.price as price_per_kg, cu.name as customer_name, cu.phone as customer_phone,
-               cu.address as delivery_address, cu.city, cu.state
-        FROM orders o JOIN crops c ON o.crop_id = c.id JOIN customers cu ON o.customer_id = cu.id
-        WHERE o.farmer_id = ? ORDER BY o.order_date DESC
-    ''', (session['farmer_id'],))
-    orders = cursor.fetchall()
-    pending_orders = [o for o in orders if o['status'] == 'Pending']
-    accepted_orders = [o for o in orders if o['status'] == 'Accepted']
-    conn.close()
-    return render_template('farmer_dashboard.html', crops=crops, msp_list=msp_list, orders=orders,
-                         pending_orders=pending_orders, accepted_orders=accepted_orders)
+    stream = stream_requested()
+    crops_cursor, limit = get_page_args('crops_cursor')
+    crops, crops_next_cursor = farmer_crops_page(conn, session['farmer_id'], crops_cursor, limit, stream)
+    # Only the summary and the first page of pending orders are rendered; further pending pages, the
+    # accepted orders and the delivered and rejected history load on demand from the order_sections URLs
+    pending_orders, pending_next_cursor = farmer_orders_page(conn, session['farmer_id'], 'Pending', limit=limit)
+    order_sections = {status: url_for('api_farmer_orders', status=status) for status in ORDER_STATUSES}
+    return render_page('farmer_dashboard.html', stream, crops=crops, msp_list=msp_cache.rows(),
+                       pending_orders=pending_orders, pending_next_cursor=pending_next_cursor,
+                       order_stats=farmer_order_stats(conn, session['farmer_id']), order_sections=order_sections,
+                       crops_next_cursor=crops_next_cursor)
 
 @app.route('/add_crop', methods=['POST'])
 @farmer_login_required
@@ -550,13 +2442,27 @@ def add_crop():
     cursor.execute('INSERT INTO crops (farmer_id, crop_name, quantity, price, location, msp_price, msp_status) VALUES (?, ?, ?, ?, ?, ?, ?)',
                   (session['farmer_id'], crop_name, quantity, price, location, msp_price, msp_status))
     conn.commit()
-    conn.close()
     if msp_status == "Below MSP":
         flash(f'Crop added! ⚠️ Warning: Your price (₹{price}/kg) is below MSP (₹{msp_price}/kg)', 'warning')
     else:
         flash(f'Crop added successfully! ✅ Your price is at or above MSP.', 'success')
     return redirect(url_for('farmer_dashboard'))
 
+@app.route('/farmer/crops/import', methods=['POST'])
+@api_login_required('farmer_id')
+def import_crops():
+    upload = request.files.get('file')
+    if upload is None:
+        abort(400, description='Upload a CSV or NDJSON file as "file"')
+    file_format = request.args.get('format') or IMPORT_FORMATS.get(os.path.splitext(upload.filename or '')[1].lower())
+    if file_format not in IMPORT_FORMATS.values():
+        abort(400, description='Unsupported format; use .csv, .ndjson or ?format=')
+    report = import_listings(get_db(), session['farmer_id'], read_import_records(upload.stream, file_format),
+                             session.get('farmer_location'))
+    imported = sum(entry['ok'] for entry in report)
+    complete = not (report and report[-1].get('stopped'))
+    return jsonify({'imported': imported, 'rejected': len(report) - imported, 'complete': complete, 'rows': report})
+
 @app.route('/delete_crop/<int:crop_id>')
 @farmer_login_required
 def delete_crop(crop_id):
@@ -564,44 +2470,65 @@ def delete_crop(crop_id):
     cursor = conn.cursor()
     cursor.execute('DELETE FROM crops WHERE id = ? AND farmer_id = ?', (crop_id, session['farmer_id']))
     conn.commit()
-    conn.close()
     flash('Crop listing deleted.', 'info')
     return redirect(url_for('farmer_dashboard'))
 
+ORDER_ACTION_MESSAGES = {
+    'accept': ('Order accepted!', 'success'),
+    'reject': ('Order rejected!', 'info'),
+    'deliver': ('Order marked as delivered!', 'success'),
+}
+
+def flash_order_result(action, result):
+    if result['ok']:
+        flash(*ORDER_ACTION_MESSAGES[action])
+    elif result['error'] == 'not_found':
+        flash('Order not found', 'danger')
+    else:
+        flash(f'Order is already {result["status"].lower()}', 'warning')
+
 @app.route('/farmer/order/<int:order_id>/<action>')
 @farmer_login_required
 def manage_order(order_id, action):
     if action not in ['accept', 'reject']:
         flash('Invalid action', 'danger')
         return redirect(url_for('farmer_dashboard'))
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM orders WHERE id = ? AND farmer_id = ?', (order_id, session['farmer_id']))
-    order = cursor.fetchone()
-    if not order:
-        flash('Order not found', 'danger')
-        conn.close()
-        return redirect(url_for('farmer_dashboard'))
-    new_status = 'Accepted' if action == 'accept' else 'Rejected'
-    cursor.execute('UPDATE orders SET status = ?, status_updated_at = ? WHERE id = ?',
-                  (new_status, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), order_id))
-    if action == 'reject':
-        cursor.execute('UPDATE crops SET quantity = quantity + ? WHERE id = ?', (order['quantity'], order['crop_id']))
-    conn.commit()
-    conn.close()
-    flash(f'Order {new_status.lower()}!', 'success' if action == 'accept' else 'info')
+    result, = apply_order_action(get_db(), session['farmer_id'], action, [order_id])
+    flash_order_result(action, result)
     return redirect(url_for('farmer_dashboard'))
 
 @app.route('/farmer/order/<int:order_id>/deliver')
 @farmer_login_required
 def deliver_order(order_id):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('UPDATE orders SET status = ?, status_updated_at = ? WHERE id = ? AND farmer_id = ?',
-                  ('Delivered', datetime.now().strftime('%Y-%m-%d %H:%M:%S'), order_id, session['farmer_id']))
-    conn.commit()
-    conn.close()
-    flash('Order marked as delivered!', 'success')
+    result, = apply_order_action(get_db(), session['farmer_id'], 'deliver', [order_id])
+    flash_order_result('deliver', result)
+    return redirect(url_for('farmer_dashboard'))
+
+@app.route('/farmer/orders/batch', methods=['POST'])
+@api_login_required('farmer_id')
+def batch_order_action():
+    if request.is_json:
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            abort(400, description='Send a JSON object with "action" and "order_ids"')
+        action, order_ids = payload.get('action'), payload.get('order_ids')
+        # bool is an int subclass, and floats or strings would be truncated or split by int()
+        valid = isinstance(order_ids, list) and all(type(order_id) is int for order_id in order_ids)
+    else:
+        action, order_ids = request.form.get('action'), request.form.getlist('order_ids')
+        valid = all(order_id.isascii() and order_id.isdigit() for order_id in order_ids)
+    if action not in ORDER_ACTIONS:
+        abort(400, description='Unknown order action')
+    if not valid:
+        abort(400, description='order_ids must be a list of integer order ids')
+    order_ids = [int(order_id) for order_id in order_ids]
+    if not order_ids or len(order_ids) > app.config['MAX_PAGE_SIZE']:
+        abort(400, description=f'Send between 1 and {app.config["MAX_PAGE_SIZE"]} order ids')
+    results = apply_order_action(get_db(), session['farmer_id'], action, order_ids)
+    if request.is_json or wants_json():
+        return jsonify({'action': action, 'results': results})
+    done = sum(result['ok'] for result in results)
+    flash(f'{done} of {len(results)} orders updated.', 'success' if done == len(results) else 'warning')
     return redirect(url_for('farmer_dashboard'))
 
 @app.route('/marketplace')
@@ -610,30 +2537,20 @@ def marketplace():
     cursor = conn.cursor()
     crop_filter = request.args.get('crop', '')
     location_filter = request.args.get('location', '')
-    query = '''SELECT c.*, f.name as farmer_name, f.phone as farmer_phone, f.address as farmer_address, f.district, f.state as farmer_state, f.pincode
-               FROM crops c JOIN farmers f ON c.farmer_id = f.id WHERE c.quantity > 0'''
-    params = []
-    if crop_filter:
-        query += ' AND LOWER(c.crop_name) LIKE LOWER(?)'
-        params.append(f'%{crop_filter}%')
-    if location_filter:
-        query += ' AND LOWER(c.location) LIKE LOWER(?)'
-        params.append(f'%{location_filter}%')
-    query += ' ORDER BY c.created_at DESC'
-    cursor.execute(query, params)
-    crops = cursor.fetchall()
-    cursor.execute('SELECT DISTINCT location FROM crops')
-    locations = cursor.fetchall()
-    cursor.execute('SELECT DISTINCT crop_name FROM crops')
-    crop_names = cursor.fetchall()
+    sort = request.args.get('sort', 'newest')
+    stream = stream_requested()
+    page_cursor, limit = get_page_args()
+    near = get_near_args()
+    crops, next_cursor = marketplace_page(conn, crop_filter, location_filter, sort, page_cursor, limit, near=near,
+                                          stream=stream)
+    locations = get_facets(conn, 'location')
+    crop_names = get_facets(conn, 'crop_name')
     cart_count = 0
     if session.get('customer_id'):
-        cursor.execute('SELECT SUM(quantity) as count FROM cart WHERE customer_id = ?', (session['customer_id'],))
-        result = cursor.fetchone()
-        cart_count = result['count'] if result['count'] else 0
-    conn.close()
-    return render_template('marketplace.html', crops=crops, locations=locations, crop_names=crop_names,
-                         selected_crop=crop_filter, selected_location=location_filter, cart_count=cart_count)
+        cart_count = get_cart_summary(conn, session['customer_id'])['total_quantity']
+    return render_page('marketplace.html', stream, crops=crops, locations=locations, crop_names=crop_names,
+                       selected_crop=crop_filter, selected_location=location_filter, selected_sort=sort,
+                       cart_count=cart_count, next_cursor=next_cursor)
 
 @app.route('/cart/add/<int:crop_id>', methods=['POST'])
 @customer_login_required
@@ -645,16 +2562,11 @@ def add_to_cart(crop_id):
     crop = cursor.fetchone()
     if not crop:
         flash('Crop not available or insufficient quantity', 'danger')
-        conn.close()
         return redirect(url_for('marketplace'))
-    cursor.execute('SELECT * FROM cart WHERE customer_id = ? AND crop_id = ?', (session['customer_id'], crop_id))
-    existing = cursor.fetchone()
-    if existing:
-        cursor.execute('UPDATE cart SET quantity = quantity + ? WHERE id = ?', (quantity, existing['id']))
-    else:
-        cursor.execute('INSERT INTO cart (customer_id, crop_id, quantity) VALUES (?, ?, ?)', (session['customer_id'], crop_id, quantity))
+    cursor.execute('''INSERT INTO cart (customer_id, crop_id, quantity) VALUES (?, ?, ?)
+                      ON CONFLICT (customer_id, crop_id) DO UPDATE SET quantity = quantity + excluded.quantity''',
+                  (session['customer_id'], crop_id, quantity))
     conn.commit()
-    conn.close()
     flash(f'Added {quantity} kg to cart!', 'success')
     return redirect(url_for('marketplace'))
 
@@ -669,7 +2581,6 @@ def view_cart():
                   (session['customer_id'],))
     cart_items = cursor.fetchall()
     total = sum(item['quantity'] * item['price_per_kg'] for item in cart_items)
-    conn.close()
     return render_template('cart.html', cart_items=cart_items, total=total)
 
 @app.route('/cart/remove/<int:cart_id>')
@@ -679,7 +2590,6 @@ def remove_from_cart(cart_id):
     cursor = conn.cursor()
     cursor.execute('DELETE FROM cart WHERE id = ? AND customer_id = ?', (cart_id, session['customer_id']))
     conn.commit()
-    conn.close()
     flash('Item removed from cart', 'info')
     return redirect(url_for('view_cart'))
 
@@ -694,7 +2604,6 @@ def update_cart(cart_id):
     else:
         cursor.execute('UPDATE cart SET quantity = ? WHERE id = ? AND customer_id = ?', (quantity, cart_id, session['customer_id']))
     conn.commit()
-    conn.close()
     return redirect(url_for('view_cart'))
 
 @app.route('/checkout', methods=['GET', 'POST'])
@@ -708,46 +2617,37 @@ def checkout():
     cart_items = cursor.fetchall()
     if not cart_items:
         flash('Your cart is empty!', 'warning')
-        conn.close()
         return redirect(url_for('marketplace'))
     cursor.execute('SELECT * FROM customers WHERE id = ?', (session['customer_id'],))
     customer = cursor.fetchone()
     if request.method == 'POST':
         delivery_address = request.form.get('address')
         delivery_phone = request.form.get('phone')
-        for item in cart_items:
-            if item['quantity'] > item['available_qty']:
-                flash(f'Not enough {item["crop_name"]} available', 'danger')
-                continue
-            total_price = item['quantity'] * item['price']
-            cursor.execute('''INSERT INTO orders (customer_id, crop_id, farmer_id, quantity, total_price, status, order_date, customer_address, customer_phone)
-                             VALUES (?, ?, ?, ?, ?, 'Pending', ?, ?, ?)''',
-                          (session['customer_id'], item['crop_id'], item['farmer_id'], item['quantity'], total_price,
-                           datetime.now().strftime('%Y-%m-%d %H:%M:%S'), delivery_address, delivery_phone))
-            cursor.execute('UPDATE crops SET quantity = quantity - ? WHERE id = ?', (item['quantity'], item['crop_id']))
-        cursor.execute('DELETE FROM cart WHERE customer_id = ?', (session['customer_id'],))
-        conn.commit()
-        conn.close()
-        flash('Orders placed successfully! You can track them in My Orders.', 'success')
-        return redirect(url_for('customer_orders'))
+        results = place_orders(conn, session['customer_id'], [dict(item) for item in cart_items],
+                               delivery_address, delivery_phone, from_cart=True)
+        placed = [result for result in results if result['ok']]
+        if wants_json():
+            return jsonify({'results': results})
+        for result in results:
+            if not result['ok']:
+                flash(f'Not enough {result["crop_name"]} available', 'danger')
+        if placed:
+            flash('Orders placed successfully! You can track them in My Orders.', 'success')
+        return redirect(url_for('customer_orders') if placed else url_for('view_cart'))
     total = sum(item['quantity'] * item['price'] for item in cart_items)
-    conn.close()
     return render_template('checkout.html', cart_items=cart_items, total=total, customer=customer)
 
 @app.route('/customer/orders')
 @customer_login_required
 def customer_orders():
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''SELECT o.*, c.crop_name, c.price as price_per_kg, o.total_price as total_amount,
-                      f.name as farmer_name, f.phone as farmer_phone,
-                      f.address as farmer_address, f.district as farmer_district, 
-                      f.state as farmer_state, f.pincode as farmer_pincode
-                      FROM orders o JOIN crops c ON o.crop_id = c.id JOIN farmers f ON o.farmer_id = f.id
-                      WHERE o.customer_id = ? ORDER BY o.order_date DESC''', (session['customer_id'],))
-    orders = cursor.fetchall()
-    conn.close()
-    return render_template('customer_orders.html', orders=orders)
+    stream = stream_requested()
+    page_cursor, limit = get_page_args()
+    include_archived = include_archived_arg()
+    orders, next_cursor = customer_orders_page(conn, session['customer_id'], page_cursor, limit, include_archived,
+                                               stream)
+    return render_page('customer_orders.html', stream, orders=orders, next_cursor=next_cursor,
+                       include_archived=include_archived)
 
 @app.route('/order/<int:crop_id>', methods=['GET', 'POST'])
 def order_crop(crop_id):
@@ -765,67 +2665,168 @@ def order_crop(crop_id):
             flash('Please login to place an order', 'warning')
             return redirect(url_for('customer_login'))
         quantity = int(request.form.get('quantity'))
-        if quantity > crop['quantity']:
+        cursor.execute('SELECT * FROM customers WHERE id = ?', (session['customer_id'],))
+        customer = cursor.fetchone()
+        result, = place_orders(conn, session['customer_id'], [{'crop_id': crop_id, 'quantity': quantity}],
+                               customer['address'], customer['phone'])
+        if not result['ok']:
             flash('Requested quantity exceeds available stock!', 'danger')
         else:
-            total_price = quantity * crop['price']
-            cursor.execute('SELECT * FROM customers WHERE id = ?', (session['customer_id'],))
-            customer = cursor.fetchone()
-            cursor.execute('''INSERT INTO orders (customer_id, crop_id, farmer_id, quantity, total_price, status, order_date, customer_address, customer_phone)
-                             VALUES (?, ?, ?, ?, ?, 'Pending', ?, ?, ?)''',
-                          (session['customer_id'], crop_id, crop['farmer_id'], quantity, total_price,
-                           datetime.now().strftime('%Y-%m-%d %H:%M:%S'), customer['address'], customer['phone']))
-            cursor.execute('UPDATE crops SET quantity = quantity - ? WHERE id = ?', (quantity, crop_id))
-            conn.commit()
             flash('🎉 Order placed successfully! The farmer will review your order.', 'success')
-            conn.close()
             return redirect(url_for('customer_orders'))
-    conn.close()
     return render_template('order.html', crop=crop)
 
 @app.route('/order/success')
 def order_success():
     return render_template('order_success.html')
 
+@app.route('/farmer/events')
+@api_login_required('farmer_id')
+def farmer_events():
+    return event_response([farmer_topic(session['farmer_id'])])
+
+@app.route('/customer/events')
+@api_login_required('customer_id')
+def customer_events():
+    return event_response([customer_topic(session['customer_id'])])
+
 @app.route('/schemes')
 def schemes():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM schemes')
-    schemes_list = cursor.fetchall()
-    conn.close()
-    return render_template('schemes.html', schemes=schemes_list)
+    def render():
+        schemes_list = get_db().execute('SELECT * FROM schemes').fetchall()
+        return render_template('schemes.html', schemes=schemes_list)
+    return cached_page(get_table_stamp(get_db(), 'schemes'), render)
 
 @app.route('/msp')
 def msp_info():
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM msp ORDER BY crop_name')
-    msp_list = cursor.fetchall()
-    conn.close()
-    return render_template('msp_info.html', msp_list=msp_list)
+    return cached_page(msp_cache.stamp(), lambda: render_template('msp_info.html', msp_list=msp_cache.rows()))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/analytics/prices')
+def api_price_analytics():
+    group_by = request.args.get('group_by', 'crop')
+    if group_by not in ANALYTICS_GROUPINGS:
+        abort(400, description='group_by must be one of: ' + ', '.join(ANALYTICS_GROUPINGS))
+    version, groups = price_analytics.stats(group_by)
+    etag = f'prices-{version}'
+    if not_modified(etag, None):
+        return revalidate(Response(status=304), etag, None, 'no-cache')
+    filters = {dimension: request.args[dimension].casefold()
+               for dimension in ANALYTICS_GROUPINGS[group_by] if request.args.get(dimension)}
+    if filters:
+        groups = [group for group in groups
+                  if all(group[dimension].casefold() == value for dimension, value in filters.items())]
+    payload = {'group_by': group_by, 'engine': 'numpy' if numpy is not None else 'python', 'groups': groups}
+    return revalidate(json_response(payload), etag, None, 'no-cache')
+
+@app.route('/debug/slow-queries')
+def slow_queries():
+    if app.config['SLOW_QUERY_MS'] is None:
+        abort(404)
+    full_scan = request.args.get('full_scan')
+    entries = slow_query_log.entries(request.args.get('min_ms', 0, type=float), request.args.get('endpoint'),
+                                     None if full_scan is None else full_scan in ('1', 'true'))
+    return json_response({'threshold_ms': app.config['SLOW_QUERY_MS'], 'entries': entries})
 
 @app.route('/api/msp/<crop_name>')
 def api_msp(crop_name):
-    msp_price = get_msp_price(crop_name)
-    if msp_price:
-        return {'crop': crop_name, 'msp_price': msp_price, 'status': 'found'}
-    return {'crop': crop_name, 'msp_price': None, 'status': 'not_found'}
+    version, last_modified = msp_cache.stamp()
+    etag = f'msp-{version}'
+    if not_modified(etag, last_modified):
+        response = Response(status=304)
+    else:
+        msp_price = get_msp_price(crop_name)
+        if msp_price:
+            response = jsonify({'crop': crop_name, 'msp_price': msp_price, 'status': 'found'})
+        else:
+            response = jsonify({'crop': crop_name, 'msp_price': None, 'status': 'not_found'})
+    return revalidate(response, etag, last_modified, 'no-cache')
+
+@app.route('/api/marketplace')
+def api_marketplace():
+    page_cursor, limit = get_page_args()
+    fields = None
+    if request.args.get('fields'):
+        fields = list(dict.fromkeys(name.strip() for name in request.args['fields'].split(',') if name.strip()))
+        if not fields:
+            abort(400, description='fields must name at least one field')
+        unknown = [name for name in fields if name not in MARKETPLACE_FIELDS]
+        if unknown:
+            abort(400, description='Unknown fields: ' + ', '.join(unknown))
+    near = get_near_args()
+    sort = request.args.get('sort', 'distance' if near else 'newest')
+    rows, next_cursor = marketplace_page(get_db(), request.args.get('crop', ''), request.args.get('location', ''),
+                                         sort, page_cursor, limit, fields, near)
+    if near and fields is not None:
+        fields = [*fields, 'distance_km']
+    return page_json(rows, next_cursor, fields)
+
+@app.route('/api/marketplace/changes')
+def api_marketplace_changes():
+    """Listings inserted, updated and deleted since ?since=<version>, gzip-compressed when the client allows"""
+    since = get_since_arg('since must be a version number')
+    _, limit = get_page_args()
+    return gzip_response(json_response(marketplace_changes(get_db(), since, limit)))
+
+@app.route('/api/farmer/crops')
+@api_login_required('farmer_id')
+def api_farmer_crops():
+    page_cursor, limit = get_page_args()
+    return page_json(*farmer_crops_page(get_db(), session['farmer_id'], page_cursor, limit))
+
+@app.route('/api/farmer/orders')
+@api_login_required('farmer_id')
+def api_farmer_orders():
+    page_cursor, limit = get_page_args()
+    status = request.args.get('status')
+    if status and status not in ORDER_STATUSES:
+        abort(400, description='Unknown order status')
+    return page_json(*farmer_orders_page(get_db(), session['farmer_id'], status, page_cursor, limit,
+                                         include_archived_arg()))
+
+@app.route('/api/farmer/orders/summary')
+@api_login_required('farmer_id')
+def api_farmer_order_summary():
+    return jsonify(farmer_order_stats(get_db(), session['farmer_id']))
+
+@app.route('/api/customer/orders')
+@api_login_required('customer_id')
+def api_customer_orders():
+    page_cursor, limit = get_page_args()
+    return page_json(*customer_orders_page(get_db(), session['customer_id'], page_cursor, limit,
+                                           include_archived_arg()))
+
+@app.route('/api/orders/changes')
+def api_order_changes():
+    """Order events after ?since=<event id> for the logged-in farmer or customer, oldest first"""
+    if 'farmer_id' not in session and 'customer_id' not in session:
+        return jsonify({'error': 'login required'}), 401
+    since = get_since_arg('since must be an event id')
+    _, limit = get_page_args()
+    events, has_more = order_changes(get_db(), since, limit, session.get('farmer_id'), session.get('customer_id'))
+    return json_response({'events': events, 'since': events[-1]['id'] if events else since, 'has_more': has_more})
 
 @app.route('/api/cart/count')
 def api_cart_count():
     if 'customer_id' not in session:
         return {'count': 0}
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT SUM(quantity) as count FROM cart WHERE customer_id = ?', (session['customer_id'],))
-    result = cursor.fetchone()
-    conn.close()
-    return {'count': result['count'] if result['count'] else 0}
+    summary = get_cart_summary(get_db(), session['customer_id'])
+    etag = f"cart-{session['customer_id']}-{summary['version']}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify({'count': summary['total_quantity'], 'items': summary['item_count'],
+                            'total_price': summary['total_price']})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 if __name__ == '__main__':
     init_db()
     print("🌾 KisanBazaar MVP Server Starting...")
     print("📍 Access at: http://localhost:5000")
-    print("🌐 Languages: English, Hindi, Telugu")
+    print("🌐 Languages: " + ', '.join(catalog['language_name'] for catalog in TRANSLATIONS.values()))
     app.run(debug=True, port=5000)
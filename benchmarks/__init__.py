@@ -0,0 +1,20 @@
+"""
+KisanBazaar route benchmarks
+Seeds a database of configurable size, drives the Flask routes through
+app.test_client() from several threads and reports latency per route as JSON.
+
+    python -m benchmarks --listings 20000 --threads 8 --output bench.json
+    python -m benchmarks --baseline bench.json
+    python -m benchmarks.datagen large.db --listings 2000000 --orders 5000000
+"""
+
+from benchmarks.runner import SCENARIOS, compare_results, run_benchmark
+
+__all__ = ['SCENARIOS', 'compare_results', 'generate', 'run_benchmark']
+
+def __getattr__(name):
+    # Imported on first use so that `python -m benchmarks.datagen` runs a module the package has not loaded yet
+    if name == 'generate':
+        from benchmarks.datagen import generate
+        return generate
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,55 @@
+"""
+Command line entry point: python -m benchmarks --help
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.runner import SCENARIOS, compare_results, run_benchmark
+from benchmarks.datagen import generate
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark KisanBazaar routes')
+    parser.add_argument('--database', default=os.path.join(tempfile.gettempdir(), 'kisanbazaar_bench.db'),
+                        help='benchmark database file (replaced unless --no-seed)')
+    parser.add_argument('--no-seed', action='store_true', help='reuse the existing database as-is')
+    parser.add_argument('--farmers', type=int, default=50)
+    parser.add_argument('--customers', type=int, default=100)
+    parser.add_argument('--listings', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=4000)
+    parser.add_argument('--days', type=int, default=365, help='history span for listings and orders')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--routes', help='comma-separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='JSON report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='fractional p95/throughput change counted as a regression (default 0.10)')
+    args = parser.parse_args(argv)
+
+    if not args.no_seed:
+        generate(args.database, args.farmers, args.customers, args.listings, args.orders, args.seed, args.days)
+    routes = args.routes.split(',') if args.routes else None
+    report = run_benchmark(args.database, args.threads, args.requests, routes, args.seed)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['comparison'] = compare_results(report, json.load(f), args.threshold)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    regressed = [name for name, change in report.get('comparison', {}).items() if change['regressed']]
+    if regressed:
+        print('Regressed routes: ' + ', '.join(regressed), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""
+Synthetic dataset generator
+Bulk-loads realistic farmers, customers, listings, carts and orders into a
+KisanBazaar database. Output is fully determined by --seed, so benchmarks and
+query-plan checks see the same data on every run.
+
+    python -m benchmarks.datagen kisanbazaar_large.db --listings 2000000 --orders 5000000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta
+
+import app as app_module
+
+# State -> [(district, first three pincode digits)]
+REGIONS = {
+    'Punjab': [('Ludhiana', 141), ('Amritsar', 143), ('Jalandhar', 144), ('Patiala', 147), ('Bathinda', 151)],
+    'Haryana': [('Karnal', 132), ('Hisar', 125), ('Rohtak', 124), ('Ambala', 133)],
+    'Uttar Pradesh': [('Lucknow', 226), ('Agra', 282), ('Varanasi', 221), ('Meerut', 250), ('Gorakhpur', 273)],
+    'Bihar': [('Patna', 800), ('Gaya', 823), ('Muzaffarpur', 842), ('Bhagalpur', 812)],
+    'Madhya Pradesh': [('Indore', 452), ('Bhopal', 462), ('Jabalpur', 482), ('Ujjain', 456)],
+    'Rajasthan': [('Jaipur', 302), ('Jodhpur', 342), ('Kota', 324), ('Bikaner', 334)],
+    'Gujarat': [('Ahmedabad', 380), ('Rajkot', 360), ('Surat', 395), ('Anand', 388)],
+    'Maharashtra': [('Nashik', 422), ('Pune', 411), ('Nagpur', 440), ('Aurangabad', 431), ('Kolhapur', 416)],
+    'Karnataka': [('Belagavi', 590), ('Mysuru', 570), ('Dharwad', 580), ('Raichur', 584)],
+    'Telangana': [('Hyderabad', 500), ('Warangal', 506), ('Karimnagar', 505), ('Nizamabad', 503)],
+    'Andhra Pradesh': [('Guntur', 522), ('Vijayawada', 520), ('Kurnool', 518), ('Kakinada', 533)],
+    'Tamil Nadu': [('Thanjavur', 613), ('Coimbatore', 641), ('Madurai', 625), ('Salem', 636)],
+    'West Bengal': [('Bardhaman', 713), ('Nadia', 741), ('Hooghly', 712), ('Murshidabad', 742)],
+    'Odisha': [('Cuttack', 753), ('Sambalpur', 768), ('Ganjam', 761)],
+}
+# Rough share of farmers per state
+STATE_WEIGHTS = {
+    'Uttar Pradesh': 16, 'Bihar': 9, 'Maharashtra': 10, 'Madhya Pradesh': 8, 'Rajasthan': 7, 'Punjab': 6,
+    'Haryana': 5, 'Gujarat': 6, 'Karnataka': 6, 'Telangana': 5, 'Andhra Pradesh': 6, 'Tamil Nadu': 6,
+    'West Bengal': 7, 'Odisha': 3,
+}
+# Relative frequency of listings per crop; crops missing here are listed rarely
+CROP_WEIGHTS = {'Rice': 20, 'Wheat': 18, 'Onion': 10, 'Potato': 10, 'Tomato': 10, 'Maize': 6, 'Cotton': 4,
+                'Soyabean': 4, 'Groundnut': 3, 'Tur (Arhar)': 3, 'Moong': 2, 'Urad': 2, 'Sugarcane': 3}
+FIRST_NAMES = ['Rajesh', 'Suresh', 'Lakshmi', 'Ramesh', 'Sunita', 'Anil', 'Geeta', 'Mahesh', 'Kavita', 'Vijay',
+               'Savitri', 'Harpreet', 'Gurpreet', 'Venkatesh', 'Padma', 'Arjun', 'Meena', 'Manoj', 'Rekha', 'Prakash',
+               'Anjali', 'Sanjay', 'Pooja', 'Ravi', 'Shanti', 'Mohan', 'Usha', 'Dinesh', 'Kamala', 'Srinivas']
+SURNAMES = ['Kumar', 'Patel', 'Devi', 'Singh', 'Sharma', 'Yadav', 'Reddy', 'Naidu', 'Gowda', 'Patil',
+            'Jadhav', 'Das', 'Mondal', 'Sahu', 'Verma', 'Chauhan', 'Rao', 'Pillai', 'Iyer', 'Mishra']
+# Share of each order status by order age: recent orders are mostly still open
+STATUS_MIX_RECENT = (('Pending', 45), ('Accepted', 35), ('Rejected', 10), ('Delivered', 10))
+STATUS_MIX_OLD = (('Pending', 2), ('Accepted', 5), ('Rejected', 13), ('Delivered', 80))
+RECENT_DAYS = 14
+
+# Durability is pointless while generating a throwaway dataset
+BULK_LOAD_PRAGMAS = (
+    ('journal_mode', 'MEMORY'),
+    ('synchronous', 'OFF'),
+    ('cache_size', -262144),
+    ('temp_store', 'MEMORY'),
+    ('locking_mode', 'EXCLUSIVE'),
+)
+BATCH_SIZE = 50000
+
+def weighted(rng, choices):
+    values, weights = zip(*choices.items()) if isinstance(choices, dict) else zip(*choices)
+    return lambda: rng.choices(values, weights)[0]
+
+def timestamp(moment):
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class Generator:
+    """Streams rows for one dataset; every random choice comes from a single seeded RNG"""
+
+    def __init__(self, msp, seed=42, days=365, end=datetime(2025, 6, 30, 18, 0, 0)):
+        self.rng = random.Random(seed)
+        self.msp = msp
+        self.days = days
+        self.end = end
+        self.start = end - timedelta(days=days)
+        self.pick_state = weighted(self.rng, STATE_WEIGHTS)
+        self.pick_crop = weighted(self.rng, {name: CROP_WEIGHTS.get(name, 1) for name in msp})
+        # Per-listing columns kept compactly for order generation
+        self.listing_farmer = array('l')
+        self.listing_price = array('l')
+        self.listing_created = array('d')
+
+    def moment(self, not_before=None):
+        start = not_before or self.start
+        return start + (self.end - start) * self.rng.random()
+
+    def person(self, index):
+        return f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(SURNAMES)} {index}'
+
+    def place(self):
+        state = self.pick_state()
+        district, prefix = self.rng.choice(REGIONS[state])
+        return state, district, f'{prefix}{self.rng.randint(0, 999):03d}'
+
+    def farmers(self, count):
+        self.farmer_districts = []
+        for i in range(1, count + 1):
+            state, district, pincode = self.place()
+            self.farmer_districts.append(district)
+            yield (i, self.person(i), 'farmer123', district, f'9{self.rng.randint(100000000, 999999999)}',
+                   f'Village {self.rng.randint(1, 400)}, {district}', district, state, pincode)
+
+    def customers(self, count):
+        for i in range(1, count + 1):
+            state, district, pincode = self.place()
+            name = self.person(i)
+            email = f"{name.split()[0].lower()}.{name.split()[1].lower()}{i}@example.com"
+            yield (i, name, email, 'customer123', f'8{self.rng.randint(100000000, 999999999)}',
+                   f'House {self.rng.randint(1, 999)}, {district}', district, state, pincode)
+
+    def listings(self, count, farmer_count):
+        for i in range(1, count + 1):
+            farmer_id = self.rng.randint(1, farmer_count)
+            crop_name = self.pick_crop()
+            msp_price = self.msp[crop_name]
+            # Most sellers price a little above MSP; roughly a fifth undercut it
+            price = max(1, round(msp_price * self.rng.lognormvariate(0.08, 0.15)))
+            quantity = 0 if self.rng.random() < 0.1 else self.rng.randint(50, 5000)
+            created = self.moment()
+            self.listing_farmer.append(farmer_id)
+            self.listing_price.append(price)
+            self.listing_created.append(created.timestamp())
+            yield (i, farmer_id, crop_name, quantity, price, self.farmer_districts[farmer_id - 1], msp_price,
+                   app_module.compare_with_msp(price, msp_price), timestamp(created))
+
+    def orders(self, count, customer_count):
+        listing_count = len(self.listing_price)
+        recent = self.end - timedelta(days=RECENT_DAYS)
+        pick_recent = weighted(self.rng, STATUS_MIX_RECENT)
+        pick_old = weighted(self.rng, STATUS_MIX_OLD)
+        for i in range(1, count + 1):
+            crop_index = self.rng.randrange(listing_count)
+            quantity = self.rng.randint(5, 200)
+            ordered = self.moment(datetime.fromtimestamp(self.listing_created[crop_index]))
+            status = pick_recent() if ordered >= recent else pick_old()
+            updated = None if status == 'Pending' else timestamp(min(self.end, ordered + timedelta(hours=self.rng.randint(1, 96))))
+            yield (i, self.rng.randint(1, customer_count), crop_index + 1, self.listing_farmer[crop_index], quantity,
+                   quantity * self.listing_price[crop_index], status, timestamp(ordered), updated,
+                   'Delivery address', '9000000000')
+
+    def cart_lines(self, customer_count, share=0.3):
+        listing_count = len(self.listing_price)
+        recent = self.end - timedelta(days=RECENT_DAYS)
+        for customer_id in range(1, customer_count + 1):
+            if self.rng.random() >= share:
+                continue
+            for crop_index in self.rng.sample(range(listing_count), min(listing_count, self.rng.randint(1, 4))):
+                yield (customer_id, crop_index + 1, self.rng.randint(1, 50), timestamp(self.moment(recent)))
+
+def generate(path, farmers=1000, customers=5000, listings=20000, orders=50000, seed=42, days=365, progress=None):
+    """Create a fresh database at `path` and fill it; returns the number of rows written per table"""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    for pragma, value in BULK_LOAD_PRAGMAS:
+        conn.execute(f'PRAGMA {pragma} = {value}')
+    app_module.migrate(conn)
+    app_module.seed_reference_data(conn)
+    conn.commit()
+
+    # Row-by-row triggers would dominate the load; drop them and rebuild their tables once at the end
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for trigger in triggers:
+        conn.execute(f'DROP TRIGGER {trigger["name"]}')
+
+    msp = {row['crop_name']: row['msp_price'] for row in conn.execute('SELECT crop_name, msp_price FROM msp')}
+    generator = Generator(msp, seed, days)
+    tables = [
+        ('farmers', '(id, name, password, location, phone, address, district, state, pincode)',
+         generator.farmers(farmers)),
+        ('customers', '(id, name, email, password, phone, address, city, state, pincode)',
+         generator.customers(customers)),
+        ('crops', '(id, farmer_id, crop_name, quantity, price, location, msp_price, msp_status, created_at)',
+         generator.listings(listings, farmers)),
+        ('orders', '''(id, customer_id, crop_id, farmer_id, quantity, total_price, status, order_date,
+                       status_updated_at, customer_address, customer_phone)''',
+         generator.orders(orders, customers)),
+        ('cart', '(customer_id, crop_id, quantity, added_at)', generator.cart_lines(customers)),
+    ]
+    counts = {}
+    for table, columns, rows in tables:
+        placeholders = ', '.join('?' * (columns.count(',') + 1))
+        counts[table] = 0
+        for batch in batched(rows):
+            conn.executemany(f'INSERT INTO {table} {columns} VALUES ({placeholders})', batch)
+            counts[table] += len(batch)
+            if progress:
+                progress(table, counts[table])
+        conn.commit()
+
+    app_module.rebuild_derived_tables(conn)
+    for trigger in triggers:
+        conn.execute(trigger['sql'])
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA locking_mode = NORMAL')
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.close()
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.datagen', description='Generate a synthetic KisanBazaar dataset')
+    parser.add_argument('database', help='output database file (replaced if it exists)')
+    parser.add_argument('--farmers', type=int, default=1000)
+    parser.add_argument('--customers', type=int, default=5000)
+    parser.add_argument('--listings', type=int, default=20000)
+    parser.add_argument('--orders', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=365, help='history span for listings and orders')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    def progress(table, rows):
+        print(f'\r{table}: {rows:,} rows', end='', file=sys.stderr, flush=True)
+    counts = generate(args.database, args.farmers, args.customers, args.listings, args.orders, args.seed, args.days,
+                      progress)
+    print(file=sys.stderr)
+    summary = ', '.join(f'{rows:,} {table}' for table, rows in counts.items())
+    print(f'Wrote {summary} to {args.database} in {time.perf_counter() - started:.1f}s')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
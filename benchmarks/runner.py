@@ -0,0 +1,224 @@
+"""
+Benchmark runner
+Each scenario is driven from several threads at once through app.test_client();
+latency is measured around the request only, never around scenario setup.
+"""
+
+import queue
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+import app as app_module
+from app import app
+
+# ==================== FIXTURES ====================
+
+class Fixtures:
+    """Ids sampled from the seeded database that scenarios pick from"""
+
+    def __init__(self, database):
+        self.database = database
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(database, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        conn = self._conn
+        self.crop_ids = [row['id'] for row in conn.execute('SELECT id FROM crops WHERE quantity > 0')]
+        self.crop_names = [row['crop_name'] for row in conn.execute('SELECT crop_name FROM msp')]
+        self.locations = [row['location'] for row in conn.execute('SELECT DISTINCT location FROM crops')]
+        self.farmer_ids = [row['id'] for row in conn.execute('SELECT id FROM farmers')]
+        self.customer_ids = [row['id'] for row in conn.execute('SELECT id FROM customers')]
+        self.pending_orders = queue.Queue()
+        for row in conn.execute("SELECT id, farmer_id FROM orders WHERE status = 'Pending' ORDER BY id DESC"):
+            self.pending_orders.put((row['id'], row['farmer_id']))
+
+    def cart_line(self, customer_id):
+        with self._lock:
+            row = self._conn.execute('SELECT id FROM cart WHERE customer_id = ? ORDER BY id DESC LIMIT 1',
+                                     (customer_id,)).fetchone()
+        return row['id'] if row else None
+
+    def close(self):
+        self._conn.close()
+
+def login(client, **session_values):
+    with client.session_transaction() as sess:
+        sess.clear()
+        sess.update(session_values)
+
+# ==================== SCENARIOS ====================
+
+# A scenario performs any untimed setup and returns (method, url, request kwargs)
+# for the request being measured, or None when it has run out of work.
+
+def marketplace(client, rng, fixtures, worker):
+    return 'GET', '/marketplace', {}
+
+def marketplace_filtered(client, rng, fixtures, worker):
+    query = {'crop': rng.choice(fixtures.crop_names)[:3], 'location': rng.choice(fixtures.locations)}
+    return 'GET', '/marketplace?' + urlencode(query), {}
+
+def api_marketplace(client, rng, fixtures, worker):
+    return 'GET', '/api/marketplace?' + urlencode({'crop': rng.choice(fixtures.crop_names)[:3]}), {}
+
+def cart_add(client, rng, fixtures, worker):
+    login(client, customer_id=worker['customer_id'])
+    return 'POST', f'/cart/add/{rng.choice(fixtures.crop_ids)}', {'data': {'quantity': 1}}
+
+def cart_update(client, rng, fixtures, worker):
+    login(client, customer_id=worker['customer_id'])
+    client.post(f'/cart/add/{rng.choice(fixtures.crop_ids)}', data={'quantity': 1})
+    line_id = fixtures.cart_line(worker['customer_id'])
+    return 'POST', f'/cart/update/{line_id}', {'data': {'quantity': rng.randint(1, 5)}}
+
+def checkout(client, rng, fixtures, worker):
+    login(client, customer_id=worker['customer_id'])
+    client.post(f'/cart/add/{rng.choice(fixtures.crop_ids)}', data={'quantity': 1})
+    return 'POST', '/checkout', {'data': {'address': 'Benchmark Address', 'phone': '9000000000'},
+                                 'headers': {'Accept': 'application/json'}}
+
+def farmer_dashboard(client, rng, fixtures, worker):
+    login(client, farmer_id=rng.choice(fixtures.farmer_ids))
+    return 'GET', '/farmer/dashboard', {}
+
+def order_action(action):
+    def scenario(client, rng, fixtures, worker):
+        try:
+            order_id, farmer_id = fixtures.pending_orders.get_nowait()
+        except queue.Empty:
+            return None
+        login(client, farmer_id=farmer_id)
+        return 'GET', f'/farmer/order/{order_id}/{action}', {}
+    scenario.__name__ = f'order_{action}'
+    return scenario
+
+def api_msp(client, rng, fixtures, worker):
+    return 'GET', f'/api/msp/{rng.choice(fixtures.crop_names)}', {}
+
+def api_cart_count(client, rng, fixtures, worker):
+    login(client, customer_id=worker['customer_id'])
+    return 'GET', '/api/cart/count', {}
+
+SCENARIOS = {
+    'marketplace': marketplace,
+    'marketplace_filtered': marketplace_filtered,
+    'api_marketplace': api_marketplace,
+    'cart_add': cart_add,
+    'cart_update': cart_update,
+    'checkout': checkout,
+    'farmer_dashboard': farmer_dashboard,
+    'order_accept': order_action('accept'),
+    'order_reject': order_action('reject'),
+    'api_msp': api_msp,
+    'api_cart_count': api_cart_count,
+}
+
+# ==================== RUNNER ====================
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def rounded(value, digits=3):
+    return None if value is None else round(value, digits)
+
+def summarize(latencies, statuses, wall_seconds):
+    latencies_ms = sorted(seconds * 1000 for seconds in latencies)
+    errors = sum(count for status, count in statuses.items() if status == 'error' or int(status) >= 500)
+    return {
+        'requests': len(latencies_ms),
+        'errors': errors,
+        'status_codes': dict(sorted(statuses.items())),
+        'throughput_rps': rounded(len(latencies_ms) / wall_seconds if wall_seconds else None, 2),
+        'mean_ms': rounded(sum(latencies_ms) / len(latencies_ms) if latencies_ms else None),
+        'p50_ms': rounded(percentile(latencies_ms, 50)),
+        'p95_ms': rounded(percentile(latencies_ms, 95)),
+        'p99_ms': rounded(percentile(latencies_ms, 99)),
+    }
+
+def run_scenario(scenario, fixtures, threads, requests, seed):
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(index, count):
+        rng = random.Random(seed * 1000 + index)
+        state = {'customer_id': fixtures.customer_ids[index % len(fixtures.customer_ids)]}
+        client = app.test_client()
+        barrier.wait()
+        for _ in range(count):
+            prepared = scenario(client, rng, fixtures, state)
+            if prepared is None:
+                break
+            method, url, kwargs = prepared
+            started = time.perf_counter()
+            try:
+                status = str(client.open(url, method=method, **kwargs).status_code)
+            except Exception:
+                status = 'error'
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    counts = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(i, count)) for i, count in enumerate(counts)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+def run_benchmark(database, threads=4, requests=200, routes=None, seed=0):
+    """Run each route scenario in turn against `database`; returns a JSON-serializable report"""
+    routes = list(routes or SCENARIOS)
+    unknown = set(routes) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f'Unknown benchmark routes: {", ".join(sorted(unknown))}')
+    previous_database = app.config['DATABASE']
+    app.config['DATABASE'] = database
+    fixtures = Fixtures(database)
+    try:
+        report = {
+            'config': {'threads': threads, 'requests': requests, 'seed': seed,
+                       'listings': len(fixtures.crop_ids), 'farmers': len(fixtures.farmer_ids)},
+            'routes': {},
+        }
+        for name in routes:
+            report['routes'][name] = run_scenario(SCENARIOS[name], fixtures, threads, requests, seed)
+        return report
+    finally:
+        fixtures.close()
+        app.config['DATABASE'] = previous_database
+
+def compare_results(current, baseline, threshold=0.10):
+    """Per-route p95 and throughput change against a baseline report.
+
+    A route regresses when its p95 latency grows, or its throughput drops, by
+    more than `threshold` (a fraction).
+    """
+    comparison = {}
+    for name, result in current['routes'].items():
+        before = baseline.get('routes', {}).get(name)
+        if not before or not before.get('p95_ms') or not result.get('p95_ms'):
+            continue
+        p95_change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms']
+        throughput_change = ((result['throughput_rps'] - before['throughput_rps']) / before['throughput_rps']
+                             if before.get('throughput_rps') else 0.0)
+        comparison[name] = {
+            'p95_ms': [before['p95_ms'], result['p95_ms']],
+            'p95_change': round(p95_change, 4),
+            'throughput_rps': [before['throughput_rps'], result['throughput_rps']],
+            'throughput_change': round(throughput_change, 4),
+            'regressed': p95_change > threshold or throughput_change < -threshold,
+        }
+    return comparison
@@ -6,13 +6,18 @@ Tests all major functionality including authentication, CRUD operations, and ord
 import unittest
 import sys
 import os
+import gzip
+import re
+import json
+import math
 import sqlite3
 import tempfile
+import threading
 
 # Import after ensuring test environment
 os.environ['TESTING'] = 'True'
 
-from app import app, get_msp_price, compare_with_msp
+from app import app, get_msp_price, compare_with_msp, migrate
 
 # Test database functions
 def get_test_db():
@@ -118,6 +123,8 @@ def init_test_db():
         )
     ''')
     
+    migrate(conn)
+    
     # Insert MSP data
     msp_data = [
         ('Rice', 24), ('Wheat', 23), ('Maize', 21), ('Jowar', 32),
@@ -132,10 +139,25 @@ def init_test_db():
     conn.commit()
     conn.close()
 
-# Monkey patch the database functions in app module
+# Point the app's connection pool at the test database
 import app as app_module
-original_get_db = app_module.get_db
-app_module.get_db = get_test_db
+app.config['DATABASE'] = 'test_kisanbazaar.db'
+
+def remove_test_db():
+    """Remove the test database together with its WAL side files"""
+    app_module.close_db_pool()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists('test_kisanbazaar.db' + suffix):
+            try:
+                os.remove('test_kisanbazaar.db' + suffix)
+            except OSError:
+                pass
+
+# Statements a route may run without an index: the whole (small) schemes table, the
+# one-row-per-table sqlite_sequence, and SQLite's own bookkeeping (schema checks,
+# FTS5 configuration, trigger markers)
+UNINDEXED_STATEMENTS = re.compile(r"SELECT \* FROM schemes$|SELECT 1 FROM sqlite_master |SELECT k, v FROM 'main'|"
+                                  r"SELECT MAX\(COALESCE\(\(SELECT seq FROM sqlite_sequence |--|PRAGMA ")
 
 class KisanBazaarTestCase(unittest.TestCase):
     
@@ -146,8 +168,7 @@ class KisanBazaarTestCase(unittest.TestCase):
         self.client = app.test_client()
         
         # Remove existing test database if it exists
-        if os.path.exists('test_kisanbazaar.db'):
-            os.remove('test_kisanbazaar.db')
+        remove_test_db()
         
         # Initialize test database
         init_test_db()
@@ -155,11 +176,7 @@ class KisanBazaarTestCase(unittest.TestCase):
     def tearDown(self):
         """Clean up after tests"""
         # Clean up test database
-        if os.path.exists('test_kisanbazaar.db'):
-            try:
-                os.remove('test_kisanbazaar.db')
-            except:
-                pass
+        remove_test_db()
     
     # ==================== DATABASE TESTS ====================
     
@@ -186,21 +203,1161 @@ class KisanBazaarTestCase(unittest.TestCase):
     def test_msp_functions(self):
         """Test MSP price retrieval and comparison"""
         # Test get_msp_price
-        rice_msp = get_msp_price('Rice')
-        self.assertEqual(rice_msp, 24, "Rice MSP should be 24")
-        
-        wheat_msp = get_msp_price('Wheat')
-        self.assertEqual(wheat_msp, 23, "Wheat MSP should be 23")
-        
-        # Test with non-existent crop
-        unknown_msp = get_msp_price('UnknownCrop')
-        self.assertIsNone(unknown_msp, "Unknown crop should return None")
+        with app.app_context():
+            rice_msp = get_msp_price('Rice')
+            self.assertEqual(rice_msp, 24, "Rice MSP should be 24")
+            
+            wheat_msp = get_msp_price('Wheat')
+            self.assertEqual(wheat_msp, 23, "Wheat MSP should be 23")
+            
+            # Test with non-existent crop
+            unknown_msp = get_msp_price('UnknownCrop')
+            self.assertIsNone(unknown_msp, "Unknown crop should return None")
         
         # Test compare_with_msp
         self.assertEqual(compare_with_msp(30, 24), 'Above MSP', "30 > 24 should be Above MSP")
         self.assertEqual(compare_with_msp(20, 24), 'Below MSP', "20 < 24 should be Below MSP")
         self.assertEqual(compare_with_msp(30, None), 'MSP Not Available', "None MSP should return N/A")
     
+    # ==================== CONNECTION POOL TESTS ====================
+    
+    def test_connection_shared_within_app_context(self):
+        """Test that get_db returns one tuned connection per app context"""
+        with app.app_context():
+            conn = app_module.get_db()
+            self.assertIs(conn, app_module.get_db(), "Same context should reuse the connection")
+            journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+            self.assertEqual(journal_mode, 'wal')
+            self.assertEqual(conn.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+        
+        # The connection goes back to the pool and is reused by the next context
+        with app.app_context():
+            self.assertIs(app_module.get_db(), conn, "Pooled connection should be reused")
+    
+    def test_connection_pool_is_bounded(self):
+        """Test that the pool refuses to hand out more than max_size connections"""
+        pool = app_module.ConnectionPool('test_kisanbazaar.db', max_size=2, timeout=0.05)
+        first = pool.acquire()
+        second = pool.acquire()
+        with self.assertRaises(RuntimeError):
+            pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first, "Released connection should be handed out again")
+        pool.release(first)
+        pool.release(second)
+        pool.close()
+    
+    # ==================== SEARCH INDEX TESTS ====================
+    
+    def test_search_index_tracks_crops_and_farmers(self):
+        """Test that crops_fts follows inserts, updates and deletes through triggers"""
+        conn = get_test_db()
+        cursor = conn.cursor()
+        cursor.execute('''INSERT INTO farmers (name, password, location, district, state)
+                          VALUES ('Search Farmer', 'pass', 'Khanna', 'Ludhiana', 'Punjab')''')
+        farmer_id = cursor.lastrowid
+        cursor.execute('''INSERT INTO crops (farmer_id, crop_name, quantity, price, location)
+                          VALUES (?, 'Basmati Rice', 10, 40, 'Khanna')''', (farmer_id,))
+        crop_id = cursor.lastrowid
+        conn.commit()
+        
+        def search(crop='', location=''):
+            match = app_module.marketplace_search_match(crop, location)
+            return [row[0] for row in conn.execute('SELECT rowid FROM crops_fts WHERE crops_fts MATCH ?', (match,))]
+        
+        self.assertEqual(search(crop='basm'), [crop_id], "Prefix of a word should match")
+        self.assertEqual(search(crop='rice', location='ludh'), [crop_id], "District should match location filter")
+        self.assertEqual(search(crop='wheat'), [])
+        
+        cursor.execute("UPDATE farmers SET district = 'Patiala' WHERE id = ?", (farmer_id,))
+        conn.commit()
+        self.assertEqual(search(location='pati'), [crop_id], "Farmer district change should be re-indexed")
+        
+        cursor.execute('DELETE FROM crops WHERE id = ?', (crop_id,))
+        conn.commit()
+        self.assertEqual(search(crop='basm'), [], "Deleted crop should leave the index")
+        conn.close()
+    
+    def test_search_query_escapes_user_input(self):
+        """Test that FTS5 operators in search text are treated as plain words"""
+        match = app_module.marketplace_search_match('rice" OR wheat', '')
+        self.assertEqual(match, 'crop_name : ("rice"""* "OR"* "wheat"*)')
+        self.assertEqual(app_module.marketplace_search_match('  ', ''), '')
+    
+    # ==================== MIGRATION & QUERY PLAN TESTS ====================
+    
+    def test_migrations_are_versioned_and_idempotent(self):
+        """Test that migrate() records the schema version and can be re-run safely"""
+        conn = get_test_db()
+        self.assertEqual(conn.execute('PRAGMA user_version').fetchone()[0], app_module.SCHEMA_VERSION)
+        self.assertEqual(migrate(conn), app_module.SCHEMA_VERSION)
+        indexes = [row['name'] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        for index in ['idx_cart_customer_crop', 'idx_crops_farmer_created', 'idx_orders_farmer_date',
+                      'idx_orders_customer_date', 'idx_msp_lower_name', 'idx_orders_farmer_status_date']:
+            self.assertIn(index, indexes, f"Index {index} should exist")
+        conn.close()
+    
+    def test_cart_lines_are_unique_per_crop(self):
+        """Test that the cart cannot hold two lines for the same customer and crop"""
+        conn = get_test_db()
+        conn.execute('INSERT INTO cart (customer_id, crop_id, quantity) VALUES (1, 1, 2)')
+        with self.assertRaises(sqlite3.IntegrityError):
+            conn.execute('INSERT INTO cart (customer_id, crop_id, quantity) VALUES (1, 1, 3)')
+        conn.close()
+    
+    def capture_statements(self, drive):
+        """Run drive() and return every SQL statement the app's pooled connections executed, literals inlined"""
+        statements = []
+        connect_db = app_module.connect_db
+        def traced_connect(database):
+            conn = connect_db(database)
+            conn.set_trace_callback(statements.append)
+            return conn
+        app_module.close_db_pool()
+        app_module.connect_db = traced_connect
+        try:
+            drive()
+        finally:
+            app_module.connect_db = connect_db
+            app_module.close_db_pool()
+        return statements
+    
+    def test_hot_queries_use_indexes(self):
+        """Test that every statement the hot routes actually run is answered from an index"""
+        from jinja2 import FunctionLoader
+        farmer_id, crop_ids = self.seed_listings(5)
+        customer_id = self.seed_customer()
+        conn = get_test_db()
+        conn.execute("UPDATE customers SET pincode = '141' WHERE id = ?", (customer_id,))
+        conn.commit()
+        conn.close()
+        
+        def drive():
+            with self.client as client:
+                client.post('/farmer/login', data={'name': 'Page Farmer', 'password': 'pass'})
+                client.get('/farmer/dashboard')
+                client.get('/api/farmer/crops?limit=2')
+                client.get('/api/farmer/orders?status=Pending&include_archived=1')
+                client.get('/api/farmer/orders/summary')
+                client.post('/customer/login', data={'email': 'buyer@example.com', 'password': 'pass'})
+                for url in ('/marketplace', '/marketplace?crop=whe', '/marketplace?location=Khanna',
+                            '/api/marketplace?limit=2&sort=newest&within_km=50'):
+                    client.get(url)
+                token = client.get('/api/marketplace?limit=2&crop=whe').get_json()['next_cursor']
+                client.get(f'/api/marketplace?limit=2&crop=whe&cursor={token}')
+                client.post(f'/cart/add/{crop_ids[0]}', data={'quantity': 2})
+                client.get('/cart')
+                client.get('/api/cart/count')
+                client.post('/checkout', data={'address': 'Farm Gate', 'phone': '9111111111'},
+                            headers={'Accept': 'application/json'})
+                client.get('/customer/orders')
+                client.get('/api/customer/orders?include_archived=1')
+                client.get('/api/orders/changes')
+                client.get('/api/marketplace/changes')
+                for url in ('/msp', '/schemes', '/api/msp/Rice'):
+                    client.get(url)
+                with client.session_transaction() as sess:
+                    sess.clear()
+                    sess['farmer_id'] = farmer_id
+                order_id = client.get('/api/orders/changes').get_json()['events'][0]['order_id']
+                client.post('/farmer/orders/batch', json={'action': 'accept', 'order_ids': [order_id]})
+                client.get('/api/orders/changes?since=1')
+        
+        loader = app.jinja_env.loader
+        app.jinja_env.loader = FunctionLoader(lambda name: '')
+        try:
+            statements = self.capture_statements(drive)
+        finally:
+            app.jinja_env.loader = loader
+        
+        conn = get_test_db()
+        conn.create_function('distance_km', 4, app_module.haversine_km)
+        checked = 0
+        for statement in statements:
+            statement = ' '.join(statement.split())
+            if UNINDEXED_STATEMENTS.match(statement) or not statement.startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE')):
+                continue
+            checked += 1
+            for detail in (row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + statement)):
+                self.assertNotRegex(detail, r'^SCAN \w+$', f"Full table scan in: {statement}")
+                self.assertNotIn('TEMP B-TREE', detail, f"Sort without index in: {statement}")
+        conn.close()
+        self.assertGreater(checked, 30)
+    
+    # ==================== MSP CACHE TESTS ====================
+    
+    def test_msp_bulk_lookup_normalizes_names(self):
+        """Test get_msp_prices resolves many names at once, ignoring case and spacing"""
+        with app.app_context():
+            prices = app_module.get_msp_prices(['rice', ' WHEAT ', 'tur  (arhar)', 'Dragonfruit'])
+        self.assertEqual(prices, {'rice': 24, ' WHEAT ': 23, 'tur  (arhar)': 72, 'Dragonfruit': None})
+    
+    def test_msp_cache_skips_database_until_table_changes(self):
+        """Test that cached lookups issue no SQL and a changed msp table is picked up"""
+        statements = []
+        with app.app_context():
+            get_msp_price('Rice')
+            conn = app_module.get_db()
+            conn.set_trace_callback(statements.append)
+            self.assertEqual(get_msp_price('Rice'), 24)
+            self.assertEqual(statements, [], "Warm cache should not touch the database")
+            conn.set_trace_callback(None)
+        
+        writer = get_test_db()
+        writer.execute("UPDATE msp SET msp_price = 26 WHERE crop_name = 'Rice'")
+        writer.commit()
+        writer.close()
+        
+        app.config['MSP_CACHE_TTL'] = 0
+        try:
+            with app.app_context():
+                self.assertEqual(get_msp_price('Rice'), 26, "Version bump should reload the cache")
+        finally:
+            app.config['MSP_CACHE_TTL'] = 60
+    
+    # ==================== PAGINATION TESTS ====================
+    
+    def seed_listings(self, count, created_at='2025-01-01 10:00:00'):
+        """Insert a farmer with `count` in-stock listings sharing one timestamp; returns (farmer_id, crop_ids)"""
+        conn = get_test_db()
+        cursor = conn.cursor()
+        cursor.execute('''INSERT INTO farmers (name, password, location, district, state)
+                          VALUES ('Page Farmer', 'pass', 'Khanna', 'Ludhiana', 'Punjab')''')
+        farmer_id = cursor.lastrowid
+        crop_ids = []
+        for i in range(count):
+            cursor.execute('''INSERT INTO crops (farmer_id, crop_name, quantity, price, location, created_at)
+                              VALUES (?, ?, 10, 30, 'Khanna', ?)''', (farmer_id, 'Rice' if i % 2 else 'Wheat', created_at))
+            crop_ids.append(cursor.lastrowid)
+        conn.commit()
+        conn.close()
+        return farmer_id, crop_ids
+    
+    def test_marketplace_api_keyset_pages(self):
+        """Test that walking page tokens returns every listing exactly once, even with tied timestamps"""
+        _, crop_ids = self.seed_listings(7)
+        seen = []
+        url = '/api/marketplace?limit=3'
+        while url:
+            data = self.client.get(url).get_json()
+            self.assertLessEqual(len(data['items']), 3)
+            seen.extend(item['id'] for item in data['items'])
+            url = f"/api/marketplace?limit=3&cursor={data['next_cursor']}" if data['next_cursor'] else None
+        self.assertEqual(seen, sorted(crop_ids, reverse=True))
+        
+        data = self.client.get('/api/marketplace?crop=whe&sort=relevance&limit=2').get_json()
+        self.assertEqual(len(data['items']), 2)
+        self.assertTrue(all(item['crop_name'] == 'Wheat' for item in data['items']))
+        rest = self.client.get(f"/api/marketplace?crop=whe&sort=relevance&limit=2&cursor={data['next_cursor']}").get_json()
+        self.assertEqual(len(rest['items']), 2, "Four Wheat listings should span two pages")
+        self.assertIsNone(rest['next_cursor'])
+    
+    def test_marketplace_search_pages_from_the_newest_index(self):
+        """Test that a crop search sorted newest first walks the listing index instead of sorting every match"""
+        _, crop_ids = self.seed_listings(7)
+        wheat = sorted(crop_ids[0::2], reverse=True)
+        statements = []
+        with app.app_context():
+            conn = app_module.get_db()
+            rows, token = app_module.marketplace_page(conn, 'whe', limit=2)
+            conn.set_trace_callback(statements.append)
+            rest, _ = app_module.marketplace_page(conn, 'whe', cursor=app_module.decode_cursor(token), limit=2)
+            conn.set_trace_callback(None)
+            search = [statement for statement in statements if 'MATCH' in statement][-1]
+            plan = [row['detail'] for row in conn.execute('EXPLAIN QUERY PLAN ' + search)]
+        self.assertEqual([row['id'] for row in rows + rest], wheat[:4])
+        self.assertIn('SEARCH c USING INDEX idx_crops_active_created (created_at<?)', plan)
+        self.assertFalse([detail for detail in plan if 'TEMP B-TREE' in detail], plan)
+    
+    def test_marketplace_api_field_projection(self):
+        """Test that ?fields= returns only the requested columns and still pages"""
+        _, crop_ids = self.seed_listings(3)
+        data = self.client.get('/api/marketplace?fields=crop_name,price,farmer_name&limit=2').get_json()
+        self.assertEqual([sorted(item) for item in data['items']], [['crop_name', 'farmer_name', 'price']] * 2)
+        self.assertEqual(data['items'][0]['farmer_name'], 'Page Farmer')
+        rest = self.client.get(f"/api/marketplace?fields=id&limit=2&cursor={data['next_cursor']}").get_json()
+        self.assertEqual(rest['items'], [{'id': crop_ids[0]}])
+        searched = self.client.get('/api/marketplace?fields=crop_name&crop=rice&sort=relevance').get_json()
+        self.assertEqual(searched['items'], [{'crop_name': 'Rice'}])
+        self.assertEqual(self.client.get('/api/marketplace?fields=crop_name,password').status_code, 400)
+        empty = self.client.get('/api/marketplace?fields=,')
+        self.assertEqual(empty.status_code, 400)
+        self.assertIn('fields must name at least one field', empty.get_data(as_text=True))
+    
+    def test_page_tokens_are_validated(self):
+        """Test that a garbage page token is rejected and the page size is capped"""
+        response = self.client.get('/api/marketplace?cursor=not-a-token')
+        self.assertEqual(response.status_code, 400)
+        for values in ([{}, 1], [[1], 2], [True, 1], [None, 1]):
+            token = app_module.encode_cursor(*values)
+            self.assertEqual(self.client.get(f'/api/marketplace?cursor={token}').status_code, 400, values)
+        self.seed_listings(3)
+        app.config['MAX_PAGE_SIZE'] = 2
+        try:
+            data = self.client.get('/api/marketplace?limit=1000').get_json()
+        finally:
+            app.config['MAX_PAGE_SIZE'] = 200
+        self.assertEqual(len(data['items']), 2)
+    
+    def test_order_apis_require_login_and_paginate(self):
+        """Test that per-user order APIs answer 401 anonymously and page through the user's orders"""
+        self.assertEqual(self.client.get('/api/customer/orders').status_code, 401)
+        self.assertEqual(self.client.get('/api/farmer/orders').status_code, 401)
+        farmer_id, crop_ids = self.seed_listings(1)
+        conn = get_test_db()
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO customers (name, email, password) VALUES ('Buyer', 'buyer@example.com', 'pass')")
+        customer_id = cursor.lastrowid
+        for day in range(1, 6):
+            cursor.execute('''INSERT INTO orders (customer_id, crop_id, farmer_id, quantity, total_price, status, order_date)
+                              VALUES (?, ?, ?, 1, 30, ?, ?)''',
+                           (customer_id, crop_ids[0], farmer_id, 'Pending' if day % 2 else 'Accepted', f'2025-02-0{day} 09:00:00'))
+        conn.commit()
+        conn.close()
+        
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['customer_id'] = customer_id
+                sess['farmer_id'] = farmer_id
+            first = client.get('/api/customer/orders?limit=3').get_json()
+            self.assertEqual([o['order_date'][:10] for o in first['items']], ['2025-02-05', '2025-02-04', '2025-02-03'])
+            second = client.get(f"/api/customer/orders?limit=3&cursor={first['next_cursor']}").get_json()
+            self.assertEqual(len(second['items']), 2)
+            self.assertIsNone(second['next_cursor'])
+            pending = client.get('/api/farmer/orders?status=Pending').get_json()
+            self.assertEqual(len(pending['items']), 3)
+            self.assertEqual(client.get('/api/farmer/orders?status=Lost').status_code, 400)
+    
+    def test_farmer_order_summary_aggregates_in_sql(self):
+        """Test that the farmer order summary counts and totals orders per status"""
+        self.assertEqual(self.client.get('/api/farmer/orders/summary').status_code, 401)
+        farmer_id, crop_ids = self.seed_listings(1)
+        customer_id = self.seed_customer()
+        conn = get_test_db()
+        for status, total_price in [('Pending', 30), ('Pending', 60), ('Delivered', 90), ('Rejected', 15),
+                                    (None, 5), ('Lost', 5)]:
+            conn.execute('''INSERT INTO orders (customer_id, crop_id, farmer_id, quantity, total_price, status)
+                            VALUES (?, ?, ?, 1, ?, ?)''', (customer_id, crop_ids[0], farmer_id, total_price, status))
+        conn.commit()
+        conn.close()
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['farmer_id'] = farmer_id
+            response = client.get('/api/farmer/orders/summary')
+            self.assertEqual(response.status_code, 200)
+            summary = response.get_json()
+        self.assertEqual(sorted(summary['by_status']), sorted(app_module.ORDER_STATUSES))
+        self.assertEqual(summary['by_status']['Pending'], {'count': 2, 'total_price': 90})
+        self.assertEqual(summary['by_status']['Accepted'], {'count': 0, 'total_price': 0})
+        self.assertEqual(summary['total_orders'], 4)
+        self.assertEqual(summary['revenue'], 90)
+    
+    def test_farmer_dashboard_renders_summary_and_pending_orders_only(self):
+        """Test that the dashboard renders the order counts and pending orders, leaving the rest to the API"""
+        farmer_id, crop_ids = self.seed_listings(1)
+        customer_id = self.seed_customer()
+        conn = get_test_db()
+        for status in ['Pending', 'Accepted', 'Delivered']:
+            conn.execute('''INSERT INTO orders (customer_id, crop_id, farmer_id, quantity, total_price, status)
+                            VALUES (?, ?, ?, 1, 30, ?)''', (customer_id, crop_ids[0], farmer_id, status))
+        conn.commit()
+        conn.close()
+        from jinja2 import DictLoader
+        loader = app.jinja_env.loader
+        app.jinja_env.loader = DictLoader({'farmer_dashboard.html': '{{ order_stats.total_orders }}|'
+                                           '{% for o in pending_orders %}{{ o.status }}{% endfor %}|'
+                                           '{{ orders is defined }}|{{ accepted_orders is defined }}|'
+                                           '{{ order_sections.Accepted }}'})
+        try:
+            with self.client as client:
+                with client.session_transaction() as sess:
+                    sess['farmer_id'] = farmer_id
+                self.assertEqual(client.get('/farmer/dashboard').get_data(as_text=True),
+                                 '3|Pending|False|False|/api/farmer/orders?status=Accepted')
+        finally:
+            app.jinja_env.loader = loader
+    
+    # ==================== CHECKOUT ENGINE TESTS ====================
+    
+    def seed_customer(self, email='buyer@example.com'):
+        conn = get_test_db()
+        cursor = conn.cursor()
+        cursor.execute('''INSERT INTO customers (name, email, password, phone, address)
+                          VALUES ('Buyer', ?, 'pass', '9000000000', 'Buyer Street')''', (email,))
+        conn.commit()
+        conn.close()
+        return cursor.lastrowid
+    
+    def test_checkout_reports_per_item_results(self):
+        """Test that checkout places what it can in one go and keeps unfillable lines in the cart"""
+        farmer_id, crop_ids = self.seed_listings(2)
+        customer_id = self.seed_customer()
+        conn = get_test_db()
+        conn.execute('INSERT INTO cart (customer_id, crop_id, quantity) VALUES (?, ?, 4)', (customer_id, crop_ids[0]))
+        conn.execute('INSERT INTO cart (customer_id, crop_id, quantity) VALUES (?, ?, 50)', (customer_id, crop_ids[1]))
+        conn.commit()
+        
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['customer_id'] = customer_id
+            response = client.post('/checkout', data={'address': 'Farm Gate', 'phone': '9111111111'},
+                                   headers={'Accept': 'application/json'})
+        results = {r['crop_id']: r for r in response.get_json()['results']}
+        self.assertTrue(results[crop_ids[0]]['ok'])
+        self.assertEqual(results[crop_ids[0]]['total_price'], 120)
+        self.assertFalse(results[crop_ids[1]]['ok'])
+        self.assertEqual(results[crop_ids[1]]['error'], 'insufficient_stock')
+        
+        order = conn.execute('SELECT * FROM orders WHERE id = ?', (results[crop_ids[0]]['order_id'],)).fetchone()
+        self.assertEqual((order['quantity'], order['customer_address']), (4, 'Farm Gate'))
+        stock = dict(conn.execute('SELECT id, quantity FROM crops WHERE farmer_id = ?', (farmer_id,)).fetchall())
+        self.assertEqual(stock, {crop_ids[0]: 6, crop_ids[1]: 10})
+        cart = [row['crop_id'] for row in conn.execute('SELECT crop_id FROM cart WHERE customer_id = ?', (customer_id,))]
+        self.assertEqual(cart, [crop_ids[1]], "Only the unfilled line should stay in the cart")
+        conn.close()
+    
+    def test_concurrent_checkouts_never_oversell(self):
+        """Test that buyers racing for the last stock cannot push quantity below zero"""
+        _, crop_ids = self.seed_listings(1)
+        customer_ids = [self.seed_customer(f'racer{i}@example.com') for i in range(8)]
+        outcomes = []
+        
+        def buy(customer_id):
+            with app.app_context():
+                outcomes.extend(app_module.place_orders(app_module.get_db(), customer_id,
+                                                        [{'crop_id': crop_ids[0], 'quantity': 3}], 'Addr', '9'))
+        
+        threads = [threading.Thread(target=buy, args=(customer_id,)) for customer_id in customer_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(sum(1 for o in outcomes if o['ok']), 3, "10 kg of stock fills three 3 kg orders")
+        conn = get_test_db()
+        self.assertEqual(conn.execute('SELECT quantity FROM crops WHERE id = ?', (crop_ids[0],)).fetchone()[0], 1)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM orders').fetchone()[0], 3)
+        conn.close()
+    
+    # ==================== FACET TESTS ====================
+    
+    def test_facets_count_only_in_stock_listings(self):
+        """Test that facet counts follow listing inserts, sell-outs, restocks and deletes"""
+        farmer_id, crop_ids = self.seed_listings(3)
+        conn = get_test_db()
+        
+        def facets(facet_type):
+            with app.app_context():
+                return {row[facet_type]: row['active_listing_count']
+                        for row in app_module.get_facets(app_module.get_db(), facet_type)}
+        
+        self.assertEqual(facets('crop_name'), {'Rice': 1, 'Wheat': 2})
+        self.assertEqual(facets('location'), {'Khanna': 3})
+        
+        conn.execute('UPDATE crops SET quantity = 4 WHERE id = ?', (crop_ids[0],))
+        conn.commit()
+        self.assertEqual(facets('crop_name'), {'Rice': 1, 'Wheat': 2}, "Partial sale keeps the listing active")
+        
+        conn.execute('UPDATE crops SET quantity = 0 WHERE id = ?', (crop_ids[1],))
+        conn.commit()
+        self.assertEqual(facets('crop_name'), {'Wheat': 2}, "Sold-out value should disappear")
+        
+        conn.execute('UPDATE crops SET quantity = 5 WHERE id = ?', (crop_ids[1],))
+        conn.execute("UPDATE crops SET location = 'Patiala' WHERE id = ?", (crop_ids[2],))
+        conn.execute('DELETE FROM crops WHERE id = ?', (crop_ids[0],))
+        conn.commit()
+        self.assertEqual(facets('crop_name'), {'Rice': 1, 'Wheat': 1})
+        self.assertEqual(facets('location'), {'Khanna': 1, 'Patiala': 1})
+        
+        # The incremental counts must agree with a full rebuild
+        before = facets('crop_name'), facets('location')
+        app_module.rebuild_facets(conn)
+        conn.commit()
+        self.assertEqual((facets('crop_name'), facets('location')), before)
+        conn.close()
+    
+    # ==================== CART SUMMARY TESTS ====================
+    
+    def test_cart_count_tracks_cart_writes_with_etag(self):
+        """Test that the cart summary follows add/update/remove/checkout and answers 304 when unchanged"""
+        _, crop_ids = self.seed_listings(2)
+        customer_id = self.seed_customer()
+        with self.client as client:
+            self.assertEqual(client.get('/api/cart/count').get_json(), {'count': 0})
+            with client.session_transaction() as sess:
+                sess['customer_id'] = customer_id
+            
+            client.post(f'/cart/add/{crop_ids[0]}', data={'quantity': 2})
+            client.post(f'/cart/add/{crop_ids[0]}', data={'quantity': 3})
+            client.post(f'/cart/add/{crop_ids[1]}', data={'quantity': 1})
+            response = client.get('/api/cart/count')
+            self.assertEqual(response.get_json(), {'count': 6, 'items': 2, 'total_price': 180})
+            etag = response.headers['ETag']
+            
+            cached = client.get('/api/cart/count', headers={'If-None-Match': etag})
+            self.assertEqual(cached.status_code, 304)
+            self.assertEqual(cached.data, b'')
+            
+            conn = get_test_db()
+            line_ids = [row['id'] for row in conn.execute('SELECT id FROM cart WHERE customer_id = ? ORDER BY id', (customer_id,))]
+            conn.close()
+            client.post(f'/cart/update/{line_ids[0]}', data={'quantity': 1})
+            response = client.get('/api/cart/count', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200, "A cart change must invalidate the ETag")
+            self.assertEqual(response.get_json()['count'], 2)
+            
+            client.get(f'/cart/remove/{line_ids[1]}')
+            self.assertEqual(client.get('/api/cart/count').get_json(), {'count': 1, 'items': 1, 'total_price': 30})
+            
+            client.post('/checkout', data={'address': 'A', 'phone': '9'})
+            self.assertEqual(client.get('/api/cart/count').get_json(), {'count': 0, 'items': 0, 'total_price': 0})
+    
+    def test_deleting_listing_clears_it_from_carts(self):
+        """Test that delete_crop removes cart lines for the listing and their totals"""
+        farmer_id, crop_ids = self.seed_listings(1)
+        customer_id = self.seed_customer()
+        conn = get_test_db()
+        conn.execute('INSERT INTO cart (customer_id, crop_id, quantity) VALUES (?, ?, 2)', (customer_id, crop_ids[0]))
+        conn.commit()
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['farmer_id'] = farmer_id
+            client.get(f'/delete_crop/{crop_ids[0]}')
+        summary = conn.execute('SELECT item_count, total_quantity, total_price FROM cart_summary WHERE customer_id = ?',
+                               (customer_id,)).fetchone()
+        self.assertEqual(tuple(summary), (0, 0, 0))
+        conn.close()
+    
+    # ==================== LIVE EVENT TESTS ====================
+    
+    def test_event_bus_replays_from_last_event_id(self):
+        """Test that the event bus filters by topic and reports when a resume point has been dropped"""
+        bus = app_module.EventBus(3)
+        first = bus.publish(['farmer:1'], 'order_created', {'id': 1})
+        bus.publish(['farmer:2'], 'order_created', {'id': 2})
+        bus.publish(['farmer:1', 'customer:5'], 'order_accepted', {'id': 1})
+        self.assertEqual([event.type for event in bus.events_after(first, {'farmer:1'})], ['order_accepted'])
+        self.assertEqual(len(bus.events_after(0, {'customer:5'})), 1)
+        bus.publish(['farmer:1'], 'order_delivered', {'id': 1})
+        self.assertIsNone(bus.events_after(0, {'farmer:1'}), "Event 1 has left the ring buffer")
+        self.assertFalse(bus.wait(bus.last_id(), 0.01))
+    
+    def test_order_events_stream_to_farmer_and_customer(self):
+        """Test that placing and accepting an order reaches both parties' SSE streams"""
+        self.assertEqual(self.client.get('/farmer/events').status_code, 401)
+        farmer_id, crop_ids = self.seed_listings(1)
+        customer_id = self.seed_customer()
+        start = app_module.event_bus.last_id()
+        app.config['EVENT_STREAM_TIMEOUT'] = 0
+        try:
+            with self.client as client:
+                with client.session_transaction() as sess:
+                    sess['customer_id'] = customer_id
+                    sess['farmer_id'] = farmer_id
+                client.post(f'/order/{crop_ids[0]}', data={'quantity': '4'})
+                conn = get_test_db()
+                order_id = conn.execute('SELECT id FROM orders').fetchone()[0]
+                conn.close()
+                client.get(f'/farmer/order/{order_id}/accept')
+                farmer_stream = client.get('/farmer/events', headers={'Last-Event-ID': str(start)})
+                customer_stream = client.get(f'/customer/events?crops={crop_ids[0]}&last_event_id={start}')
+        finally:
+            app.config['EVENT_STREAM_TIMEOUT'] = 300
+        self.assertEqual(farmer_stream.mimetype, 'text/event-stream')
+        farmer_body = farmer_stream.get_data(as_text=True)
+        customer_body = customer_stream.get_data(as_text=True)
+        self.assertIn('event: order_created', farmer_body)
+        self.assertIn('event: order_accepted', farmer_body)
+        self.assertNotIn('stock_changed', farmer_body)
+        self.assertIn('event: order_accepted', customer_body)
+        self.assertIn('event: stock_changed\ndata: {"crop_id": %d, "quantity": 6}' % crop_ids[0], customer_body)
+    
+    # ==================== BULK IMPORT TESTS ====================
+    
+    def test_bulk_import_reports_each_row(self):
+        """Test that CSV and NDJSON imports insert valid rows in chunks and report the rest"""
+        from io import BytesIO
+        self.assertEqual(self.client.post('/farmer/crops/import').status_code, 401)
+        farmer_id, _ = self.seed_listings(0)
+        csv_data = 'crop_name,quantity,price,location\nRice,100,30,Khanna\nWheat,abc,20,\nOnion,50,10,\nTomato,5,25,Moga\n'
+        ndjson_data = '{"crop_name": "Potato", "quantity": 40, "price": 12}\n\nnot json\n{"crop_name": "", "quantity": 1, "price": 1}\n'
+        app.config['IMPORT_CHUNK_SIZE'] = 2
+        try:
+            with self.client as client:
+                with client.session_transaction() as sess:
+                    sess['farmer_id'] = farmer_id
+                    sess['farmer_location'] = 'Ludhiana'
+                report = client.post('/farmer/crops/import', data={'file': (BytesIO(csv_data.encode()), 'lots.csv')}).get_json()
+                ndjson = client.post('/farmer/crops/import',
+                                     data={'file': (BytesIO(ndjson_data.encode()), 'lots.ndjson')}).get_json()
+                bad_header = client.post('/farmer/crops/import', data={'file': (BytesIO(b'name,qty\nRice,1\n'), 'x.csv')})
+        finally:
+            app.config['IMPORT_CHUNK_SIZE'] = 500
+        self.assertEqual((report['imported'], report['rejected']), (3, 1))
+        self.assertEqual([row['line'] for row in report['rows']], [2, 3, 4, 5])
+        self.assertEqual(report['rows'][1]['errors'], ['quantity must be a positive whole number'])
+        self.assertEqual(report['rows'][2]['msp_status'], 'Below MSP')
+        self.assertEqual((ndjson['imported'], ndjson['rejected']), (1, 2))
+        self.assertEqual([row['line'] for row in ndjson['rows']], [1, 3, 4])
+        self.assertEqual(bad_header.status_code, 400)
+        conn = get_test_db()
+        rows = conn.execute('SELECT crop_name, location, msp_price FROM crops WHERE farmer_id = ? ORDER BY id',
+                            (farmer_id,)).fetchall()
+        conn.close()
+        self.assertEqual([tuple(row) for row in rows], [('Rice', 'Khanna', 24), ('Onion', 'Ludhiana', 18),
+                                                       ('Tomato', 'Moga', 20), ('Potato', 'Ludhiana', 15)])
+    
+    def test_bulk_import_stops_cleanly_on_unreadable_input(self):
+        """Test that bad bytes or a malformed CSV row end the import with a report, keeping earlier rows"""
+        from io import BytesIO
+        farmer_id, _ = self.seed_listings(0)
+        rows = b''.join(b'Rice,%d,30,Khanna\n' % (i + 1) for i in range(1200))
+        upload = b'crop_name,quantity,price,location\n' + rows + b'Wheat,5,\xff20,Khanna\nOnion,5,10,Khanna\n'
+        oversized = b'crop_name,quantity,price,location\nRice,1,30,Khanna\nRice,1,30,"' + b'x' * 200000 + b'"\n'
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['farmer_id'] = farmer_id
+            response = client.post('/farmer/crops/import', data={'file': (BytesIO(upload), 'lots.csv')})
+            too_big = client.post('/farmer/crops/import', data={'file': (BytesIO(oversized), 'big.csv')}).get_json()
+        self.assertEqual(response.status_code, 200)
+        report = response.get_json()
+        self.assertEqual((report['imported'], report['rejected'], report['complete']), (1200, 1, False))
+        self.assertEqual(report['rows'][-1]['line'], 1202)
+        self.assertTrue(report['rows'][-1]['stopped'])
+        self.assertIn('UTF-8', report['rows'][-1]['errors'][0])
+        self.assertEqual((too_big['imported'], too_big['complete']), (1, False))
+        self.assertIn('malformed CSV', too_big['rows'][-1]['errors'][0])
+        conn = get_test_db()
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM crops WHERE farmer_id = ?', (farmer_id,)).fetchone()[0], 1201)
+        conn.close()
+    
+    # ==================== ORDER ACTION TESTS ====================
+    
+    def test_batch_order_action_reports_each_order(self):
+        """Test that a batch reject updates every eligible order in one go and restocks once per crop"""
+        farmer_id, crop_ids = self.seed_listings(2)
+        other_farmer_id, other_crop_ids = self.seed_listings(1)
+        customer_id = self.seed_customer()
+        conn = get_test_db()
+        cursor = conn.cursor()
+        order_ids = []
+        for crop_id, owner, quantity, status in [(crop_ids[0], farmer_id, 2, 'Pending'), (crop_ids[0], farmer_id, 3, 'Accepted'),
+                                                 (crop_ids[1], farmer_id, 4, 'Pending'), (crop_ids[1], farmer_id, 1, 'Delivered'),
+                                                 (other_crop_ids[0], other_farmer_id, 5, 'Pending')]:
+            cursor.execute('''INSERT INTO orders (customer_id, crop_id, farmer_id, quantity, total_price, status)
+                              VALUES (?, ?, ?, ?, 0, ?)''', (customer_id, crop_id, owner, quantity, status))
+            order_ids.append(cursor.lastrowid)
+        conn.commit()
+        conn.close()
+        self.assertEqual(self.client.post('/farmer/orders/batch', json={'action': 'reject', 'order_ids': [1]}).status_code, 401)
+        
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['farmer_id'] = farmer_id
+            self.assertEqual(client.post('/farmer/orders/batch', json={'action': 'ship', 'order_ids': [1]}).status_code, 400)
+            response = client.post('/farmer/orders/batch', json={'action': 'reject', 'order_ids': order_ids + [order_ids[0]]})
+            results = {result['order_id']: result for result in response.get_json()['results']}
+            client.get(f'/farmer/order/{order_ids[0]}/accept')
+        
+        self.assertEqual(len(results), 5, "Duplicate ids are reported once")
+        self.assertTrue(all(results[order_id]['ok'] for order_id in order_ids[:3]))
+        self.assertEqual(results[order_ids[3]], {'order_id': order_ids[3], 'ok': False, 'error': 'invalid_status',
+                                                 'status': 'Delivered'})
+        self.assertEqual(results[order_ids[4]]['error'], 'not_found', "Other farmers' orders are invisible")
+        conn = get_test_db()
+        stock = [conn.execute('SELECT quantity FROM crops WHERE id = ?', (crop_id,)).fetchone()[0]
+                 for crop_id in crop_ids + other_crop_ids]
+        first_status = conn.execute('SELECT status FROM orders WHERE id = ?', (order_ids[0],)).fetchone()[0]
+        conn.close()
+        self.assertEqual(stock, [15, 14, 10])
+        self.assertEqual(first_status, 'Rejected', "A rejected order cannot be accepted again")
+    
+    def test_batch_order_action_rejects_malformed_bodies(self):
+        """Test that a batch body must be an object whose order_ids is a list of integers"""
+        farmer_id, crop_ids = self.seed_listings(1)
+        customer_id = self.seed_customer()
+        conn = get_test_db()
+        order_id = conn.execute('''INSERT INTO orders (customer_id, crop_id, farmer_id, quantity, total_price, status)
+                                   VALUES (?, ?, ?, 1, 30, 'Pending')''', (customer_id, crop_ids[0], farmer_id)).lastrowid
+        conn.commit()
+        conn.close()
+        bodies = [[order_id, order_id + 1], {'action': 'accept', 'order_ids': str(order_id)},
+                  {'action': 'accept', 'order_ids': [order_id + 0.9]}, {'action': 'accept', 'order_ids': [True]},
+                  {'action': 'accept', 'order_ids': {str(order_id): 'yes'}}, {'action': 'accept'}]
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['farmer_id'] = farmer_id
+            statuses = [client.post('/farmer/orders/batch', json=body).status_code for body in bodies]
+            form = client.post('/farmer/orders/batch', data={'action': 'accept', 'order_ids': [str(order_id), '1.5']})
+            self.assertEqual(statuses + [form.status_code], [400] * 7)
+            conn = get_test_db()
+            self.assertEqual(conn.execute('SELECT status FROM orders WHERE id = ?', (order_id,)).fetchone()[0], 'Pending')
+            conn.close()
+            response = client.post('/farmer/orders/batch', data={'action': 'accept', 'order_ids': [str(order_id)]},
+                                   headers={'Accept': 'application/json'})
+        self.assertEqual(response.get_json()['results'], [{'order_id': order_id, 'ok': True, 'status': 'Accepted'}])
+    
+    # ==================== CONDITIONAL GET TESTS ====================
+    
+    def test_api_msp_answers_304_until_msp_changes(self):
+        """Test that /api/msp revalidates against the msp table version"""
+        first = self.client.get('/api/msp/Rice')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.headers['Cache-Control'], 'no-cache')
+        self.assertIsNotNone(first.last_modified)
+        etag = first.headers['ETag']
+        repeat = self.client.get('/api/msp/Rice', headers={'If-None-Match': etag})
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.data, b'')
+        
+        conn = get_test_db()
+        conn.execute("UPDATE msp SET msp_price = 25 WHERE crop_name = 'Rice'")
+        conn.commit()
+        conn.close()
+        app_module.msp_cache.invalidate()
+        changed = self.client.get('/api/msp/Rice', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.get_json()['msp_price'], 25)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+    
+    def test_cached_page_skips_render_for_repeat_visitors(self):
+        """Test that versioned pages are rendered once per version and language"""
+        renders = []
+        def render():
+            renders.append(1)
+            return 'schemes page'
+        def visit(headers=None, language='en'):
+            with app.test_request_context('/schemes', headers=headers):
+                app_module.session['language'] = language
+                stamp = app_module.get_table_stamp(app_module.get_db(), 'schemes')
+                return app_module.cached_page(stamp, render)
+        first = visit()
+        self.assertEqual(first.get_data(as_text=True), 'schemes page')
+        etag = first.headers['ETag']
+        self.assertEqual(visit({'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(visit().status_code, 200)
+        self.assertEqual(len(renders), 1, "Repeat visits should reuse the rendered page")
+        self.assertNotEqual(visit(language='hi').headers['ETag'], etag)
+        self.assertEqual(len(renders), 2)
+        
+        conn = get_test_db()
+        conn.execute("INSERT INTO schemes (name, eligibility, benefits) VALUES ('New Scheme', 'All', 'Some')")
+        conn.commit()
+        conn.close()
+        self.assertEqual(visit({'If-None-Match': etag}).status_code, 200)
+        self.assertEqual(len(renders), 3)
+    
+    def test_cached_page_ignores_if_modified_since_across_languages(self):
+        """Test that a visitor who switches language is not sent a 304 for the page in the old language"""
+        def visit(language, headers=None):
+            with app.test_request_context('/schemes', headers=headers):
+                app_module.session['language'] = language
+                stamp = app_module.get_table_stamp(app_module.get_db(), 'schemes')
+                return app_module.cached_page(stamp, lambda: f'schemes in {language}')
+        english = visit('en')
+        self.assertIsNone(english.last_modified, "A date cannot tell the language versions apart")
+        since = {'If-Modified-Since': 'Fri, 01 Jan 2100 00:00:00 GMT'}
+        hindi = visit('hi', since)
+        self.assertEqual((hindi.status_code, hindi.get_data(as_text=True)), (200, 'schemes in hi'))
+        self.assertEqual(visit('hi', {**since, 'If-None-Match': hindi.headers['ETag']}).status_code, 304)
+    
+    # ==================== METRICS TESTS ====================
+    
+    def test_metrics_count_requests_and_statements(self):
+        """Test that /metrics reports per-route request counts, latency and SQL statements"""
+        app_module.metrics.reset()
+        self.seed_listings(2)
+        self.client.get('/api/marketplace')
+        self.client.get('/api/marketplace?cursor=bad')
+        body = self.client.get('/metrics').get_data(as_text=True)
+        self.assertIn('kisanbazaar_http_requests_total{endpoint="api_marketplace",method="GET",status="200"} 1', body)
+        self.assertIn('kisanbazaar_http_requests_total{endpoint="api_marketplace",method="GET",status="400"} 1', body)
+        self.assertIn('kisanbazaar_http_request_duration_seconds_count{endpoint="api_marketplace"} 2', body)
+        self.assertIn('kisanbazaar_http_request_duration_seconds_bucket{endpoint="api_marketplace",le="+Inf"} 2', body)
+        statements = app_module.metrics.statements['api_marketplace']
+        self.assertGreaterEqual(statements.sum, 1, "Marketplace queries should be counted")
+        self.assertIn('kisanbazaar_sql_duration_seconds_total{endpoint="api_marketplace"}', body)
+    
+    def test_slow_query_log_captures_plans(self):
+        """Test that slow statements are logged with redacted parameters and their query plan"""
+        self.assertEqual(self.client.get('/debug/slow-queries').status_code, 404, "The slow-query log is opt-in")
+        self.seed_listings(1)
+        self.seed_customer('secret@example.com')
+        with tempfile.TemporaryDirectory() as directory:
+            log_file = os.path.join(directory, 'slow.log')
+            app.config.update(SLOW_QUERY_MS=0, SLOW_QUERY_LOG_FILE=log_file)
+            try:
+                self.client.get('/api/marketplace?crop=rice')
+                self.client.post('/customer/login', data={'email': 'secret@example.com', 'password': 'pass'})
+                entries = self.client.get('/debug/slow-queries?endpoint=api_marketplace').get_json()['entries']
+                logins = self.client.get('/debug/slow-queries?endpoint=customer_login').get_json()['entries']
+                with app.app_context():
+                    app_module.slow_query_log.record(app_module.get_db(), 'SELECT * FROM schemes WHERE name = ?',
+                                                     ('PM-KISAN',), 0.5)
+                scans = app_module.slow_query_log.entries(min_ms=400, full_scan=True)
+                with open(log_file, encoding='utf-8') as f:
+                    logged = [json.loads(line) for line in f]
+            finally:
+                app.config.update(SLOW_QUERY_MS=None, SLOW_QUERY_LOG_FILE=None)
+                app_module.slow_query_log.clear()
+        search = [entry for entry in entries if 'crops_fts MATCH' in entry['sql']]
+        self.assertTrue(search, "The marketplace search should be captured")
+        self.assertTrue(search[0]['plan'])
+        self.assertFalse(search[0]['full_scan'])
+        login_params = [value for entry in logins for value in entry['parameters']]
+        self.assertNotIn('secret@example.com', login_params)
+        self.assertIn('<str:18>', login_params)
+        self.assertEqual([entry['sql'] for entry in scans], ['SELECT * FROM schemes WHERE name = ?'])
+        self.assertGreaterEqual(len(logged), len(entries) + len(logins))
+    
+    # ==================== PRICE ANALYTICS TESTS ====================
+    
+    def test_price_analytics_per_crop_and_state(self):
+        """Test price quantiles, MSP premium and below-MSP share over in-stock listings"""
+        conn = get_test_db()
+        cursor = conn.cursor()
+        farmers = {}
+        for state in ['Punjab', 'Bihar']:
+            cursor.execute("INSERT INTO farmers (name, password, location, state) VALUES (?, 'pass', 'Village', ?)",
+                           (f'{state} Farmer', state))
+            farmers[state] = cursor.lastrowid
+        for state, crop_name, price, msp_price, quantity in [
+                ('Punjab', 'Rice', 20, 24, 10), ('Punjab', 'Rice', 24, 24, 10), ('Punjab', 'Rice', 30, 24, 10),
+                ('Punjab', 'Rice', 40, 24, 10), ('Bihar', 'Rice', 22, 24, 10), ('Bihar', 'Wheat', 23, 23, 10),
+                ('Bihar', 'Wheat', 5, 23, 0)]:
+            cursor.execute('''INSERT INTO crops (farmer_id, crop_name, quantity, price, location, msp_price)
+                              VALUES (?, ?, ?, ?, 'Village', ?)''', (farmers[state], crop_name, quantity, price, msp_price))
+        conn.commit()
+        version = conn.execute("SELECT version FROM table_versions WHERE name = 'crop_prices'").fetchone()[0]
+        conn.execute("UPDATE crops SET quantity = quantity - 1 WHERE crop_name = 'Rice'")
+        conn.commit()
+        self.assertEqual(conn.execute("SELECT version FROM table_versions WHERE name = 'crop_prices'").fetchone()[0],
+                         version, "Stock changes that keep listings in stock leave the analytics valid")
+        conn.close()
+        
+        response = self.client.get('/api/analytics/prices')
+        rice, wheat = response.get_json()['groups']
+        self.assertEqual(rice, {'crop': 'Rice', 'listings': 5, 'mean_price': 27.2, 'p10_price': 20.8, 'median_price': 24.0,
+                                'p90_price': 36.0, 'msp_premium_pct': 13.33, 'below_msp_share': 0.4})
+        self.assertEqual((wheat['listings'], wheat['below_msp_share']), (1, 0.0))
+        self.assertEqual(self.client.get('/api/analytics/prices', headers={'If-None-Match': response.headers['ETag']}).status_code, 304)
+        punjab = self.client.get('/api/analytics/prices?group_by=crop,state&crop=rice&state=punjab').get_json()['groups']
+        self.assertEqual([(group['state'], group['median_price']) for group in punjab], [('Punjab', 27.0)])
+        states = self.client.get('/api/analytics/prices?group_by=state').get_json()['groups']
+        self.assertEqual([(group['state'], group['listings']) for group in states], [('Bihar', 2), ('Punjab', 4)])
+        self.assertEqual(self.client.get('/api/analytics/prices?group_by=district').status_code, 400)
+
+    def test_price_analytics_refresh_applies_only_changed_listings(self):
+        """Test that a refresh re-reads just the changed listings and matches a full rebuild"""
+        farmer_id, crop_ids = self.seed_listings(6)
+        conn = get_test_db()
+        bihar_id = conn.execute("""INSERT INTO farmers (name, password, location, state)
+                                   VALUES ('Bihar Farmer', 'pass', 'Patna', 'Bihar')""").lastrowid
+        conn.commit()
+        def fresh(grouping):
+            with app.app_context():
+                return app_module.PriceAnalytics().stats(grouping)[1]
+        with app.app_context():
+            for grouping in app_module.ANALYTICS_GROUPINGS:
+                app_module.price_analytics.stats(grouping)
+    
+        conn.execute('UPDATE crops SET price = 50 WHERE id = ?', (crop_ids[0],))
+        conn.execute('UPDATE crops SET quantity = 0 WHERE id = ?', (crop_ids[1],))
+        conn.execute('UPDATE crops SET quantity = 3 WHERE id = ?', (crop_ids[2],))
+        conn.execute('DELETE FROM crops WHERE id = ?', (crop_ids[3],))
+        conn.execute("""INSERT INTO crops (farmer_id, crop_name, quantity, price, location, msp_price)
+                        VALUES (?, 'Maize', 5, 20, 'Patna', 21)""", (bihar_id,))
+        conn.commit()
+        app.config['ANALYTICS_TTL'] = 0
+        try:
+            statements = []
+            with app.app_context():
+                app_module.get_db().set_trace_callback(statements.append)
+                refreshed = {grouping: app_module.price_analytics.stats(grouping)[1]
+                             for grouping in app_module.ANALYTICS_GROUPINGS}
+                app_module.get_db().set_trace_callback(None)
+            self.assertFalse([s for s in statements if 'FROM crops WHERE' in s], "Only crop_changes rows are re-read")
+            self.assertEqual(refreshed, {grouping: fresh(grouping) for grouping in app_module.ANALYTICS_GROUPINGS})
+            self.assertEqual([(group['crop'], group['state']) for group in refreshed['crop,state']],
+                             [('Maize', 'Bihar'), ('Rice', 'Punjab'), ('Wheat', 'Punjab')])
+    
+            conn.execute("UPDATE farmers SET state = 'Haryana' WHERE id = ?", (farmer_id,))
+            conn.commit()
+            with app.app_context():
+                states = app_module.price_analytics.stats('state')[1]
+            self.assertEqual(states, fresh('state'))
+            self.assertEqual([group['state'] for group in states], ['Bihar', 'Haryana'])
+        finally:
+            app.config['ANALYTICS_TTL'] = 60
+            conn.close()
+    
+    @unittest.skipIf(app_module.numpy is None, 'NumPy is not installed')
+    def test_numpy_and_python_group_stats_agree(self):
+        """Test that the NumPy and pure-Python statistics give the same numbers on the same data"""
+        import random
+        rng = random.Random(7)
+        codes = [rng.randrange(5) for _ in range(500)]
+        prices = [float(rng.randint(5, 90)) for _ in codes]
+        msp = [rng.choice([math.nan, 20.0, 24.0, 70.0]) for _ in codes]
+        vectorized = app_module.numpy_group_stats(codes, prices, msp)
+        plain = app_module.python_group_stats(codes, prices, msp)
+        self.assertEqual(sorted(vectorized), sorted(plain))
+        for code, stats in plain.items():
+            for name, value in stats.items():
+                self.assertAlmostEqual(vectorized[code][name], value, places=9, msg=f'{name} of group {code}')
+    
+    # ==================== PROXIMITY SEARCH TESTS ====================
+    
+    def test_marketplace_proximity_search(self):
+        """Test the within_km filter, distance ordering and the R*Tree sync on pincode changes"""
+        customer_id = self.seed_customer()
+        conn = get_test_db()
+        cursor = conn.cursor()
+        cursor.executemany('INSERT INTO pincodes (pincode, latitude, longitude) VALUES (?, ?, ?)',
+                           [('141', 30.90, 75.86), ('141401', 30.70, 76.22), ('143', 31.63, 74.87), ('400', 19.08, 72.88)])
+        crop_ids = {}
+        for pincode in ['141001', '141401', '143001', '400001']:
+            cursor.execute('''INSERT INTO farmers (name, password, location, pincode)
+                              VALUES (?, 'pass', 'Village', ?)''', (f'Farmer {pincode}', pincode))
+            cursor.execute('''INSERT INTO crops (farmer_id, crop_name, quantity, price, location)
+                              VALUES (?, 'Rice', 10, 25, 'Village')''', (cursor.lastrowid,))
+            crop_ids[pincode] = cursor.lastrowid
+        cursor.execute("UPDATE customers SET pincode = '141010' WHERE id = ?", (customer_id,))
+        conn.commit()
+        
+        response = self.client.get('/api/marketplace?pincode=141001&within_km=200&limit=2')
+        page = response.get_json()
+        self.assertEqual([item['id'] for item in page['items']], [crop_ids['141001'], crop_ids['141401']])
+        self.assertEqual(page['items'][0]['distance_km'], 0)
+        self.assertAlmostEqual(page['items'][1]['distance_km'], 40.95, delta=0.05)
+        rest = self.client.get(f'/api/marketplace?pincode=141001&within_km=200&cursor={page["next_cursor"]}').get_json()
+        self.assertEqual([item['id'] for item in rest['items']], [crop_ids['143001']])
+        near = self.client.get('/api/marketplace?pincode=141001&within_km=30&fields=crop_name').get_json()['items']
+        self.assertEqual(near, [{'crop_name': 'Rice', 'distance_km': 0}])
+        
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['customer_id'] = customer_id
+            items = client.get('/api/marketplace?within_km=30').get_json()['items']
+            self.assertEqual([item['id'] for item in items], [crop_ids['141001']], "Defaults to the customer's pincode")
+        
+        conn.execute("UPDATE farmers SET pincode = '141401' WHERE pincode = '400001'")
+        conn.commit()
+        conn.close()
+        items = self.client.get('/api/marketplace?pincode=141401&within_km=1').get_json()['items']
+        self.assertEqual(sorted(item['id'] for item in items), [crop_ids['141401'], crop_ids['400001']])
+        self.assertEqual(self.client.get('/api/marketplace?pincode=999999&within_km=10').status_code, 400)
+        self.assertEqual(self.client.get('/api/marketplace?pincode=141001&within_km=5000').status_code, 400)
+    
+    # ==================== ORDER ARCHIVE TESTS ====================
+    
+    def test_archive_moves_old_terminal_orders_in_batches(self):
+        """Test that archival moves only old finished orders and that history reads can reach them"""
+        farmer_id, crop_ids = self.seed_listings(1)
+        customer_id = self.seed_customer()
+        conn = get_test_db()
+        order_ids = {}
+        for day, status, updated_at in [(1, 'Delivered', '2020-01-05 10:00:00'), (2, 'Rejected', '2020-02-05 10:00:00'),
+                                        (3, 'Delivered', '2020-03-05 10:00:00'), (4, 'Pending', None),
+                                        (5, 'Delivered', None)]:
+            cursor = conn.execute('''INSERT INTO orders (customer_id, crop_id, farmer_id, quantity, total_price, status,
+                                                         order_date, status_updated_at)
+                                     VALUES (?, ?, ?, 1, 10, ?, ?, ?)''',
+                                  (customer_id, crop_ids[0], farmer_id, status, f'2020-01-0{day} 09:00:00', updated_at))
+            order_ids[day] = cursor.lastrowid
+        conn.execute("UPDATE orders SET order_date = datetime('now') WHERE id = ?", (order_ids[5],))
+        conn.commit()
+        conn.close()
+        
+        with app.app_context():
+            self.assertEqual(app_module.archive_orders(app_module.get_db(), 30, batch_size=2, pause=0), 3)
+            self.assertEqual(app_module.archive_orders(app_module.get_db(), 30, batch_size=2, pause=0), 0)
+        conn = get_test_db()
+        self.assertEqual([row[0] for row in conn.execute('SELECT id FROM orders ORDER BY id')], [order_ids[4], order_ids[5]])
+        conn.close()
+        
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['customer_id'] = customer_id
+            hot = client.get('/api/customer/orders').get_json()['items']
+            self.assertEqual([order['id'] for order in hot], [order_ids[5], order_ids[4]])
+            page = client.get('/api/customer/orders?include_archived=1&limit=3').get_json()
+            rest = client.get(f'/api/customer/orders?include_archived=1&cursor={page["next_cursor"]}').get_json()
+            self.assertEqual([order['id'] for order in page['items'] + rest['items']],
+                             [order_ids[5], order_ids[4], order_ids[3], order_ids[2], order_ids[1]])
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['farmer_id'] = farmer_id
+            delivered = client.get('/api/farmer/orders?status=Delivered&include_archived=1').get_json()['items']
+            self.assertEqual([order['id'] for order in delivered], [order_ids[5], order_ids[3], order_ids[1]])
+            summary = client.get('/api/farmer/orders/summary').get_json()
+        self.assertEqual(summary['by_status']['Delivered'], {'count': 3, 'total_price': 30})
+        self.assertEqual((summary['total_orders'], summary['revenue']), (5, 30))
+    
+    # ==================== ORDER CHANGE LOG TESTS ====================
+    
+    def test_order_changes_since_event_id(self):
+        """Test that order creation and status changes are logged and synced incrementally"""
+        self.assertEqual(self.client.get('/api/orders/changes').status_code, 401)
+        farmer_id, crop_ids = self.seed_listings(2)
+        customer_id = self.seed_customer()
+        with app.app_context():
+            conn = app_module.get_db()
+            placed = app_module.place_orders(conn, customer_id, [{'crop_id': crop_id, 'quantity': 2} for crop_id in crop_ids],
+                                             'Addr', '9')
+            order_ids = [result['order_id'] for result in placed]
+            app_module.apply_order_action(conn, farmer_id, 'accept', order_ids)
+            app_module.apply_order_action(conn, farmer_id, 'accept', order_ids)
+            app_module.apply_order_action(conn, farmer_id, 'reject', order_ids[1:])
+        
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['farmer_id'] = farmer_id
+            first = client.get('/api/orders/changes?limit=3').get_json()
+            self.assertEqual([(event['order_id'], event['kind'], event['status']) for event in first['events']],
+                             [(order_ids[0], 'created', 'Pending'), (order_ids[1], 'created', 'Pending'),
+                              (order_ids[0], 'status_changed', 'Accepted')])
+            self.assertTrue(first['has_more'])
+            rest = client.get(f'/api/orders/changes?since={first["since"]}').get_json()
+            self.assertEqual([(event['order_id'], event['status']) for event in rest['events']],
+                             [(order_ids[1], 'Accepted'), (order_ids[1], 'Rejected')], "Repeated actions add no events")
+            self.assertFalse(rest['has_more'])
+            self.assertEqual(client.get(f'/api/orders/changes?since={rest["since"]}').get_json()['events'], [])
+        with self.client as client:
+            with client.session_transaction() as sess:
+                sess['customer_id'] = customer_id
+            self.assertEqual(len(client.get('/api/orders/changes').get_json()['events']), 5)
+            for since in ('-1', 'abc', '1.5'):
+                self.assertEqual(client.get(f'/api/orders/changes?since={since}').status_code, 400)
+    
+    # ==================== MARKETPLACE DELTA SYNC TESTS ====================
+    
+    def test_marketplace_changes_since_version(self):
+        """Test the listing delta feed: inserts, updates, out-of-stock and deleted tombstones, gzip"""
+        farmer_id, crop_ids = self.seed_listings(3)
+        full = self.client.get('/api/marketplace/changes').get_json()
+        self.assertEqual(sorted(item['id'] for item in full['inserted']), crop_ids)
+        self.assertEqual((full['updated'], full['deleted'], full['has_more']), ([], [], False))
+        
+        conn = get_test_db()
+        conn.execute('UPDATE crops SET price = 35 WHERE id = ?', (crop_ids[0],))
+        conn.execute('UPDATE crops SET quantity = 0 WHERE id = ?', (crop_ids[1],))
+        conn.execute('DELETE FROM crops WHERE id = ?', (crop_ids[2],))
+        new_id = conn.execute('''INSERT INTO crops (farmer_id, crop_name, quantity, price, location)
+                                 VALUES (?, 'Maize', 5, 20, 'Khanna')''', (farmer_id,)).lastrowid
+        gone_id = conn.execute('''INSERT INTO crops (farmer_id, crop_name, quantity, price, location)
+                                  VALUES (?, 'Onion', 5, 20, 'Khanna')''', (farmer_id,)).lastrowid
+        conn.execute('DELETE FROM crops WHERE id = ?', (gone_id,))
+        conn.commit()
+        conn.close()
+        
+        first = self.client.get(f'/api/marketplace/changes?since={full["version"]}&limit=2').get_json()
+        self.assertTrue(first['has_more'])
+        rest = self.client.get(f'/api/marketplace/changes?since={first["version"]}').get_json()
+        self.assertFalse(rest['has_more'])
+        self.assertEqual([item['id'] for item in first['inserted'] + rest['inserted']], [new_id])
+        self.assertEqual([(item['id'], item['price']) for item in first['updated'] + rest['updated']], [(crop_ids[0], 35)])
+        self.assertEqual(sorted(first['deleted'] + rest['deleted']), [crop_ids[1], crop_ids[2]])
+        self.assertEqual(self.client.get(f'/api/marketplace/changes?since={rest["version"]}').get_json()['inserted'], [])
+        for since in ('-1', 'abc', '1.5'):
+            self.assertEqual(self.client.get(f'/api/marketplace/changes?since={since}').status_code, 400)
+        
+        response = self.client.get('/api/marketplace/changes', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))['inserted']), 2)
+        self.assertEqual(self.client.get('/api/marketplace/changes?since=-1').status_code, 400)
+    
+    # ==================== STREAMED PAGES TESTS ====================
+    
+    def test_marketplace_streams_rows_lazily(self):
+        """Test that ?stream=1 renders the marketplace through a streamed template with the same pages"""
+        _, crop_ids = self.seed_listings(5)
+        from jinja2 import DictLoader
+        loader = app.jinja_env.loader
+        app.jinja_env.loader = DictLoader({'marketplace.html': '{% if crops %}{% for crop in crops %}{{ crop.id }},'
+                                                               '{% endfor %}{% else %}empty{% endif %}|{{ next_cursor }}'})
+        try:
+            response = self.client.get('/marketplace?stream=1&limit=3')
+            self.assertNotIn('Content-Length', response.headers, "Streamed pages are sent without a length")
+            rows, token = response.get_data(as_text=True).split('|')
+            self.assertEqual(rows, ','.join(map(str, sorted(crop_ids, reverse=True)[:3])) + ',')
+            self.assertEqual(token, self.client.get('/marketplace?limit=3').get_data(as_text=True).split('|')[1])
+            rest = self.client.get(f'/marketplace?stream=1&limit=3&cursor={token}').get_data(as_text=True)
+            self.assertEqual(rest, ','.join(map(str, sorted(crop_ids, reverse=True)[3:])) + ',|')
+            self.assertEqual(self.client.get('/marketplace?stream=1&crop=mango').get_data(as_text=True), 'empty|')
+            app.config['STREAM_TEMPLATES'] = True
+            self.assertNotIn('Content-Length', self.client.get('/marketplace').headers)
+            self.assertIn('Content-Length', self.client.get('/marketplace?stream=0').headers)
+        finally:
+            app.jinja_env.loader = loader
+            app.config['STREAM_TEMPLATES'] = False
+    
+    def test_streamed_page_reads_in_batches_and_releases_connection(self):
+        """Test that a streamed page fetches PAGE_SIZE rows at a time and hands its connection back once read"""
+        _, crop_ids = self.seed_listings(5)
+        newest = sorted(crop_ids, reverse=True)
+        app.config['PAGE_SIZE'] = 2
+        try:
+            with app.test_request_context('/marketplace?stream=1'):
+                conn = app_module.get_db()
+                page, token = app_module.marketplace_page(conn, limit=3, stream=True)
+                self.assertEqual(len(page), 3)
+                rows = iter(page)
+                self.assertEqual(next(rows)['id'], newest[0])
+                self.assertIn('db', app_module.g, "Rows are still to be read")
+                self.assertEqual([row['id'] for row in rows], newest[1:3])
+                self.assertNotIn('db', app_module.g, "The connection goes back to the pool after the last batch")
+                _, expected = app_module.marketplace_page(app_module.get_db(), limit=3)
+                self.assertEqual(str(token), expected)
+        finally:
+            app.config['PAGE_SIZE'] = 50
+    
+    # ==================== BENCHMARK TESTS ====================
+    
+    def test_benchmark_reports_latency_per_route(self):
+        """Test a tiny benchmark run end to end and the baseline comparison"""
+        from benchmarks import compare_results, generate, run_benchmark
+        with tempfile.TemporaryDirectory() as directory:
+            database = os.path.join(directory, 'bench.db')
+            generate(database, farmers=3, customers=4, listings=20, orders=30)
+            report = run_benchmark(database, threads=2, requests=4, routes=['api_msp', 'api_cart_count', 'checkout'])
+            app_module.close_db_pool()
+        self.assertEqual(app.config['DATABASE'], 'test_kisanbazaar.db', "Runner should restore the database setting")
+        for route in ['api_msp', 'api_cart_count', 'checkout']:
+            result = report['routes'][route]
+            self.assertEqual(result['requests'], 4)
+            self.assertEqual(result['errors'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        
+        slower = json.loads(json.dumps(report))
+        slower['routes']['api_msp']['p95_ms'] = report['routes']['api_msp']['p95_ms'] * 2
+        comparison = compare_results(slower, report)
+        self.assertTrue(comparison['api_msp']['regressed'])
+        self.assertFalse(comparison['checkout']['regressed'])
+    
+    def test_datagen_is_deterministic(self):
+        """Test the same seed produces the same dataset with derived tables filled in"""
+        from benchmarks import generate
+        with tempfile.TemporaryDirectory() as directory:
+            dumps = []
+            for name in ['a.db', 'b.db']:
+                database = os.path.join(directory, name)
+                counts = generate(database, farmers=5, customers=10, listings=40, orders=60, seed=3)
+                conn = sqlite3.connect(database)
+                dumps.append([conn.execute(f'SELECT * FROM {table} ORDER BY 1, 2').fetchall()
+                              for table in ['farmers', 'customers', 'crops', 'orders', 'cart', 'cart_summary']])
+                facets = conn.execute('SELECT SUM(active_listing_count) FROM marketplace_facets WHERE facet_type = ?',
+                                      ('crop_name',)).fetchone()[0]
+                live = conn.execute('SELECT COUNT(*) FROM crops WHERE quantity > 0').fetchone()[0]
+                triggers = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'").fetchone()[0]
+                conn.close()
+            self.assertEqual(dumps[0], dumps[1])
+        self.assertEqual(counts['crops'], 40)
+        self.assertEqual(counts['orders'], 60)
+        self.assertEqual(facets, live, "Facets should be rebuilt after the bulk load")
+        self.assertGreater(triggers, 0, "Triggers should be restored after the bulk load")
+    
     # ==================== FARMER TESTS ====================
     
     def test_farmer_registration(self):
@@ -474,6 +1631,29 @@ class KisanBazaarTestCase(unittest.TestCase):
             response = client.get('/set_language/en', follow_redirects=True)
             with client.session_transaction() as sess:
                 self.assertEqual(sess.get('language'), 'en')
+    
+    def test_translation_catalogs_fall_back_to_english(self):
+        """Test that a new language file only needs the keys it translates"""
+        with tempfile.TemporaryDirectory() as directory:
+            for lang, messages in [('en', {'home': 'Home', 'cart': 'Cart'}), ('mr', {'home': 'मुख्यपृष्ठ'})]:
+                with open(os.path.join(directory, f'{lang}.json'), 'w', encoding='utf-8') as f:
+                    json.dump(messages, f, ensure_ascii=False)
+            catalogs = app_module.load_translations(directory)
+        self.assertEqual(catalogs['mr']['home'], 'मुख्यपृष्ठ')
+        self.assertEqual(catalogs['mr']['cart'], 'Cart', "Missing keys should fall back to English")
+        self.assertEqual(catalogs['mr']['no_such_key'], 'no_such_key')
+    
+    def test_template_helper_is_bound_to_session_language(self):
+        """Test that t() resolves against the catalog picked once per request"""
+        with app.test_request_context('/'):
+            from flask import session
+            session['language'] = 'hi'
+            context = app_module.inject_translations()
+            self.assertEqual(context['current_lang'], 'hi')
+            self.assertEqual(context['t']('home'), 'होम')
+            self.assertEqual(context['t']('unknown_key'), 'unknown_key')
+            session['language'] = 'xx'
+            self.assertEqual(app_module.inject_translations()['t']('home'), 'Home')
 
 def run_tests():
     """Run all tests and display results"""